@@ -0,0 +1,162 @@
+import contextlib
+import math
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+import requests
+
+
+class LimiterSlot:
+    """
+    A request holding a slot of an AdaptiveLimiter, the request tells how it went before releasing the slot.
+    """
+
+    def __init__(self, generation: int = 0):
+        self.generation = generation
+        # Whether the server showed signs of overload: a 429 or 5xx response, a timeout or a connection error
+        self.congested = False
+        # The size in bytes of the response, None if the request failed
+        self.size: Optional[int] = None
+        # The time in seconds to the first byte of the response, the time the slot is held if None. The time
+        # to download the body depends on its size, not on the load of the server, so it is left out if possible
+        self.latency: Optional[float] = None
+
+
+class AdaptiveLimiter:
+    def __init__(self, max_limit: int, initial_limit: Optional[int] = None, adaptive: bool = True,
+                 latency_factor: float = 2.0, decrease_factor: float = 0.5, latency_smoothing: float = 0.1):
+        """
+        This class is used to limit the number of requests in flight to a server, adapting the limit to what the
+        server and the network can take (additive increase, multiplicative decrease, as TCP does).
+        The limit starts low and grows by 1 for every successful request, doubling every round of requests, until
+        the first sign of overload. It is then halved, and grows by 1 every round of requests only. It does not
+        grow while the latency of the requests, their time to the first byte of the response, is more than
+        latency_factor times the lowest latency seen, as the requests then wait for each other. The signs of
+        overload of the requests in flight when the limit is halved are the same overload, so the limit is halved
+        once for them.
+        :param max_limit: The max number of requests in flight
+        :param initial_limit: The number of requests in flight at the start, by default 4, it doubles quickly
+        :param adaptive: Adapt the limit, otherwise it stays at max_limit and the requests are only measured
+        :param latency_factor: The latency over the lowest latency above which the limit does not grow
+        :param decrease_factor: The factor the limit is multiplied by on overload
+        :param latency_smoothing: The weight of the last request in the moving average of the latency
+        """
+        if max_limit < 1:
+            raise ValueError("Error: the number of downloads must be an integer greater than 0.")
+        self.max_limit = max_limit
+        self.adaptive = adaptive
+        if not adaptive:
+            initial_limit = max_limit
+        elif initial_limit is None:
+            initial_limit = 4
+        self.limit = float(min(max(initial_limit, 1), max_limit))
+        # The limit grows by 1 per request below the threshold, by 1 per round of requests above it
+        self.threshold = float(max_limit)
+        self.latency_factor = latency_factor
+        self.decrease_factor = decrease_factor
+        self.latency_smoothing = latency_smoothing
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        # Incremented every time the limit is decreased
+        self.generation = 0
+        self.latency: Optional[float] = None
+        self.lowest_latency: Optional[float] = None
+        self.requests = 0
+        self.congested = 0
+        self.decreases = 0
+        self.bytes = 0
+        self.peak_limit = self.limit
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        # The integral of the limit over the time of the requests, for its mean
+        self.limit_time = 0.0
+        self.last_change: Optional[float] = None
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[LimiterSlot]:
+        """
+        Hold a slot for a request, waiting for one to be free. A requests.RequestException raised by the request
+        is taken as a sign of overload.
+        """
+        slot = self.acquire()
+        start = time.perf_counter()
+        try:
+            yield slot
+        except requests.RequestException:
+            slot.congested = True
+            raise
+        finally:
+            self.release(slot, time.perf_counter() - start)
+
+    def acquire(self) -> LimiterSlot:
+        with self.condition:
+            while self.in_flight >= math.floor(self.limit):
+                self.condition.wait()
+            now = time.perf_counter()
+            if self.start_time is None:
+                self.start_time = self.last_change = now
+            self.in_flight += 1
+            return LimiterSlot(self.generation)
+
+    def release(self, slot: LimiterSlot, duration: float):
+        """
+        Free the slot of a request.
+        :param duration: The time in seconds the slot was held, the latency of the request if it has none
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.requests += 1
+            self.end_time = time.perf_counter()
+            if slot.size is not None:
+                self.bytes += slot.size
+            if slot.congested:
+                self.congested += 1
+                if self.adaptive and slot.generation == self.generation:
+                    self._set_limit(max(1.0, self.limit * self.decrease_factor))
+                    self.threshold = self.limit
+                    self.decreases += 1
+                    self.generation += 1
+            elif slot.size is not None:
+                self._update_latency(slot.latency if slot.latency is not None else duration)
+                if self.adaptive and self.limit < self.max_limit and self._latency_healthy():
+                    step = 1.0 if self.limit < self.threshold else 1.0 / self.limit
+                    self._set_limit(min(float(self.max_limit), self.limit + step))
+            self.condition.notify_all()
+
+    def _update_latency(self, latency: float):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.latency_smoothing * (latency - self.latency)
+        if self.lowest_latency is None or self.latency < self.lowest_latency:
+            self.lowest_latency = self.latency
+
+    def _latency_healthy(self) -> bool:
+        return self.latency <= self.latency_factor * self.lowest_latency
+
+    def _set_limit(self, limit: float):
+        now = time.perf_counter()
+        self.limit_time += self.limit * (now - self.last_change)
+        self.last_change = now
+        self.limit = limit
+        self.peak_limit = max(self.peak_limit, limit)
+
+    def stats(self) -> Dict[str, float]:
+        with self.condition:
+            elapsed = (self.end_time - self.start_time) if self.requests else 0.0
+            limit_time = self.limit_time + self.limit * ((self.end_time or 0.0) - (self.last_change or 0.0))
+            return {"requests": self.requests, "congested": self.congested, "decreases": self.decreases,
+                    "bytes": self.bytes, "seconds": elapsed, "limit": math.floor(self.limit),
+                    "peak_limit": math.floor(self.peak_limit),
+                    "mean_limit": limit_time / elapsed if elapsed > 0 else self.limit}
+
+
+def format_limiter_stats(stats: Dict[str, float]) -> str:
+    seconds = stats["seconds"]
+    rate = (f"{stats['bytes'] / (1 << 20) / seconds:.1f} MB/s, {stats['requests'] / seconds:.1f} requests/s"
+            if seconds > 0 else "-")
+    return (f"Downloads: {stats['requests']} requests, {stats['bytes'] / (1 << 20):.1f} MB in {seconds:.1f}s "
+            f"({rate}), {stats['limit']} in flight at the end (mean {stats['mean_limit']:.1f}, "
+            f"max {stats['peak_limit']}), {stats['congested']} overloaded requests, "
+            f"{stats['decreases']} slowdowns")
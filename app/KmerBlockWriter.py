@@ -0,0 +1,131 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from app.kmer_vector import KmerFeatures
+
+
+class KmerBlockWriter:
+    def __init__(self, output_path: str, non_kmer_columns: List[str], k: int, separator: str = ",",
+                 buffer_size: int = 1 << 20, features: KmerFeatures = None):
+        """
+        This class is used to write kmer counts to a directory of csv files, one block per kmer length.
+        The non-kmer columns are written to regions.csv, the counts of the kmers of length i to ki.csv,
+        so the kmers of length 1 to k can be read without reading the longer kmers.
+        The rows of every file are in the same order.
+        :param output_path: The path of the output directory, it should end with '.blocks'
+        :param non_kmer_columns: The columns that are not kmer counts,
+        for instance, the label column
+        :param k: The kmer length
+        :param separator: The cell separator to use in the csv files
+        :param buffer_size: The size in bytes of the write buffer of each file
+        :param features: The kmer columns, the standard kmers of length 1 to k if None
+        """
+        if not output_path.endswith(".blocks"):
+            raise ValueError("Output path should end with '.blocks'")
+        os.makedirs(output_path, exist_ok=True)
+        for file_name in os.listdir(output_path):
+            if file_name.startswith("k") and file_name.endswith(".csv"):
+                os.remove(os.path.join(output_path, file_name))
+        self.output_path = output_path
+        self.non_kmer_columns = non_kmer_columns
+        self.separator = separator
+        self.features = features if features is not None else KmerFeatures(k)
+        self.offsets = self.features.offsets
+        self.regions_file = open(os.path.join(output_path, "regions.csv"), "w", buffering=buffer_size)
+        self.regions_file.write(separator.join(non_kmer_columns) + "\n")
+        self.block_files = []
+        columns = self.features.columns()
+        for length in range(1, k + 1):
+            block_file = open(os.path.join(output_path, f"k{length}.csv"), "w", buffering=buffer_size)
+            block_columns = (next(columns) for _ in range(self.offsets[length] - self.offsets[length - 1]))
+            block_file.write(separator.join(block_columns) + "\n")
+            self.block_files.append(block_file)
+
+    def write_kmer_count(self, kmers: Dict[str, int], not_kmers: List[str]):
+        indices, counts = self.features.dict_to_sparse(kmers)
+        self.write_kmer_vector(indices, counts, not_kmers)
+
+    def write_kmer_vector(self, indices, counts, not_kmers: List[str]):
+        """
+        Write a row from the kmer counts computed by app.kmer_vector.kmer_count_sparse.
+        :param indices: The sorted column indexes of the kmers found
+        :param counts: The counts of the kmers found
+        :param not_kmers: The values of the non-kmer columns
+        """
+        if len(not_kmers) != len(self.non_kmer_columns):
+            raise ValueError(f"Expected {len(self.non_kmer_columns)} non-kmer columns, but got {len(not_kmers)}")
+        self.regions_file.write(self.separator.join(f"{non_kmer}" for non_kmer in not_kmers) + "\n")
+        bounds = np.searchsorted(indices, self.offsets).tolist()
+        for length, block_file in enumerate(self.block_files, start=1):
+            block_start = self.offsets[length - 1]
+            cells = []
+            expected_index = 0
+            for index, count in zip(indices[bounds[length - 1]:bounds[length]].tolist(),
+                                    counts[bounds[length - 1]:bounds[length]].tolist()):
+                cells.append(self.separator * (index - block_start - expected_index + 1))
+                cells.append(str(count))
+                expected_index = index - block_start + 1
+            # Fill the row with empty cells up to the last kmer column of the block
+            cells.append(self.separator * (self.offsets[length] - block_start - expected_index))
+            # Every cell has been prefixed by a separator, the first one is dropped
+            block_file.write("".join(cells)[len(self.separator):] + "\n")
+
+    def close(self):
+        """
+        This method has to be called at the very end of the writing process.
+        By calling this method, the buffered rows are flushed to the output files.
+        """
+        self.regions_file.close()
+        for block_file in self.block_files:
+            block_file.close()
+
+
+def read_block_non_kmer_columns(path: str, columns: List[str] = None) -> pd.DataFrame:
+    """
+    Read the non-kmer columns of a kmer blocks directory.
+    :param path: The path of the directory
+    :param columns: The columns to read, all the non-kmer columns if None
+    """
+    return pd.read_csv(os.path.join(path, "regions.csv"), usecols=columns, dtype=str)
+
+
+def read_kmer_blocks(path: str, rows: List[int], k: int, separator: str = ","):
+    """
+    Read the kmer counts of the given rows from the blocks of the kmers of length 1 to k.
+    The lines of the other rows are skipped without being split.
+    :param path: The path of the directory
+    :param rows: The sorted row numbers to read, 0 being the first row after the header
+    :param k: The max kmer length, blocks missing from the directory are ignored
+    :param separator: The cell separator of the csv files
+    :return: The kmer columns and the dense matrix of the counts of the rows
+    """
+    columns = []
+    blocks = []
+    for length in range(1, k + 1):
+        block_path = os.path.join(path, f"k{length}.csv")
+        if not os.path.exists(block_path):
+            break
+        with open(block_path, "r") as file:
+            header = file.readline().rstrip("\n")
+            # A block is empty when none of its kmers are in the vocabulary
+            block_columns = header.split(separator) if header != "" else []
+            block = np.zeros((len(rows), len(block_columns)), dtype=np.int64)
+            wanted = iter(enumerate(rows))
+            position, row = next(wanted, (None, None))
+            for line_number, line in enumerate(file):
+                if row is None:
+                    break
+                if line_number != row:
+                    continue
+                if block_columns:
+                    cells = line.rstrip("\n").split(separator)
+                    block[position] = [int(cell) if cell != '' else 0 for cell in cells]
+                position, row = next(wanted, (None, None))
+        columns.extend(block_columns)
+        blocks.append(block)
+    if not blocks:
+        return columns, np.zeros((len(rows), 0), dtype=np.int64)
+    return columns, np.concatenate(blocks, axis=1)
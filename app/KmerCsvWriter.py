@@ -1,81 +1,83 @@
 from typing import Dict, List
-import os
-import itertools
+
+from app.kmer_vector import KmerFeatures
 
 
 class KmerCsvWriter:
-    def __init__(self, output_path: str, non_kmer_columns: List[str], k: int, separator: str = ","):
+    def __init__(self, output_path: str, non_kmer_columns: List[str], k: int, separator: str = ",",
+                 buffer_size: int = 1 << 20, features: KmerFeatures = None):
         """
         This class is used to write kmer counts to a csv file.
-        By using this class, the kmer counts are written to the
-        csv file in the correct order, and the columns are added dynamically as new kmers are encountered.
+        The header with all the kmer columns of length 1 to k is written when the writer is created,
+        then every row is written padded to the full width, in a single pass through one buffered file handle.
         It is also possible to write non-kmer columns to the csv file, for instance, the label or the sequence columns.
         :param output_path: The path of the output csv
         :param non_kmer_columns: The columns that are not kmer counts,
         for instance, the label column
         :param separator: The cell separator to use in the csv
         :param k: The kmer length
+        :param buffer_size: The size in bytes of the write buffer
+        :param features: The kmer columns, the standard kmers of length 1 to k if None
         """
         self.output_path = output_path
-        self.kmer_column_indexes: Dict[str, int] = dict()
-        alphabet = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V',
-                    'W', 'X', 'Y']
-        last_index = 0
-        for i in range(1, k + 1):
-            for kmer in itertools.product(alphabet, repeat=i):
-                kmer = "".join(kmer)
-                self.kmer_column_indexes[kmer] = last_index
-                last_index += 1
+        self.features = features if features is not None else KmerFeatures(k)
+        self.columns_count = self.features.columns_count()
         self.separator = separator
         self.non_kmer_columns = non_kmer_columns
-        if os.path.exists("./rows.tmp"):
-            os.remove("./rows.tmp")
+        # UTF-8 without newline translation, so the byte offsets of the rows do not depend on the platform
+        self.file = open(output_path, "w", buffering=buffer_size, encoding="utf-8", newline="")
+        # Byte offset of the end of the file, rows are indexed by their offset in incremental mode
+        self.bytes_written = 0
+        self._write_row(separator.join(non_kmer_columns),
+                        "".join(f"{separator}{kmer}" for kmer in self.features.columns()))
 
     def write_kmer_count(self, kmers: Dict[str, int], not_kmers: List[str]):
+        indices, counts = self.features.dict_to_sparse(kmers)
+        self.write_kmer_vector(indices, counts, not_kmers)
+
+    def write_kmer_vector(self, indices, counts, not_kmers: List[str]):
+        """
+        Write a row from the kmer counts computed by app.kmer_vector.kmer_count_sparse.
+        :param indices: The sorted column indexes of the kmers found
+        :param counts: The counts of the kmers found
+        :param not_kmers: The values of the non-kmer columns
+        """
         if len(not_kmers) != len(self.non_kmer_columns):
             raise ValueError(f"Expected {len(self.non_kmer_columns)} non-kmer columns, but got {len(not_kmers)}")
-        with open("rows.tmp", "a") as file:
-            for non_kmer in not_kmers:
-                file.write(f"{non_kmer}")
-                if non_kmer != not_kmers[-1]:
-                    file.write(f"{self.separator}")
-            ordered_kmers = sorted(kmers, key=lambda x: self.kmer_column_indexes[x])
-            expected_index = 0
-            for kmer in ordered_kmers:
-                index = self.kmer_column_indexes[kmer]
-                while expected_index < index:
-                    file.write(f"{self.separator}")
-                    expected_index += 1
-                file.write(f"{self.separator}{kmers[kmer]}")
-                expected_index += 1
-            file.write("\n")
+        cells = []
+        expected_index = 0
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            cells.append(self.separator * (index - expected_index + 1))
+            cells.append(str(count))
+            expected_index = index + 1
+        # Fill the row with empty cells up to the last kmer column
+        cells.append(self.separator * (self.columns_count - expected_index))
+        self._write_row(self.row_prefix(not_kmers), "".join(cells))
+
+    def write_kmer_cells(self, cells: str, not_kmers: List[str]):
+        """
+        Write a row reusing the kmer cells of a row previously written with the same k and separator.
+        :param cells: The kmer part of the row, from the separator after the last non-kmer column to the end of the row,
+        excluding the line terminator
+        :param not_kmers: The values of the non-kmer columns
+        """
+        if len(not_kmers) != len(self.non_kmer_columns):
+            raise ValueError(f"Expected {len(self.non_kmer_columns)} non-kmer columns, but got {len(not_kmers)}")
+        self._write_row(self.row_prefix(not_kmers), cells)
+
+    def row_prefix(self, not_kmers: List[str]) -> str:
+        return self.separator.join(f"{non_kmer}" for non_kmer in not_kmers)
+
+    def _write_row(self, prefix: str, cells: str):
+        self.file.write(prefix)
+        self.file.write(cells)
+        self.file.write("\n")
+        # The kmer cells and the line terminator are ascii
+        self.bytes_written += len(prefix.encode("utf-8")) + len(cells) + 1
 
     def close(self):
         """
         This method has to be called at the very end of the writing process.
-        By calling this method, the temporary
-        files are used to write the final csv file.
+        By calling this method, the buffered rows are flushed to the output file.
         """
-        with open(self.output_path, "w") as file:
-            for non_kmer in self.non_kmer_columns:
-                file.write(f"{non_kmer}")
-                if non_kmer != self.non_kmer_columns[-1]:
-                    file.write(f"{self.separator}")
-            sorted_columns = sorted(self.kmer_column_indexes, key=lambda x: self.kmer_column_indexes[x])
-            for column in sorted_columns:
-                file.write(f"{self.separator}{column}")
-            file.write("\n")
-        with open("rows.tmp", "r") as rows_file:
-            for row in rows_file:
-                with open(self.output_path, "a") as file:
-                    stripped_row = row.strip()
-                    if stripped_row != "":
-                        file.write(stripped_row)
-                        cells_count = stripped_row.count(
-                            self.separator) + 1  # +1 because the last cell doesn't have a separator
-                        if cells_count != len(self.kmer_column_indexes) + len(self.non_kmer_columns):
-                            # Fill the row with empty cells if the number of cells is less than the expected
-                            for _ in range(len(self.kmer_column_indexes) - cells_count + len(self.non_kmer_columns)):
-                                file.write(f"{self.separator}")
-                        file.write("\n")
-        os.remove("rows.tmp")
+        self.file.close()
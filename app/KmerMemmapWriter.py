@@ -0,0 +1,108 @@
+import itertools
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from app.kmer_vector import KmerFeatures, kmer_column_length
+
+
+class KmerMemmapWriter:
+    def __init__(self, output_path: str, non_kmer_columns: List[str], k: int, max_count: int = None,
+                 buffer_size: int = 1 << 20, features: KmerFeatures = None):
+        """
+        This class is used to write kmer counts to a fixed-width binary matrix that can be read with numpy.memmap.
+        The output directory contains:
+        counts.bin, the row-major matrix of the counts, one row per region and one column per kmer;
+        regions.csv, the row index, the row number of every region together with its non-kmer columns;
+        columns.txt, the kmer columns, one per line;
+        meta.json, the shape and the dtype of the matrix.
+        :param output_path: The path of the output directory, it should end with '.kmat'
+        :param non_kmer_columns: The columns that are not kmer counts,
+        for instance, the label column
+        :param k: The kmer length
+        :param max_count: The max count to store, the counts are stored as uint16 if it fits, uint32 otherwise
+        :param buffer_size: The size in bytes of the write buffer
+        :param features: The kmer columns, the standard kmers of length 1 to k if None
+        """
+        if not output_path.endswith(".kmat"):
+            raise ValueError("Output path should end with '.kmat'")
+        os.makedirs(output_path, exist_ok=True)
+        self.output_path = output_path
+        self.non_kmer_columns = non_kmer_columns
+        fits_uint16 = max_count is not None and max_count <= np.iinfo(np.uint16).max
+        self.dtype = np.dtype(np.uint16 if fits_uint16 else np.uint32)
+        self.features = features if features is not None else KmerFeatures(k)
+        self.columns_count = self.features.columns_count()
+        self.row = np.zeros(self.columns_count, dtype=self.dtype)
+        self.last_indices = np.empty(0, dtype=np.int64)
+        self.rows_count = 0
+        with open(os.path.join(output_path, "columns.txt"), "w") as file:
+            file.writelines(f"{kmer}\n" for kmer in self.features.columns())
+        self.counts_file = open(os.path.join(output_path, "counts.bin"), "wb", buffering=buffer_size)
+        self.regions_file = open(os.path.join(output_path, "regions.csv"), "w", buffering=buffer_size)
+        self.regions_file.write(",".join(["row"] + non_kmer_columns) + "\n")
+
+    def write_kmer_count(self, kmers: Dict[str, int], not_kmers: List[str]):
+        indices, counts = self.features.dict_to_sparse(kmers)
+        self.write_kmer_vector(indices, counts, not_kmers)
+
+    def write_kmer_vector(self, indices, counts, not_kmers: List[str]):
+        """
+        Write a row from the kmer counts computed by app.kmer_vector.kmer_count_sparse.
+        :param indices: The sorted column indexes of the kmers found
+        :param counts: The counts of the kmers found
+        :param not_kmers: The values of the non-kmer columns
+        """
+        if len(not_kmers) != len(self.non_kmer_columns):
+            raise ValueError(f"Expected {len(self.non_kmer_columns)} non-kmer columns, but got {len(not_kmers)}")
+        if len(counts) > 0 and counts.max() > np.iinfo(self.dtype).max:
+            raise ValueError(f"Kmer count {counts.max()} does not fit in {self.dtype}")
+        # Only the cells set by the previous row have to be cleared
+        self.row[self.last_indices] = 0
+        self.row[indices] = counts
+        self.last_indices = indices
+        self.counts_file.write(self.row.tobytes())
+        self.regions_file.write(",".join([str(self.rows_count)] + [f"{non_kmer}" for non_kmer in not_kmers]) + "\n")
+        self.rows_count += 1
+
+    def close(self):
+        """
+        This method has to be called at the very end of the writing process.
+        By calling this method, the files are flushed and the shape of the matrix is written.
+        """
+        self.counts_file.close()
+        self.regions_file.close()
+        with open(os.path.join(self.output_path, "meta.json"), "w") as file:
+            json.dump({"rows": self.rows_count, "columns": self.columns_count, "dtype": self.dtype.name}, file)
+
+
+def read_memmap_non_kmer_columns(path: str, columns: List[str] = None) -> pd.DataFrame:
+    """
+    Read the row index of a kmer matrix directory.
+    :param path: The path of the directory
+    :param columns: The columns to read, all the columns if None
+    """
+    return pd.read_csv(os.path.join(path, "regions.csv"), usecols=columns, dtype=str)
+
+
+def read_memmap_kmer_rows(path: str, rows: List[int], k: int):
+    """
+    Gather the kmer counts of the given rows, with the kmer columns of length 1 to k.
+    The matrix is memory-mapped, so only the pages of the requested rows are read.
+    :param path: The path of the directory
+    :param rows: The row numbers to read
+    :param k: The max kmer length
+    :return: The kmer columns and the dense matrix of the counts of the rows
+    """
+    with open(os.path.join(path, "meta.json"), "r") as file:
+        meta = json.load(file)
+    with open(os.path.join(path, "columns.txt"), "r") as file:
+        columns = list(itertools.takewhile(lambda c: kmer_column_length(c) <= k, (line.rstrip("\n") for line in file)))
+    if meta["rows"] == 0:
+        return columns, np.zeros((len(rows), len(columns)), dtype=np.int64)
+    counts = np.memmap(os.path.join(path, "counts.bin"), dtype=meta["dtype"], mode="r",
+                       shape=(meta["rows"], meta["columns"]))
+    return columns, counts[rows, :len(columns)].astype(np.int64)
@@ -0,0 +1,94 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from app.kmer_vector import KmerFeatures
+
+
+class KmerSparseWriter:
+    def __init__(self, output_path: str, non_kmer_columns: List[str], k: int, features: KmerFeatures = None):
+        """
+        This class is used to write kmer counts to a compressed sparse matrix container (.npz).
+        The counts are stored in CSR format (data, indices and indptr arrays), together with the
+        non-kmer columns, one array per column, and the kmer vocabulary.
+        :param output_path: The path of the output .npz file
+        :param non_kmer_columns: The columns that are not kmer counts,
+        for instance, the label column
+        :param k: The kmer length
+        :param features: The kmer columns, the standard kmers of length 1 to k if None
+        """
+        if not output_path.endswith(".npz"):
+            raise ValueError("Output path should end with '.npz'")
+        self.output_path = output_path
+        self.non_kmer_columns = non_kmer_columns
+        self.features = features if features is not None else KmerFeatures(k)
+        self.columns = list(self.features.columns())
+        self.non_kmer_values: List[List[str]] = [[] for _ in non_kmer_columns]
+        self.data = []
+        self.indices = []
+        self.indptr = [0]
+
+    def write_kmer_count(self, kmers: Dict[str, int], not_kmers: List[str]):
+        indices, counts = self.features.dict_to_sparse(kmers)
+        self.write_kmer_vector(indices, counts, not_kmers)
+
+    def write_kmer_vector(self, indices, counts, not_kmers: List[str]):
+        """
+        Write a row from the kmer counts computed by app.kmer_vector.kmer_count_sparse.
+        :param indices: The sorted column indexes of the kmers found
+        :param counts: The counts of the kmers found
+        :param not_kmers: The values of the non-kmer columns
+        """
+        if len(not_kmers) != len(self.non_kmer_columns):
+            raise ValueError(f"Expected {len(self.non_kmer_columns)} non-kmer columns, but got {len(not_kmers)}")
+        for values, non_kmer in zip(self.non_kmer_values, not_kmers):
+            values.append(f"{non_kmer}")
+        self.indices.append(np.asarray(indices, dtype=np.int32))
+        self.data.append(np.asarray(counts, dtype=np.uint32))
+        self.indptr.append(self.indptr[-1] + len(indices))
+
+    def close(self):
+        """
+        This method has to be called at the very end of the writing process.
+        By calling this method, the matrix is written to the output file.
+        """
+        arrays = {
+            "data": np.concatenate(self.data) if self.data else np.empty(0, dtype=np.uint32),
+            "indices": np.concatenate(self.indices) if self.indices else np.empty(0, dtype=np.int32),
+            "indptr": np.array(self.indptr, dtype=np.int64),
+            "columns": np.array(self.columns),
+            "non_kmer_columns": np.array(self.non_kmer_columns),
+        }
+        for column, values in zip(self.non_kmer_columns, self.non_kmer_values):
+            arrays["column_" + column] = np.array(values, dtype=str)
+        np.savez_compressed(self.output_path, **arrays)
+
+
+def read_sparse_non_kmer_columns(path: str) -> pd.DataFrame:
+    """
+    Read only the non-kmer columns of a sparse kmer matrix, without loading the counts.
+    :param path: The path of the .npz file
+    :return: DataFrame with one row per matrix row
+    """
+    with np.load(path) as npz:
+        return _non_kmer_frame(npz)
+
+
+def read_sparse_kmer_matrix(path: str):
+    """
+    Read a sparse kmer matrix written by KmerSparseWriter.
+    :param path: The path of the .npz file
+    :return: The counts as a csr_matrix, the kmer columns and a DataFrame with the non-kmer columns
+    """
+    with np.load(path) as npz:
+        columns = npz["columns"].tolist()
+        indptr = npz["indptr"]
+        matrix = csr_matrix((npz["data"], npz["indices"], indptr), shape=(len(indptr) - 1, len(columns)))
+        non_kmers = _non_kmer_frame(npz)
+    return matrix, columns, non_kmers
+
+
+def _non_kmer_frame(npz) -> pd.DataFrame:
+    return pd.DataFrame({column: npz["column_" + column] for column in npz["non_kmer_columns"].tolist()})
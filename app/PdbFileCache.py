@@ -0,0 +1,147 @@
+import gzip
+import os
+import tempfile
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+
+class PdbFileCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 2 << 30, missing_ttl: float = 7 * 24 * 3600):
+        """
+        This class is used to keep the downloaded PDB and mmCIF files on disk, so that they are downloaded only once.
+        Every file is stored gzip-compressed under its (pdb_id, file_type) key. A file missing from the PDB is
+        stored as an empty marker, so that it is not requested again either until the marker is older than
+        missing_ttl, as the structure may have been released since.
+        Files are written to a temporary file then renamed, so threads and processes sharing the cache
+        never read a partial file. When the cache grows over max_bytes, the least recently used files are removed.
+        :param cache_dir: The cache directory, it is created if needed
+        :param max_bytes: The max size in bytes of the cache
+        :param missing_ttl: The time in seconds a file missing from the PDB is not requested again for
+        """
+        if max_bytes < 1:
+            raise ValueError("Error: cache size must be an integer greater than 0.")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.missing_ttl = missing_ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    def get(self, pdb_id: str, file_type: str) -> Tuple[bool, Optional[str]]:
+        """
+        Read a file from the cache.
+        :return: (found, text), text is None if the file is known to be missing from the PDB
+        """
+        path = self._path(pdb_id, file_type)
+        try:
+            if os.path.exists(path + ".missing"):
+                # The modification time of a marker is the time it was stored, it is not updated on access
+                if time.time() - os.path.getmtime(path + ".missing") >= self.missing_ttl:
+                    raise FileNotFoundError(path + ".missing")
+                text = None
+            else:
+                if os.path.getsize(path) == 0:
+                    # Even an empty text is stored with a gzip header, the file has been truncated
+                    raise EOFError(path)
+                with gzip.open(path, "rt") as file:
+                    text = file.read()
+                # The access time is tracked with the modification time, which does not depend on the mount options
+                os.utime(path)
+        except (FileNotFoundError, EOFError, OSError, zlib.error):
+            with self.lock:
+                self.misses += 1
+            return False, None
+        with self.lock:
+            self.hits += 1
+        return True, text
+
+    def put(self, pdb_id: str, file_type: str, text: Optional[str]):
+        """
+        Store a file in the cache.
+        :param text: The content of the file, None if the file is missing from the PDB
+        """
+        path = self._path(pdb_id, file_type)
+        if text is None:
+            path += ".missing"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                if text is not None:
+                    file.write(gzip.compress(text.encode(), compresslevel=6))
+            size = os.path.getsize(temporary_path)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temporary_path, path)
+            if text is not None and os.path.exists(path + ".missing"):
+                # The file has been added to the PDB since it was marked as missing
+                os.remove(path + ".missing")
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        with self.lock:
+            self.stores += 1
+            self.total_bytes += size - previous_size
+            over = self.total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used files until the cache is 90% of max_bytes.
+        """
+        with self.lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            total = sum(size for _, _, size in entries)
+            for path, _, size in entries:
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+            self.total_bytes = total
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions,
+                    "bytes": self.total_bytes}
+
+    def _path(self, pdb_id: str, file_type: str) -> str:
+        pdb_id = pdb_id.lower()
+        # Files are spread in sub-directories named after the middle characters of the id, as in the PDB archive
+        return os.path.join(self.cache_dir, pdb_id[1:3], f"{pdb_id}.{file_type}.gz")
+
+    def _entries(self):
+        """
+        Every cached file as (path, last access time, size).
+        """
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+
+def default_cache_dir() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "proteins-classification", "pdb")
+
+
+def format_stats(stats: Dict[str, int]) -> str:
+    requests_count = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / requests_count if requests_count else 0
+    return (f"PDB cache: {stats['hits']} hits, {stats['misses']} misses ({hit_rate:.1%} hit rate), "
+            f"{stats['stores']} stored, {stats['evictions']} evicted, {stats['bytes'] / (1 << 20):.1f} MB")
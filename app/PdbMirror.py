@@ -0,0 +1,84 @@
+import gzip
+import os
+import threading
+from typing import Dict, Optional
+
+# The directories of the divided layout of the wwPDB archive, relative to the mirror directory
+DIVIDED_DIRS = {'pdb': "pdb", 'cif': "mmCIF"}
+DIVIDED_PREFIXES = [os.path.join("data", "structures", "divided"), os.path.join("structures", "divided"),
+                    "divided", ""]
+
+
+class PdbMirror:
+    def __init__(self, mirror_dir: str, http_fallback: bool = True):
+        """
+        This class is used to read the PDB and mmCIF files from a local mirror of the PDB archive instead of
+        downloading them. The mirror has the divided layout of the archive, as rsync'd from the wwPDB:
+        pdb/<middle characters of the id>/pdb<id>.ent.gz and mmCIF/<middle characters of the id>/<id>.cif.gz,
+        under the mirror directory or its data/structures/divided directory. A mirror may have only one of the
+        formats, the other one is then downloaded.
+        :param mirror_dir: The mirror directory
+        :param http_fallback: Download the files missing from the mirror, otherwise they are missing from the PDB
+        """
+        if not os.path.isdir(mirror_dir):
+            raise ValueError(f"Error: the PDB mirror {mirror_dir} is not a directory.")
+        self.mirror_dir = mirror_dir
+        self.http_fallback = http_fallback
+        self.format_dirs: Dict[str, str] = {}
+        for file_type, name in DIVIDED_DIRS.items():
+            for prefix in DIVIDED_PREFIXES:
+                path = os.path.join(mirror_dir, prefix, name)
+                if os.path.isdir(path):
+                    self.format_dirs[file_type] = path
+                    break
+        if not self.format_dirs:
+            raise ValueError(f"Error: no divided pdb or mmCIF directory in the PDB mirror {mirror_dir}.")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def has_format(self, file_type: str) -> bool:
+        return file_type in self.format_dirs
+
+    def path(self, pdb_id: str, file_type: str) -> Optional[str]:
+        """
+        The path of a file in the mirror, compressed or not.
+        :return: The path, None if the file is not in the mirror
+        """
+        directory = self.format_dirs.get(file_type)
+        if directory is None:
+            return None
+        pdb_id = pdb_id.lower()
+        name = f"pdb{pdb_id}.ent" if file_type == 'pdb' else f"{pdb_id}.cif"
+        for path in [os.path.join(directory, pdb_id[1:3], name + ".gz"), os.path.join(directory, pdb_id[1:3], name)]:
+            if os.path.exists(path):
+                return path
+        return None
+
+    def read(self, pdb_id: str, file_type: str) -> Optional[str]:
+        """
+        Read a file from the mirror, decompressed while it is read.
+        :return: The content of the file, None if the file is not in the mirror
+        """
+        path = self.path(pdb_id, file_type)
+        if path is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        if path.endswith(".gz"):
+            with gzip.open(path, "rt") as file:
+                text = file.read()
+        else:
+            with open(path, "r") as file:
+                text = file.read()
+        with self.lock:
+            self.hits += 1
+        return text
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def format_mirror_stats(stats: Dict[str, int]) -> str:
+    return f"PDB mirror: {stats['hits']} files read, {stats['misses']} not in the mirror"
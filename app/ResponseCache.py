@@ -0,0 +1,75 @@
+import contextlib
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Iterator, Optional, TextIO
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str, ttl: float = 3600):
+        """
+        This class is used to keep the responses of the RepeatsDB API on disk for a while, so that running the same
+        query again does not download it again. Every response is stored gzip-compressed under the sha1 of its
+        query, and is used until it is older than ttl. Responses are written to a temporary file then renamed,
+        so they can be written while being downloaded without ever being read partially.
+        :param cache_dir: The cache directory, it is created if needed
+        :param ttl: The time in seconds a response is used for
+        """
+        if ttl <= 0:
+            raise ValueError("Error: the time to live of the responses must be greater than 0.")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def open(self, key: str) -> Optional[TextIO]:
+        """
+        Open a cached response.
+        :param key: The normalized query
+        :return: The response as a text file, None if it is not cached or older than the ttl
+        """
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) < self.ttl:
+                file = gzip.open(path, "rt", encoding="utf-8")
+                with self.lock:
+                    self.hits += 1
+                return file
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self.misses += 1
+        return None
+
+    @contextlib.contextmanager
+    def store(self, key: str) -> Iterator[TextIO]:
+        """
+        Store a response, written to the yielded text file. The response is kept only if the block ends without error.
+        :param key: The normalized query
+        """
+        path = self._path(key)
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        os.close(descriptor)
+        try:
+            with gzip.open(temporary_path, "wt", encoding="utf-8", compresslevel=6) as file:
+                yield file
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".json.gz")
+
+
+def default_response_cache_dir() -> str:
+    return os.path.join(os.path.expanduser("~"), ".cache", "proteins-classification", "repeatsdb")
@@ -1,26 +1,43 @@
-import itertools
+import collections
 import os
+import shutil
 import sqlite3
+import tempfile
 from typing import List
 
+from app.kmer_vector import KmerFeatures
+
 
 class SQLKmerCsvWriter:
-    def __init__(self, output_path: str, non_kmer_columns: List[str], k: int, separator: str = ","):
+    def __init__(self, output_path: str, non_kmer_columns: List[str], k: int, separator: str = ",",
+                 features: KmerFeatures = None, scratch_dir: str = None):
         """
         :param output_path: str
         :param non_kmer_columns: List[str]
         :param k: int
         :param separator: str
+        :param features: The kmer columns, the standard kmers of length 1 to k if None
+        :param scratch_dir: The directory in which the scratch directory of the kmer index is created,
+        the system temporary directory if None
         """
         if not output_path.endswith(".csv"):
             raise ValueError("Output path should end with '.csv'")
         self.output_path = output_path
-        alphabet = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V',
-                    'W', 'X', 'Y']
+        self.features = features if features is not None else KmerFeatures(k)
         self.last_index = 0
-        if os.path.exists("temp.db"):
-            os.remove("temp.db")
-        self.conn = sqlite3.connect('temp.db')
+        # Every writer has its own kmer index, so that writers running at the same time never share it
+        self.scratch = tempfile.mkdtemp(prefix=".kmer-scratch-", dir=scratch_dir)
+        self.db_path = os.path.join(self.scratch, "kmers.db")
+        self.conn = sqlite3.connect(self.db_path)
+        try:
+            self._write_header(output_path, non_kmer_columns, separator)
+        except BaseException:
+            self.close()
+            raise
+        self.separator = separator
+        self.non_kmer_columns = non_kmer_columns
+
+    def _write_header(self, output_path: str, non_kmer_columns: List[str], separator: str):
         self.cursor = self.conn.cursor()
         self.cursor.execute("CREATE TABLE kmers (kmer TEXT PRIMARY KEY, kmer_index INTEGER)")
         with open(output_path, "w") as file:
@@ -28,25 +45,27 @@ class SQLKmerCsvWriter:
                 file.write(f"{non_kmer}")
                 if non_kmer != non_kmer_columns[-1]:
                     file.write(f"{separator}")
-            for i in range(1, k + 1):
-                for kmer in itertools.product(alphabet, repeat=i):
-                    kmer = "".join(kmer)
-                    self.cursor.execute("INSERT INTO kmers VALUES (?, ?)", (kmer, self.last_index))
-                    file.write(f"{separator}{kmer}")
-                    self.last_index += 1
-                self.conn.commit()
+            for kmer in self.features.columns():
+                self.cursor.execute("INSERT INTO kmers VALUES (?, ?)", (kmer, self.last_index))
+                file.write(f"{separator}{kmer}")
+                self.last_index += 1
+            self.conn.commit()
             file.write("\n")
-        self.separator = separator
-        self.non_kmer_columns = non_kmer_columns
 
     def close(self):
         self.conn.close()
-        if os.path.exists("temp.db"):
-            os.remove("temp.db")
+        shutil.rmtree(self.scratch, ignore_errors=True)
 
     def write_kmer_count(self, kmers: dict, not_kmers: List[str]):
         if len(not_kmers) != len(self.non_kmer_columns):
             raise ValueError(f"Expected {len(self.non_kmer_columns)} non-kmer columns, but got {len(not_kmers)}")
+        # Kmers sharing a column, in a reduced alphabet or a hashed feature space, are summed
+        columns = collections.Counter()
+        for kmer, count in kmers.items():
+            column = self.features.kmer_column(kmer)
+            if column is not None:
+                columns[column] += count
+        kmers = columns
         with open(self.output_path, "a") as file:
             for non_kmer in not_kmers:
                 file.write(f"{non_kmer}")
@@ -73,7 +92,7 @@ def main():
     w = SQLKmerCsvWriter("output.csv", ["region_id", "class_topology_fold_clan", "sequence"], 1)
     w.write_kmer_count({"A": 1, "C": 2, "E": 3, "X": 4}, ["id", "class", "seq"])
     w.write_kmer_count({"K": 1, "C": 2, "I": 2, "Y": 9}, ["id", "class", "seq"])
-    conn = sqlite3.connect('temp.db')
+    conn = sqlite3.connect(w.db_path)
     cursor = conn.cursor()
     rows = cursor.execute("SELECT * FROM kmers").fetchall()
     print("Length of rows:", len(rows))
@@ -0,0 +1,136 @@
+import itertools
+import os
+import sqlite3
+from contextlib import closing
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from app.kmer_vector import KmerFeatures, kmer_column_length
+
+
+class SQLKmerStore:
+    def __init__(self, output_path: str, non_kmer_columns: List[str], k: int, batch_size: int = 10000,
+                 features: KmerFeatures = None):
+        """
+        This class is used to write kmer counts to an indexed SQLite database.
+        Every row gets a row_id in the regions table, together with its non-kmer columns, and its kmer counts
+        are stored in the kmer_counts table as (row_id, kmer_code, count), where kmer_code is the kmer column index.
+        Rows are inserted in bulk, committing one transaction every batch_size rows.
+        The kmer vectors of a list of regions can then be fetched with fetch_kmer_vectors.
+        :param output_path: The path of the output database, it should end with '.db'
+        :param non_kmer_columns: The columns that are not kmer counts,
+        for instance, the label column
+        :param k: The kmer length
+        :param batch_size: The number of rows inserted in a single transaction
+        :param features: The kmer columns, the standard kmers of length 1 to k if None
+        """
+        if not output_path.endswith(".db"):
+            raise ValueError("Output path should end with '.db'")
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(output_path + suffix):
+                os.remove(output_path + suffix)
+        self.output_path = output_path
+        self.non_kmer_columns = non_kmer_columns
+        self.batch_size = batch_size
+        self.features = features if features is not None else KmerFeatures(k)
+        self.conn = sqlite3.connect(output_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE kmers (kmer_code INTEGER PRIMARY KEY, kmer TEXT)")
+        self.conn.execute("CREATE TABLE regions (row_id INTEGER PRIMARY KEY, "
+                          + ", ".join(f'"{column}" TEXT' for column in non_kmer_columns) + ")")
+        self.conn.execute("CREATE TABLE kmer_counts (row_id INTEGER, kmer_code INTEGER, count INTEGER, "
+                          "PRIMARY KEY (row_id, kmer_code)) WITHOUT ROWID")
+        self.conn.executemany("INSERT INTO kmers VALUES (?, ?)", enumerate(self.features.columns()))
+        self.conn.commit()
+        self.insert_region = f"INSERT INTO regions VALUES (?, {', '.join('?' for _ in non_kmer_columns)})"
+        self.next_row_id = 0
+        self.regions = []
+        self.counts = []
+
+    def write_kmer_count(self, kmers: Dict[str, int], not_kmers: List[str]):
+        indices, counts = self.features.dict_to_sparse(kmers)
+        self.write_kmer_vector(indices, counts, not_kmers)
+
+    def write_kmer_vector(self, indices, counts, not_kmers: List[str]):
+        """
+        Write a row from the kmer counts computed by app.kmer_vector.kmer_count_sparse.
+        :param indices: The sorted column indexes of the kmers found
+        :param counts: The counts of the kmers found
+        :param not_kmers: The values of the non-kmer columns
+        """
+        if len(not_kmers) != len(self.non_kmer_columns):
+            raise ValueError(f"Expected {len(self.non_kmer_columns)} non-kmer columns, but got {len(not_kmers)}")
+        row_id = self.next_row_id
+        self.next_row_id += 1
+        self.regions.append((row_id, *(f"{non_kmer}" for non_kmer in not_kmers)))
+        self.counts.extend((row_id, index, count) for index, count in zip(indices.tolist(), counts.tolist()))
+        if len(self.regions) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.conn:
+            self.conn.executemany(self.insert_region, self.regions)
+            self.conn.executemany("INSERT INTO kmer_counts VALUES (?, ?, ?)", self.counts)
+        self.regions = []
+        self.counts = []
+
+    def close(self):
+        """
+        This method has to be called at the very end of the writing process.
+        By calling this method, the pending rows are inserted and the region_id index is created.
+        """
+        self.flush()
+        with self.conn:
+            self.conn.execute("CREATE INDEX regions_region_id ON regions (region_id)")
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.close()
+
+
+def read_sql_non_kmer_columns(path: str, columns: List[str] = None) -> pd.DataFrame:
+    """
+    Read the non-kmer columns of a kmer store, ordered by row, without reading the counts.
+    :param path: The path of the database
+    :param columns: The columns to read, all the non-kmer columns if None
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Error: {path} does not exist.")
+    with closing(sqlite3.connect(path)) as conn:
+        selected = "*" if columns is None else ", ".join(f'"{column}"' for column in columns)
+        df = pd.read_sql_query(f"SELECT {selected} FROM regions ORDER BY row_id", conn)
+    return df.drop(columns=["row_id"], errors="ignore")
+
+
+def fetch_kmer_vectors(path: str, region_ids: List[str], k: int = None):
+    """
+    Fetch the kmer vectors of the given regions from a kmer store.
+    When a region_id has more than one row, only the first one is returned.
+    :param path: The path of the database
+    :param region_ids: The region ids to fetch
+    :param k: Fetch only the kmer columns of length 1 to k, all of them if None
+    :return: The kmer columns, a DataFrame with the non-kmer columns of the rows found, ordered by row,
+    and the dense matrix of their kmer counts
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Error: {path} does not exist.")
+    with closing(sqlite3.connect(path)) as conn:
+        columns = [kmer for kmer, in conn.execute("SELECT kmer FROM kmers ORDER BY kmer_code")]
+        if k is not None:
+            columns = list(itertools.takewhile(lambda c: kmer_column_length(c) <= k, columns))
+        conn.execute("CREATE TEMP TABLE wanted (region_id TEXT)")
+        conn.executemany("INSERT INTO wanted VALUES (?)", ((region_id,) for region_id in set(region_ids)))
+        conn.execute("CREATE TEMP TABLE selected AS SELECT MIN(row_id) AS row_id FROM regions "
+                     "WHERE region_id IN (SELECT region_id FROM wanted) GROUP BY region_id")
+        non_kmers = pd.read_sql_query("SELECT * FROM regions WHERE row_id IN (SELECT row_id FROM selected) "
+                                      "ORDER BY row_id", conn)
+        counts = conn.execute("SELECT row_id, kmer_code, count FROM kmer_counts "
+                              "WHERE row_id IN (SELECT row_id FROM selected) AND kmer_code < ?",
+                              (len(columns),)).fetchall()
+    matrix = np.zeros((len(non_kmers), len(columns)), dtype=np.int64)
+    if counts:
+        counts = np.array(counts, dtype=np.int64)
+        rows = np.searchsorted(non_kmers["row_id"].to_numpy(dtype=np.int64), counts[:, 0])
+        matrix[rows, counts[:, 1]] = counts[:, 2]
+    return columns, non_kmers.drop(columns=["row_id"]), matrix
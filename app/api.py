@@ -1,12 +1,190 @@
+import contextlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.AdaptiveLimiter import AdaptiveLimiter, LimiterSlot
+from app.PdbFileCache import PdbFileCache
+from app.PdbMirror import PdbMirror
+from app.ResponseCache import ResponseCache
+from app.json_stream import iter_json_array, json_columns, read_chunks, tee_chunks
 
 REPEATSDB_URL = "https://repeatsdb.bio.unipd.it/api//search"
 PDB_URL = "https://files.rcsb.org/download/"
 
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 60)
+
+# Cache of the PDB and mmCIF downloads, disabled while None
+pdb_cache: PdbFileCache = None
+# Cache of the RepeatsDB search responses, disabled while None
+repeatsdb_cache: ResponseCache = None
+# Local mirror of the PDB archive read before downloading, disabled while None
+pdb_mirror: PdbMirror = None
+# Limit of the PDB downloads in flight, unlimited while None
+download_limiter: AdaptiveLimiter = None
+
+_session: requests.Session = None
+_session_lock = threading.Lock()
+_timeout = DEFAULT_TIMEOUT
+
+
+def configure_pdb_cache(cache_dir, max_bytes: int = 2 << 30, missing_ttl: float = 7 * 24 * 3600):
+    """
+    Set the cache used by pdb_get_request.
+    :param cache_dir: The cache directory, None to disable the cache
+    :param max_bytes: The max size in bytes of the cache
+    :param missing_ttl: The time in seconds a file missing from the PDB is not requested again for
+    """
+    global pdb_cache
+    pdb_cache = PdbFileCache(cache_dir, max_bytes, missing_ttl) if cache_dir is not None else None
+
+
+def configure_repeatsdb_cache(cache_dir, ttl: float = 3600):
+    """
+    Set the cache used by repeatsdb_get.
+    :param cache_dir: The cache directory, None to disable the cache
+    :param ttl: The time in seconds a response is used for
+    """
+    global repeatsdb_cache
+    repeatsdb_cache = ResponseCache(cache_dir, ttl) if cache_dir is not None else None
+
+
+def configure_pdb_mirror(mirror_dir, http_fallback: bool = True):
+    """
+    Set the mirror used by structure_get.
+    :param mirror_dir: The mirror directory, None to download every file
+    :param http_fallback: Download the files missing from the mirror
+    """
+    global pdb_mirror
+    pdb_mirror = PdbMirror(mirror_dir, http_fallback) if mirror_dir is not None else None
+
+
+def configure_download_limiter(max_in_flight, adaptive: bool = True):
+    """
+    Set the limiter of the downloads in flight used by pdb_get_request.
+    :param max_in_flight: The max number of downloads in flight, None for no limit
+    :param adaptive: Adapt the number of downloads in flight to the server below max_in_flight, otherwise it is
+    max_in_flight
+    """
+    global download_limiter
+    download_limiter = AdaptiveLimiter(max_in_flight, adaptive=adaptive) if max_in_flight is not None else None
+
+
+def configure_http_session(pool_size: int = 10, retries: int = 3, backoff_factor: float = 0.5,
+                           backoff_jitter: float = 0.5, timeout=DEFAULT_TIMEOUT):
+    """
+    Set the HTTP session shared by all the requests of this module.
+    The connections are kept alive in a pool per host, so the threads of a query reuse them instead of opening
+    a new TLS connection for every download. Connection errors, 429 and 5xx responses are retried with an
+    exponential backoff, randomized so that the threads do not retry all at once.
+    :param pool_size: The max number of connections kept per host, it should be the number of threads
+    :param retries: The max number of retries of a request
+    :param backoff_factor: The base of the backoff in seconds, the i-th retry waits backoff_factor * 2^(i - 1)
+    :param backoff_jitter: The max random time in seconds added to every backoff
+    :param timeout: The (connect, read) timeouts in seconds
+    """
+    global _session, _timeout
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        backoff_jitter=backoff_jitter,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    # pool_block keeps the number of connections to a host at pool_size, the other threads wait for a free one
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    with _session_lock:
+        previous = _session
+        _session = session
+        _timeout = timeout
+    if previous is not None:
+        previous.close()
 
-def repeatsdb_get(query):
-    r = requests.get(REPEATSDB_URL, params=query)
-    return r.json()
+
+def get_http_session() -> requests.Session:
+    with _session_lock:
+        session = _session
+    if session is None:
+        configure_http_session()
+        return get_http_session()
+    return session
+
+
+def normalize_query(query: str) -> str:
+    """
+    The query with its parameters sorted, the key of its response in the cache.
+    """
+    return urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+
+
+def repeatsdb_get(query) -> Dict[str, List[Any]]:
+    """
+    Search the RepeatsDB API.
+    The response is decoded while it is downloaded, an entry at a time, and returned as columns, so neither the
+    text of the response nor the list of its entries are kept. When the cache is set, the response is read from it
+    if it has been downloaded within the ttl, otherwise it is stored while downloaded.
+    :return: The values of every field of the entries, missing values are NaN
+    """
+    cache = repeatsdb_cache
+    key = normalize_query(query)
+    if cache is not None:
+        file = cache.open(key)
+        if file is not None:
+            with file:
+                return json_columns(iter_json_array(read_chunks(file)))
+    r = get_http_session().get(REPEATSDB_URL, params=query, timeout=_timeout, stream=True)
+    with r:
+        r.raise_for_status()
+        if r.encoding is None:
+            # JSON is UTF-8 unless told otherwise
+            r.encoding = "utf-8"
+        chunks = r.iter_content(chunk_size=1 << 16, decode_unicode=True)
+        if cache is None:
+            return json_columns(iter_json_array(chunks))
+        with cache.store(key) as file:
+            return json_columns(iter_json_array(tee_chunks(chunks, file)))
+
+
+def structure_get(pdb_id) -> Optional[Tuple[str, str]]:
+    """
+    Get the structure of a protein in PDB format, or in mmCIF format when there is no PDB file.
+    When the mirror is set, the formats it has are read from it and the others are downloaded. A file missing
+    from a format of the mirror is taken as missing from the PDB, unless no format of the structure is found,
+    then the mirror is taken as out of date and the files are downloaded, if the mirror allows it.
+    :return: The file type, 'pdb' or 'cif', and the content of the file, None if the structure is in neither format
+    """
+    mirror = pdb_mirror
+    if mirror is None:
+        return first_structure(pdb_id, ['pdb', 'cif'], pdb_get_request)
+
+    def mirror_get(pdb_id, file_type):
+        if mirror.has_format(file_type):
+            return mirror.read(pdb_id, file_type)
+        return pdb_get_request(pdb_id, file_type) if mirror.http_fallback else None
+
+    structure = first_structure(pdb_id, ['pdb', 'cif'], mirror_get)
+    if structure is not None or not mirror.http_fallback:
+        return structure
+    return first_structure(pdb_id, [file_type for file_type in ['pdb', 'cif'] if mirror.has_format(file_type)],
+                           pdb_get_request)
+
+
+def first_structure(pdb_id, file_types, get) -> Optional[Tuple[str, str]]:
+    for file_type in file_types:
+        text = get(pdb_id, file_type)
+        if text is not None:
+            return file_type, text
+    return None
 
 
 def pdb_get(pdb_id):
@@ -18,7 +196,27 @@ def mmCIF_get(pdb_id):
 
 
 def pdb_get_request(pdb_id, file_type='pdb'):
-    r = requests.get(PDB_URL + pdb_id + "." + file_type)
-    if r.status_code == 200:
-        return r.text
-    return None
+    """
+    Download a PDB or mmCIF file.
+    :return: The content of the file, None if the file does not exist
+    :raise requests.RequestException: If the file could not be downloaded, after the retries
+    """
+    cache = pdb_cache
+    if cache is not None:
+        found, text = cache.get(pdb_id, file_type)
+        if found:
+            return text
+    limiter = download_limiter
+    with limiter.slot() if limiter is not None else contextlib.nullcontext(LimiterSlot()) as slot:
+        r = get_http_session().get(PDB_URL + pdb_id + "." + file_type, timeout=_timeout)
+        # The retried requests got a 429 or 5xx response or an error before this one
+        slot.congested = r.status_code not in [200, 404] or bool(r.raw.retries and r.raw.retries.history)
+        if r.status_code not in [200, 404]:
+            r.raise_for_status()
+        # The time to the headers of the response, before its body is read
+        slot.latency = r.elapsed.total_seconds()
+        slot.size = len(r.content)
+    text = r.text if r.status_code == 200 else None
+    if cache is not None:
+        cache.put(pdb_id, file_type, text)
+    return text
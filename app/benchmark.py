@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.SQLKmerCsvWriter import SQLKmerCsvWriter
+from app.kmer import get_kmer_writer, kmer_count
+from app.kmer_vector import KmerFeatures
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak RSS is not recorded there
+    resource = None
+
+"""
+Usage: python -m app.benchmark run [-o OUTPUT] [-k K ...] [-n SIZES ...] [-f FORMATS ...]
+       python -m app.benchmark compare <results> <baseline> [-t THRESHOLD]
+"""
+
+# sqlcsv is the csv written by SQLKmerCsvWriter, from the kmer dicts of kmer_count
+FORMAT_EXTENSIONS = {"csv": ".csv", "sqlcsv": ".csv", "sparse": ".npz", "sqlite": ".db", "blocks": ".blocks",
+                     "memmap": ".kmat"}
+
+# Background frequencies of the amino acids in UniProtKB/Swiss-Prot, in percent
+RESIDUE_FREQUENCIES = {
+    'A': 8.25, 'C': 1.38, 'D': 5.46, 'E': 6.72, 'F': 3.86, 'G': 7.07, 'H': 2.27, 'I': 5.91, 'K': 5.80, 'L': 9.65,
+    'M': 2.41, 'N': 4.06, 'P': 4.74, 'Q': 3.93, 'R': 5.53, 'S': 6.64, 'T': 5.35, 'V': 6.86, 'W': 1.10, 'X': 0.10,
+    'Y': 2.92,
+}
+
+
+def generate_sequences(count: int, seed: int = 42, median_length: int = 250, min_length: int = 20,
+                       max_length: int = 2000) -> List[str]:
+    """
+    Generate random protein sequences, with log-normal lengths as the lengths of the repeat regions
+    and residues drawn from their background frequencies.
+    :param count: The number of sequences
+    :param seed: The random seed, the same seed gives the same sequences
+    :param median_length: The median length of the sequences
+    :param min_length: The min length of the sequences
+    :param max_length: The max length of the sequences
+    """
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(np.log(median_length), 0.6, count), min_length, max_length).astype(np.int64)
+    residues = np.array(list(RESIDUE_FREQUENCIES), dtype="<U1")
+    probabilities = np.array(list(RESIDUE_FREQUENCIES.values()))
+    probabilities /= probabilities.sum()
+    return ["".join(rng.choice(residues, size=length, p=probabilities)) for length in lengths.tolist()]
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def path_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run_case(name: str, k: int, size: int, seed: int, repeat: int) -> Dict:
+    """
+    Run a benchmark case, keeping the best time of repeat runs.
+    This function is meant to run in a process of its own, so that the peak RSS is the one of the case only.
+    :param name: 'kmer_count', 'count_sparse' or 'writer:<format>'
+    :param k: The kmer length
+    :param size: The number of sequences
+    :param seed: The seed of the sequences
+    :param repeat: The number of runs
+    """
+    sequences = generate_sequences(size, seed)
+    features = KmerFeatures(k)
+    output_bytes = None
+    times = []
+    if name == "kmer_count":
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for sequence in sequences:
+                kmer_count(k, sequence)
+            times.append(time.perf_counter() - start)
+    elif name == "count_sparse":
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for sequence in sequences:
+                features.count_sparse(sequence)
+            times.append(time.perf_counter() - start)
+    elif name.startswith("writer:"):
+        output_format = name.split(":")[1]
+        # Only the writing is timed, the counts are computed once
+        counts = [features.count_sparse(sequence) for sequence in sequences]
+        kmer_dicts = [kmer_count(k, sequence) for sequence in sequences] if output_format == "sqlcsv" else None
+        max_count = max((len(sequence) for sequence in sequences), default=0)
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as directory:
+                output_path = os.path.join(directory, "kmers" + FORMAT_EXTENSIONS[output_format])
+                non_kmer_columns = ["region_id", "class_topology_fold_clan", "sequence"]
+                start = time.perf_counter()
+                if output_format == "sqlcsv":
+                    writer = SQLKmerCsvWriter(output_path, non_kmer_columns, k, features=features,
+                                              scratch_dir=directory)
+                    for i, (kmers, sequence) in enumerate(zip(kmer_dicts, sequences)):
+                        writer.write_kmer_count(kmers, [f"R{i}", "3.1.1.1", sequence])
+                else:
+                    writer = get_kmer_writer(output_format, output_path, non_kmer_columns, features, max_count)
+                    for i, ((indices, kmer_counts), sequence) in enumerate(zip(counts, sequences)):
+                        writer.write_kmer_vector(indices, kmer_counts, [f"R{i}", "3.1.1.1", sequence])
+                writer.close()
+                times.append(time.perf_counter() - start)
+                output_bytes = path_size(output_path)
+    else:
+        raise ValueError(f"Error: {name} is not a valid benchmark case.")
+    return {
+        "name": name,
+        "k": k,
+        "sequences": size,
+        "residues": sum(len(sequence) for sequence in sequences),
+        "seconds": min(times),
+        "peak_rss_kb": peak_rss_kb(),
+        "output_bytes": output_bytes,
+    }
+
+
+def benchmark_cases(ks: List[int], sizes: List[int], formats: List[str], max_cells: int) -> List[Tuple[str, int, int]]:
+    """
+    List the (name, k, size) cases to run. The writers of the formats storing every cell
+    (csv, sqlcsv, blocks and memmap) are skipped when the matrix has more than max_cells cells.
+    """
+    cases = []
+    for size in sizes:
+        for k in ks:
+            cases.append(("kmer_count", k, size))
+            cases.append(("count_sparse", k, size))
+            for output_format in formats:
+                dense = output_format in ["csv", "sqlcsv", "blocks", "memmap"]
+                if dense and size * KmerFeatures(k).columns_count() > max_cells:
+                    print(f"Skipping writer:{output_format} k={k} sequences={size}, more than {max_cells} cells")
+                    continue
+                cases.append((f"writer:{output_format}", k, size))
+    return cases
+
+
+def run_benchmark(ks: List[int], sizes: List[int], formats: List[str], output_path, seed: int = 42, repeat: int = 3,
+                  max_cells: int = 200_000_000):
+    """
+    Run the benchmark cases, each one in a fresh process, and write the results to a json file.
+    """
+    results = []
+    for name, k, size in benchmark_cases(ks, sizes, formats, max_cells):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(run_case, name, k, size, seed, repeat).result()
+        print(f"{name:<16} k={k} sequences={size:<6} {result['seconds']:.4f}s "
+              f"peak RSS {result['peak_rss_kb']} KB output {result['output_bytes']} bytes")
+        results.append(result)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "seed": seed,
+        "repeat": repeat,
+        "results": results,
+    }
+    with open(output_path, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output_path}")
+
+
+def compare_results(results_path, baseline_path, threshold: float = 0.1) -> List[str]:
+    """
+    Compare benchmark results to a baseline.
+    :param threshold: The relative increase of time or peak RSS over the baseline reported as a regression
+    :return: A description of every regression
+    """
+    with open(results_path, "r") as file:
+        results = json.load(file)["results"]
+    with open(baseline_path, "r") as file:
+        baseline = {(r["name"], r["k"], r["sequences"]): r for r in json.load(file)["results"]}
+    regressions = []
+    for result in results:
+        reference = baseline.get((result["name"], result["k"], result["sequences"]))
+        if reference is None:
+            continue
+        for metric in ["seconds", "peak_rss_kb"]:
+            if result[metric] is None or reference[metric] is None or reference[metric] == 0:
+                continue
+            change = result[metric] / reference[metric] - 1
+            if change > threshold:
+                regressions.append(f"{result['name']} k={result['k']} sequences={result['sequences']}: {metric} "
+                                   f"{reference[metric]} -> {result[metric]} (+{change:.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the kmer counting and of the kmer writers.")
+    subparsers = parser.add_subparsers(title='commands', dest='command', required=True)
+    parser_run = subparsers.add_parser('run', help='Run the benchmark')
+    parser_run.add_argument('-o', '--output', dest='output', help='Output json (default: benchmark.json)',
+                            default='benchmark.json')
+    parser_run.add_argument('-k', dest='ks', help='Kmer lengths (default: 1 2 3 4 5)', type=int, nargs='+',
+                            default=[1, 2, 3, 4, 5])
+    parser_run.add_argument('-n', '--sizes', dest='sizes', help='Numbers of sequences (default: 100 1000)', type=int,
+                            nargs='+', default=[100, 1000])
+    parser_run.add_argument('-f', '--formats', dest='formats', choices=list(FORMAT_EXTENSIONS), nargs='+',
+                            help='Writers to benchmark (default: all)', default=list(FORMAT_EXTENSIONS))
+    parser_run.add_argument('-s', '--seed', dest='seed', help='Seed of the sequences (default: 42)', type=int,
+                            default=42)
+    parser_run.add_argument('-r', '--repeat', dest='repeat', help='Runs of every case, the best time is kept '
+                                                                  '(default: 3)', type=int, default=3)
+    parser_run.add_argument('--max-cells', dest='max_cells', help='Skip the dense writers above this number of cells '
+                                                                  '(default: 200000000)', type=int,
+                            default=200_000_000)
+    parser_compare = subparsers.add_parser('compare', help='Compare results to a baseline')
+    parser_compare.add_argument('results', help='Benchmark results', type=str)
+    parser_compare.add_argument('baseline', help='Baseline results', type=str)
+    parser_compare.add_argument('-t', '--threshold', dest='threshold', help='Relative regression threshold '
+                                                                            '(default: 0.1)', type=float, default=0.1)
+    args = parser.parse_args()
+    if args.command == 'run':
+        run_benchmark(args.ks, args.sizes, args.formats, args.output, args.seed, args.repeat, args.max_cells)
+        return
+    regressions = compare_results(args.results, args.baseline, args.threshold)
+    for regression in regressions:
+        print(regression)
+    if regressions:
+        sys.exit(1)
+    print("No regression.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,36 @@
 import argparse
 import time
 
-from app.controller import run_repeatsdb_query, run_kmer_count, run_models_on_kmers
+from app.controller import run_repeatsdb_query, run_kmer_count, run_kmer_sweep, run_models_on_kmers
+from app.kmer_vector import REDUCED_ALPHABETS
+from app.sequence_fetcher import Progress, format_progress
 
 
 def handle_query(args):
-    run_repeatsdb_query(args.query_classes, args.file_name, args.merge_regions, args.n_threads)
+    run_repeatsdb_query(args.query_classes, args.file_name, args.merge_regions, args.n_threads, not args.no_cache,
+                        args.cache_dir, args.cache_size, args.parse_workers, print_progress, args.resume,
+                        args.search_ttl, args.pdb_mirror, args.offline, not args.fixed_threads)
+
+
+def print_progress(progress: Progress):
+    # The line is rewritten until the last sequence
+    print("\r" + format_progress(progress), end="\n" if progress.done == progress.total else "", flush=True)
 
 
 def handle_kmer(args):
-    run_kmer_count(args.input, args.k, args.file_name)
+    if len(args.k) > 1:
+        run_kmer_sweep(args.input, args.k, args.file_name, args.output_format, args.workers, args.incremental,
+                       args.alphabet, args.hash_width, args.min_df, args.top_n, args.scratch_dir, args.jobs)
+        return
+    run_kmer_count(args.input, args.k[0], args.file_name, args.output_format, args.workers, args.incremental,
+                   args.alphabet, args.hash_width, args.min_df, args.top_n, args.scratch_dir)
 
 
 def handle_models(args):
     if args.max_sample_size_per_level < 1:
         raise ValueError("Error: max_sample_size_per_level must be an integer greater than 0.")
-    run_models_on_kmers(args.path, args.level, args.method, args.max_sample_size_per_level, args.k, args.random_state)
+    run_models_on_kmers(args.path, args.level, args.method, args.max_sample_size_per_level, args.k, args.random_state,
+                        args.alphabet, args.hash_width, args.vocabulary)
 
 
 def handle_command(args):
@@ -51,15 +66,71 @@ def handle_cli_input():
                               default='output')
     parser_query.add_argument('-m', '--merge_regions', dest='merge_regions', action='store_true',
                               help='Merge units in regions (default: false)')
-    parser_query.add_argument('-t', '--threads', dest='n_threads', help='Number of threads (default: 5)', type=int,
-                              default=5)
+    parser_query.add_argument('-t', '--threads', dest='n_threads',
+                              help='Max number of structures downloaded at the same time, the number is adapted '
+                                   'to the server up to it (default: 32)', type=int, default=32)
+    parser_query.add_argument('--no-cache', dest='no_cache', action='store_true',
+                              help='Download the PDB files and the RepeatsDB search without the local caches '
+                                   '(default: false)')
+    parser_query.add_argument('--cache-dir', dest='cache_dir', type=str, default=None,
+                              help='Directory of the cache of the PDB files '
+                                   '(default: ~/.cache/proteins-classification/pdb)')
+    parser_query.add_argument('--cache-size', dest='cache_size', type=int, default=2048,
+                              help='Max size of the cache in MB, the least recently used files are removed '
+                                   '(default: 2048)')
+    parser_query.add_argument('--parse-workers', dest='parse_workers', type=int, default=None,
+                              help='Number of processes parsing the structures, 0 to parse in the main process '
+                                   '(default: number of CPUs)')
+    parser_query.add_argument('--resume', dest='resume', action='store_true',
+                              help='Keep the sequences already got by an interrupted query with the same output '
+                                   '(default: false)')
+    parser_query.add_argument('--search-ttl', dest='search_ttl', type=float, default=60,
+                              help='Minutes a cached RepeatsDB search is used for, 0 to always download it '
+                                   '(default: 60)')
+    parser_query.add_argument('--pdb-mirror', dest='pdb_mirror', type=str, default=None,
+                              help='Directory of a local mirror of the PDB archive in the divided layout, the '
+                                   'structures are read from it and the missing ones downloaded (default: none)')
+    parser_query.add_argument('--offline', dest='offline', action='store_true',
+                              help='Never download the structures missing from the PDB mirror (default: false)')
+    parser_query.add_argument('--fixed-threads', dest='fixed_threads', action='store_true',
+                              help='Always download --threads structures at the same time, without adapting the '
+                                   'number to the server (default: false)')
     # Kmer count
     parser_kmer = subparsers.add_parser('kmer', help='Count kmers in a dataset')
     parser_kmer.add_argument('input', help='Input file name', type=str)
-    parser_kmer.add_argument('k', help='Kmer length', type=int, nargs='?', default=0)
+    parser_kmer.add_argument('k', help='Kmer length, several lengths are counted over one read of the input',
+                             type=int, nargs='*', default=[0])
     parser_kmer.add_argument('-o', '--output', dest='file_name',
                              help='Output file name (default: \'input_file_name\'_k_mer)',
                              default=None, type=str)
+    parser_kmer.add_argument('-f', '--format', dest='output_format', choices=['csv', 'sparse', 'sqlite', 'blocks',
+                                                                                 'memmap'],
+                             help='Output format, sparse writes a compressed sparse matrix (.npz), sqlite an indexed '
+                                  'kmer database (.db), blocks a directory with a csv per kmer length (.blocks), '
+                                  'memmap a directory with a binary matrix (.kmat) (default: csv)',
+                             default='csv')
+    parser_kmer.add_argument('-w', '--workers', dest='workers', help='Number of counting processes (default: 1)',
+                             type=int, default=1)
+    parser_kmer.add_argument('-i', '--incremental', dest='incremental', action='store_true',
+                             help='Recount only new or changed sequences of a previous incremental run '
+                                  '(default: false)')
+    parser_kmer.add_argument('-a', '--alphabet', dest='alphabet', choices=list(REDUCED_ALPHABETS),
+                             help='Reduced amino acid alphabet, residues are mapped to their group before counting '
+                                  '(default: none)', default=None)
+    parser_kmer.add_argument('--hash-width', dest='hash_width',
+                             help='Hash the kmers of every length with more possible kmers than this width into '
+                                  'this number of columns (default: none)', type=int, default=None)
+    parser_kmer.add_argument('--min-df', dest='min_df',
+                             help='Keep only the kmers found in at least this number of sequences (default: none)',
+                             type=int, default=None)
+    parser_kmer.add_argument('--top-n', dest='top_n',
+                             help='Keep only this number of kmers, the ones found in the most sequences '
+                                  '(default: none)', type=int, default=None)
+    parser_kmer.add_argument('-j', '--jobs', dest='jobs',
+                             help='Number of kmer lengths counted at the same time (default: 1)', type=int, default=1)
+    parser_kmer.add_argument('--scratch-dir', dest='scratch_dir',
+                             help='Directory of the scratch space of every job (default: the output directory)',
+                             type=str, default=None)
 
     # Models
     parser_models = subparsers.add_parser('models', help='Run models on kmer dataset')
@@ -71,6 +142,17 @@ def handle_cli_input():
                                help='Max samples for entries with the same specified level', type=int)
     parser_models.add_argument('-r', '--random', dest='random_state', help='Random state (default: 42)', type=int,
                                default=42)
+    parser_models.add_argument('-a', '--alphabet', dest='alphabet', choices=list(REDUCED_ALPHABETS),
+                               help='Fold the kmer columns into a reduced amino acid alphabet, the input still holds '
+                                    'the 21^k standard columns, for long kmers count them with kmer -a instead '
+                                    '(default: none)', default=None)
+    parser_models.add_argument('--hash-width', dest='hash_width',
+                               help='Fold the kmer columns into this number of hashed columns per kmer length, the '
+                                    'input still holds the 21^k standard columns, for long kmers count them with '
+                                    'kmer --hash-width instead (default: none)', type=int, default=None)
+    parser_models.add_argument('-v', '--vocabulary', dest='vocabulary',
+                               help='Vocabulary file written by the kmer command, only its kmer columns are read '
+                                    '(default: none)', type=str, default=None)
 
     # Exit
     subparsers.add_parser('exit', help='Exit the cli')
@@ -1,30 +1,94 @@
 from typing import List
+import os
 
 from app.repeats import query_repeatsdb_to_csv
-from app.kmer import to_csv_kmer_count
+from app.kmer import to_csv_kmer_count, to_csv_kmer_sweep
 from app.models import run_models
+from app.PdbFileCache import default_cache_dir
+from app.ResponseCache import default_response_cache_dir
 
+KMER_FORMAT_EXTENSIONS = {
+    "csv": ".csv",
+    "sparse": ".npz",
+    "sqlite": ".db",
+    "blocks": ".blocks",
+    "memmap": ".kmat",
+}
 
-def run_repeatsdb_query(query_classes: List[str], file_name, merge_regions, n_threads):
+
+def run_repeatsdb_query(query_classes: List[str], file_name, merge_regions, n_threads, cache=True, cache_dir=None,
+                        cache_size_mb=2048, parse_workers=None, on_progress=None, resume=False, search_ttl_minutes=60,
+                        pdb_mirror_dir=None, offline=False, adaptive=True):
     output = file_name if file_name else "output.csv"
     if not output.endswith(".csv"):
         output += ".csv"
-    query_repeatsdb_to_csv(query_classes, merge_regions, n_threads, output)
+    if cache_size_mb < 1:
+        raise ValueError("Error: cache size must be an integer greater than 0.")
+    if parse_workers is not None and parse_workers < 0:
+        raise ValueError("Error: parse workers must be a positive integer or 0.")
+    if search_ttl_minutes < 0:
+        raise ValueError("Error: search ttl must be a positive number or 0.")
+    if offline and pdb_mirror_dir is None:
+        raise ValueError("Error: offline mode needs a PDB mirror.")
+    cache_dir = (cache_dir if cache_dir is not None else default_cache_dir()) if cache else None
+    query_repeatsdb_to_csv(query_classes, merge_regions, n_threads, output, cache_dir, cache_size_mb << 20,
+                           parse_workers, on_progress, resume,
+                           default_response_cache_dir() if cache and search_ttl_minutes > 0 else None,
+                           search_ttl_minutes * 60, pdb_mirror_dir, offline, adaptive)
+
+
+def run_kmer_count(input_file, k, output_file, output_format="csv", workers=1, incremental=False, alphabet=None,
+                   hash_width=None, min_df=None, top_n=None, scratch_dir=None):
+    validate_kmer_options(output_format, workers, min_df, top_n, scratch_dir)
+    extension = KMER_FORMAT_EXTENSIONS[output_format]
+    input_name = input_file if input_file.endswith(".csv") else input_file + ".csv"
+    output_name = output_file if output_file is not None else input_file + "_" + str(k) + "_mer" + extension
+    if not output_name.endswith(extension):
+        output_name += extension
+    to_csv_kmer_count(input_name, k, output_name, output_format, workers, incremental, alphabet, hash_width, min_df,
+                      top_n, scratch_dir)
 
 
-def run_kmer_count(input_file, k, output_file):
+def run_kmer_sweep(input_file, ks: List[int], output_file, output_format="csv", workers=1, incremental=False,
+                   alphabet=None, hash_width=None, min_df=None, top_n=None, scratch_dir=None, jobs=1):
+    validate_kmer_options(output_format, workers, min_df, top_n, scratch_dir)
+    if jobs < 1:
+        raise ValueError("Error: jobs must be an integer greater than 0.")
+    if len(set(ks)) != len(ks):
+        raise ValueError("Error: every k must be different.")
+    extension = KMER_FORMAT_EXTENSIONS[output_format]
     input_name = input_file if input_file.endswith(".csv") else input_file + ".csv"
-    output_name = output_file if output_file is not None else input_file + "_" + str(k) + "_mer.csv"
-    if not output_name.endswith(".csv"):
-        output_name += ".csv"
-    to_csv_kmer_count(input_name, k, output_name)
+    # Every k gets its own output, named as the default output of a single count
+    output_base = output_file.removesuffix(extension) if output_file is not None else input_file
+    output_names = [output_base + "_" + str(k) + "_mer" + extension for k in ks]
+    to_csv_kmer_sweep(input_name, ks, output_names, output_format, workers, incremental, alphabet, hash_width, min_df,
+                      top_n, scratch_dir, jobs)
+
+
+def validate_kmer_options(output_format, workers, min_df, top_n, scratch_dir):
+    if output_format not in KMER_FORMAT_EXTENSIONS:
+        raise ValueError(f"Error: output format must be one of {', '.join(KMER_FORMAT_EXTENSIONS)}.")
+    if workers < 1:
+        raise ValueError("Error: workers must be an integer greater than 0.")
+    if min_df is not None and min_df < 1:
+        raise ValueError("Error: min df must be an integer greater than 0.")
+    if top_n is not None and top_n < 1:
+        raise ValueError("Error: top n must be an integer greater than 0.")
+    if scratch_dir is not None and not os.path.isdir(scratch_dir):
+        raise FileNotFoundError(f"Error: scratch directory {scratch_dir} does not exist.")
+
 
-def run_models_on_kmers(path, level, method, max_sample_size_per_level, k, random_state=42):
+def run_models_on_kmers(path, level, method, max_sample_size_per_level, k, random_state=42, alphabet=None,
+                        hash_width=None, vocabulary=None):
+    known_path = os.path.exists(path) or path.endswith(tuple(KMER_FORMAT_EXTENSIONS.values()))
     run_models(
-        path if path.endswith(".csv") else path + ".csv",
+        path if known_path else path + ".csv",
         level,
         method,
         max_sample_size_per_level,
         k,
-        random_state
+        random_state,
+        alphabet,
+        hash_width,
+        vocabulary
     )
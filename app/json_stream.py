@@ -0,0 +1,115 @@
+"""
+Incremental decoding of large JSON arrays, as the responses of the RepeatsDB API.
+The text is decoded an element at a time, so neither the whole text nor the list of decoded elements are kept.
+"""
+import json
+import math
+from typing import Any, Dict, Iterable, Iterator, List, TextIO
+
+WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """
+    Decode the elements of a JSON array from the chunks of its text.
+    :param chunks: The text, in chunks of any size
+    :raise ValueError: If the text is not a JSON array
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ""
+    position = 0
+    exhausted = False
+
+    def read_more() -> bool:
+        nonlocal buffer, position, exhausted
+        if exhausted:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            return False
+        # The decoded text is dropped, so the buffer stays the size of a few elements
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    def next_char() -> str:
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                return ""
+
+    if next_char() != "[":
+        raise ValueError("Error: the response is not a JSON array.")
+    position += 1
+    if next_char() == "]":
+        position += 1
+    else:
+        while True:
+            next_char()
+            while True:
+                try:
+                    element, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as e:
+                    # The element goes on in the next chunks
+                    if read_more():
+                        continue
+                    raise ValueError(f"Error: the response is not valid JSON: {e}.") from None
+                following = end
+                while following < len(buffer) and buffer[following] in WHITESPACE:
+                    following += 1
+                if (following == len(buffer) or buffer[following] not in ",]") and read_more():
+                    # A number may go on in the next chunk, as "1" of "1.5e-7", it is decoded again
+                    continue
+                break
+            position = end
+            yield element
+            separator = next_char()
+            position += 1
+            if separator == "]":
+                break
+            if separator != ",":
+                raise ValueError("Error: the response is not valid JSON: expected ',' or ']'.")
+    if next_char() != "":
+        raise ValueError("Error: the response is not valid JSON: extra data after the array.")
+
+
+def read_chunks(file: TextIO, size: int = 1 << 16) -> Iterator[str]:
+    return iter(lambda: file.read(size), "")
+
+
+def tee_chunks(chunks: Iterable[str], file: TextIO) -> Iterator[str]:
+    """
+    Write the chunks to a file while they are read.
+    """
+    for chunk in chunks:
+        file.write(chunk)
+        yield chunk
+
+
+def json_columns(records: Iterable[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Turn JSON objects into columns, as pd.DataFrame turns a list of dicts into columns:
+    the columns are in order of first appearance and the values missing from an object are NaN.
+    """
+    columns: Dict[str, List[Any]] = {}
+    count = 0
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError("Error: the response is not an array of JSON objects.")
+        for key, value in record.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [math.nan] * count
+            column.append(value)
+        count += 1
+        if len(record) != len(columns):
+            for column in columns.values():
+                if len(column) < count:
+                    column.append(math.nan)
+    return columns
@@ -1,11 +1,29 @@
+import csv
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
 import pandas as pd
 
+from app.KmerBlockWriter import KmerBlockWriter
 from app.KmerCsvWriter import KmerCsvWriter
+from app.KmerMemmapWriter import KmerMemmapWriter
+from app.KmerSparseWriter import KmerSparseWriter
+from app.SQLKmerStore import SQLKmerStore
+from app.kmer_vector import KmerFeatures
 
 
 def kmer_count(k, sequence):
     """
     Count the number of k-mers in a sequence.
+    This is the reference implementation, app.kmer_vector.kmer_count_vector computes the same counts
+    as a vector aligned to the kmer columns.
     :param k: Int
     :param sequence: str
     :return: dict
@@ -23,12 +41,280 @@ def kmer_count(k, sequence):
     return kmer_dict
 
 
-def to_csv_kmer_count(df_path, k: int, output_path):
+def get_kmer_writer(output_format, output_path, non_kmer_columns, features: KmerFeatures, max_count: int = None):
+    k = features.k
+    match output_format:
+        case "csv":
+            return KmerCsvWriter(output_path, non_kmer_columns=non_kmer_columns, k=k, features=features)
+        case "sparse":
+            return KmerSparseWriter(output_path, non_kmer_columns=non_kmer_columns, k=k, features=features)
+        case "sqlite":
+            return SQLKmerStore(output_path, non_kmer_columns=non_kmer_columns, k=k, features=features)
+        case "blocks":
+            return KmerBlockWriter(output_path, non_kmer_columns=non_kmer_columns, k=k, features=features)
+        case "memmap":
+            return KmerMemmapWriter(output_path, non_kmer_columns=non_kmer_columns, k=k, max_count=max_count,
+                                    features=features)
+        case _:
+            raise ValueError(f"Error: {output_format} is not a valid output format. Please use one of the following: "
+                             f"csv, sparse, sqlite, blocks, memmap")
+
+
+def count_kmers_chunk(features: KmerFeatures, sequences: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Count the kmers of a chunk of sequences, packing the results in three arrays so that they are cheap
+    to send back from a worker process.
+    :return: indptr, indices and counts, the kmers of the i-th sequence are in indptr[i]:indptr[i + 1]
+    """
+    results = [features.count_sparse(sequence) for sequence in sequences]
+    indptr = np.zeros(len(results) + 1, dtype=np.int64)
+    np.cumsum([len(indices) for indices, _ in results], out=indptr[1:])
+    if len(results) == 0 or indptr[-1] == 0:
+        return indptr, np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+    indices = np.concatenate([indices for indices, _ in results]).astype(np.uint32)
+    counts = np.concatenate([counts for _, counts in results])
+    counts = counts.astype(np.uint16 if counts.max() <= np.iinfo(np.uint16).max else np.uint32)
+    return indptr, indices, counts
+
+
+def iter_kmer_counts(features: KmerFeatures, sequences: List[str], workers: int = 1,
+                     chunk_size: int = 256) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Count the kmers of every sequence, yielding the results in the order of the sequences.
+    With more than one worker the sequences are counted in chunks by a process pool, keeping at most
+    two chunks per worker in flight.
+    :param features: The kmer columns
+    :param sequences: The sequences to count
+    :param workers: The number of worker processes
+    :param chunk_size: The number of sequences sent to a worker at once
+    :return: An iterator of (indices, counts) as returned by KmerFeatures.count_sparse
+    """
+    if workers <= 1:
+        for sequence in sequences:
+            yield features.count_sparse(sequence)
+        return
+    chunks = (sequences[i:i + chunk_size] for i in range(0, len(sequences), chunk_size))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(count_kmers_chunk, features, chunk))
+            if len(pending) >= 2 * workers:
+                yield from _unpack_chunk(pending.popleft().result())
+        while pending:
+            yield from _unpack_chunk(pending.popleft().result())
+
+
+def _unpack_chunk(chunk):
+    indptr, indices, counts = chunk
+    for start, end in zip(indptr[:-1], indptr[1:]):
+        yield indices[start:end], counts[start:end]
+
+
+def kmer_document_frequency(features: KmerFeatures, sequences: List[str], workers: int = 1) -> np.ndarray:
+    """
+    Count the number of sequences in which each kmer column occurs, streaming over the sequences
+    so that only one vector of frequencies is kept in memory.
+    :return: np.ndarray with one document frequency per kmer column
+    """
+    frequency = np.zeros(features.columns_count(), dtype=np.int64)
+    for indices, _ in iter_kmer_counts(features, sequences, workers):
+        frequency[indices] += 1
+    return frequency
+
+
+def select_kmer_vocabulary(frequency: np.ndarray, min_df: int = None, top_n: int = None) -> np.ndarray:
+    """
+    Select the kmer columns occurring in at least min_df sequences, then the top_n most frequent of them.
+    Columns with the same frequency are kept in column order.
+    :param frequency: The document frequency of every kmer column
+    :param min_df: The min number of sequences, 1 if None
+    :param top_n: The max number of columns to keep, no limit if None
+    :return: The sorted indexes of the selected columns
+    """
+    selected = np.flatnonzero(frequency >= (min_df if min_df is not None else 1))
+    if top_n is not None and len(selected) > top_n:
+        order = np.argsort(-frequency[selected], kind="stable")
+        selected = np.sort(selected[order[:top_n]])
+    return selected
+
+
+def write_kmer_vocabulary(path, features: KmerFeatures, frequency: np.ndarray):
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["kmer", "document_frequency"])
+        writer.writerows(zip(features.columns(), frequency[features.vocabulary].tolist()))
+
+
+def read_kmer_vocabulary(path) -> List[str]:
+    """
+    Read the kmer columns of a vocabulary written by to_csv_kmer_count.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Error: {path} does not exist.")
+    with open(path, "r", newline="") as file:
+        return [row["kmer"] for row in csv.DictReader(file)]
+
+
+def sequence_hash(sequence) -> str:
+    return hashlib.sha1(f"{sequence}".encode()).hexdigest()
+
+
+def read_kmer_index(index_path, features: KmerFeatures) -> Dict[Tuple[str, str], Tuple[int, int, int]]:
+    """
+    Read the sidecar index of a kmer csv written in incremental mode.
+    :param index_path: The path of the index
+    :param features: The kmer columns, entries written with a different k, alphabet or hash width are ignored
+    :return: A dict (region_id, sequence hash) -> (row offset, kmer cells offset, row length) in bytes
+    """
+    index = {}
+    with open(index_path, "r", newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            if int(row["k"]) == features.k and row.get("features", "standard") == features.name:
+                index[(row["region_id"], row["sequence_hash"])] = (int(row["offset"]), int(row["kmer_offset"]),
+                                                                   int(row["length"]))
+    return index
+
+
+def incremental_kmer_count(df, features: KmerFeatures, output_path, workers: int = 1, previous_path=None):
+    """
+    Update a kmer csv, counting only the sequences that are new or changed since the last incremental run.
+    The rows of the unchanged sequences are copied from the previous output, the rows of the regions that are
+    no longer in the input are dropped. The output is written in the order of the input, together with the sidecar
+    index (output_path + '.idx') of the row locations of (region_id, sequence hash, k, features name).
+    :param output_path: The path of the new output, it must not be previous_path
+    :param previous_path: The path of the output of the last incremental run
+    """
+    previous = {}
+    if previous_path is not None and os.path.exists(previous_path) and os.path.exists(previous_path + ".idx"):
+        previous = read_kmer_index(previous_path + ".idx", features)
+    region_ids = [f"{region_id}" for region_id in df['region_id'].tolist()]
+    sequences = df['sequence'].tolist()
+    hashes = [sequence_hash(sequence) for sequence in sequences]
+    reused = [(region_id, h) in previous for region_id, h in zip(region_ids, hashes)]
+    to_count = [sequence for sequence, is_reused in zip(sequences, reused) if not is_reused]
+    counts = iter_kmer_counts(features, to_count, workers)
+    rows = zip(region_ids, df['class_topology_fold_clan'].tolist(), sequences)
+    index_rows = []
+    writer = KmerCsvWriter(output_path, non_kmer_columns=["region_id", "class_topology_fold_clan", "sequence"],
+                           k=features.k, features=features)
+    with open(previous_path, "rb") if previous else nullcontext() as previous_file:
+        for row, h, is_reused in zip(rows, hashes, reused):
+            offset = writer.bytes_written
+            if is_reused:
+                previous_offset, kmer_offset, length = previous[(row[0], h)]
+                previous_file.seek(kmer_offset)
+                cells = previous_file.read(previous_offset + length - 1 - kmer_offset).decode("utf-8")
+                writer.write_kmer_cells(cells, list(row))
+            else:
+                indices, kmer_counts = next(counts)
+                writer.write_kmer_vector(indices, kmer_counts, list(row))
+            kmer_offset = offset + len(writer.row_prefix(list(row)).encode("utf-8"))
+            index_rows.append((row[0], h, features.k, features.name, offset, kmer_offset,
+                               writer.bytes_written - offset))
+    writer.close()
+    with open(output_path + ".idx", "w", newline="", encoding="utf-8") as file:
+        index_writer = csv.writer(file)
+        index_writer.writerow(["region_id", "sequence_hash", "k", "features", "offset", "kmer_offset", "length"])
+        index_writer.writerows(index_rows)
+    stale = previous.keys() - set(zip(region_ids, hashes))
+    print(f"Reused {sum(reused)} rows, counted {len(to_count)} sequences, dropped {len(stale)} stale rows")
+
+
+@contextmanager
+def kmer_scratch_output(output_path, scratch_dir=None):
+    """
+    Give a job its own scratch directory to write its output, so that concurrent jobs never share a file.
+    On success, the files written in the scratch directory (the output and its sidecar files) are moved
+    next to output_path, replacing the previous ones. The scratch directory is removed in any case.
+    :param output_path: The final path of the output
+    :param scratch_dir: The directory in which the scratch directory is created, the directory of the output if None,
+    so that the output is renamed rather than copied
+    :return: The path to write the output to
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    scratch = tempfile.mkdtemp(prefix=".kmer-scratch-", dir=scratch_dir if scratch_dir is not None else output_dir)
+    try:
+        yield os.path.join(scratch, os.path.basename(output_path))
+        for name in os.listdir(scratch):
+            destination = os.path.join(output_dir, name)
+            # Move next to the destination first, the final rename is then on the same file system
+            staged = tempfile.mkdtemp(prefix=".kmer-staged-", dir=output_dir)
+            try:
+                shutil.move(os.path.join(scratch, name), os.path.join(staged, name))
+                if os.path.isdir(destination):
+                    shutil.rmtree(destination)
+                os.replace(os.path.join(staged, name), destination)
+            finally:
+                shutil.rmtree(staged, ignore_errors=True)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def read_kmer_input(df_path) -> pd.DataFrame:
     df = pd.read_csv(df_path, usecols=["region_id", "class_topology_fold_clan", "sequence"])
-    writer = KmerCsvWriter(output_path, non_kmer_columns=["region_id", "class_topology_fold_clan", "sequence"], k=k)
-    for index, row in df.iterrows():
-        if row['sequence'] is None or row['sequence'] == "":
-            continue
-        writer.write_kmer_count(kmer_count(k, row['sequence']), [row['region_id'], row['class_topology_fold_clan'],
-                                                                 row['sequence']])
+    return df[[sequence is not None and sequence != "" for sequence in df['sequence']]]
+
+
+def count_kmers_to_file(df, k: int, output_path, output_format="csv", workers: int = 1, incremental=False,
+                        alphabet=None, hash_width=None, min_df: int = None, top_n: int = None, scratch_dir=None):
+    """
+    Count the kmers of the sequences of df and write them to output_path, through a scratch directory
+    of its own (see kmer_scratch_output).
+    """
+    if incremental and output_format != "csv":
+        raise ValueError("Error: incremental mode is only available for the csv format.")
+    features = KmerFeatures(k, alphabet, hash_width)
+    with kmer_scratch_output(output_path, scratch_dir) as scratch_output:
+        if min_df is not None or top_n is not None:
+            # Pre-pass over the sequences, the output is written with the selected kmer columns only
+            frequency = kmer_document_frequency(features, df['sequence'].tolist(), workers)
+            features = features.restrict(select_kmer_vocabulary(frequency, min_df, top_n))
+            write_kmer_vocabulary(scratch_output + ".vocab", features, frequency)
+            print(f"Kept {features.columns_count()} of {len(frequency)} kmer columns")
+        if incremental:
+            incremental_kmer_count(df, features, scratch_output, workers, previous_path=output_path)
+        else:
+            write_kmer_output(df, features, scratch_output, output_format, workers)
+
+
+def to_csv_kmer_count(df_path, k: int, output_path, output_format="csv", workers: int = 1, incremental=False,
+                      alphabet=None, hash_width=None, min_df: int = None, top_n: int = None, scratch_dir=None):
+    count_kmers_to_file(read_kmer_input(df_path), k, output_path, output_format, workers, incremental, alphabet,
+                        hash_width, min_df, top_n, scratch_dir)
+
+
+def to_csv_kmer_sweep(df_path, ks: List[int], output_paths: List[str], output_format="csv", workers: int = 1,
+                      incremental=False, alphabet=None, hash_width=None, min_df: int = None, top_n: int = None,
+                      scratch_dir=None, jobs: int = 1):
+    """
+    Count the kmers for several k values, reading the input once and running up to jobs counts concurrently,
+    each one in its own process and scratch directory.
+    A failed count does not stop the others, the first error is raised once all of them are done.
+    :param ks: The kmer lengths
+    :param output_paths: The output path of every kmer length
+    :param workers: The number of counting processes of every job
+    :param jobs: The number of kmer lengths counted at the same time
+    """
+    df = read_kmer_input(df_path)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(count_kmers_to_file, df, k, output_path, output_format, workers, incremental,
+                                   alphabet, hash_width, min_df, top_n, scratch_dir)
+                   for k, output_path in zip(ks, output_paths)]
+        errors = [future.exception() for future in futures]
+    for k, output_path, error in zip(ks, output_paths, errors):
+        print(f"k={k}: {output_path}" if error is None else f"k={k}: failed, {error}")
+    for error in errors:
+        if error is not None:
+            raise error
+
+
+def write_kmer_output(df, features: KmerFeatures, output_path, output_format="csv", workers: int = 1):
+    sequences = df['sequence'].tolist()
+    # A kmer can't occur more times than the length of the sequence
+    max_count = max((len(sequence) for sequence in sequences if type(sequence) == str), default=0)
+    writer = get_kmer_writer(output_format, output_path, ["region_id", "class_topology_fold_clan", "sequence"],
+                             features, max_count)
+    rows = zip(df['region_id'].tolist(), df['class_topology_fold_clan'].tolist(), sequences)
+    for (indices, counts), row in zip(iter_kmer_counts(features, sequences, workers), rows):
+        writer.write_kmer_vector(indices, counts, list(row))
     writer.close()
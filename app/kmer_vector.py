@@ -0,0 +1,300 @@
+import bisect
+import copy
+import functools
+import hashlib
+import itertools
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+ALPHABET = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'X', 'Y']
+BASE = len(ALPHABET)
+
+# Reduced amino acid alphabets (Murphy et al., 2000), every group is represented by its first residue.
+# 'X' and the residues outside the alphabet are kept in a group of their own.
+REDUCED_ALPHABETS = {
+    "murphy4": ["LVIMC", "AGSTP", "FYW", "EDNQKRH"],
+    "murphy8": ["LVIMC", "AG", "ST", "P", "FYW", "EDNQ", "KR", "H"],
+    "murphy10": ["LVIM", "C", "A", "G", "ST", "P", "FYW", "EDNQ", "KR", "H"],
+    "murphy15": ["LVIM", "C", "A", "G", "S", "T", "P", "FY", "W", "E", "D", "N", "Q", "KR", "H"],
+}
+
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class KmerFeatures:
+    def __init__(self, k: int, alphabet: str = None, hash_width: int = None):
+        """
+        This class defines the kmer columns and maps the kmers of a sequence to them.
+        The columns are all the kmers of length 1, then all the kmers of length 2 and so on up to k,
+        each length in lexicographic order of the alphabet.
+        Residues outside the alphabet are counted as 'X', as three_residue_to_one does for unknown residues.
+        :param k: The max kmer length
+        :param alphabet: The name of a reduced alphabet in REDUCED_ALPHABETS, the residues are mapped to their group
+        before counting. If None, the 21 letters alphabet is used.
+        :param hash_width: If set, the kmers of every length with more than hash_width possible kmers are hashed
+        into hash_width columns, named '<length>#<bucket>'
+        """
+        if alphabet is not None and alphabet not in REDUCED_ALPHABETS:
+            raise ValueError(f"Error: {alphabet} is not a valid alphabet. Please use one of the following: "
+                             f"{', '.join(REDUCED_ALPHABETS)}")
+        if hash_width is not None and hash_width < 1:
+            raise ValueError("Error: hash width must be an integer greater than 0.")
+        self.k = k
+        self.alphabet = alphabet
+        self.hash_width = hash_width
+        groups = [[residue] for residue in ALPHABET] if alphabet is None else \
+            [list(group) for group in REDUCED_ALPHABETS[alphabet]] + [['X']]
+        self.symbols = [group[0] for group in groups]
+        self.base = len(self.symbols)
+        self.encoding = np.full(256, self.symbols.index('X'), dtype=np.uint64)
+        for code, group in enumerate(groups):
+            for residue in group:
+                self.encoding[ord(residue)] = code
+        self.hashed = [hash_width is not None and self.base ** i > hash_width for i in range(1, k + 1)]
+        widths = [hash_width if hashed else self.base ** i for i, hashed in zip(range(1, k + 1), self.hashed)]
+        # The kmers of length i are in the columns offsets[i - 1] to offsets[i] - 1
+        self.offsets = [0] + list(itertools.accumulate(widths))
+        # Sorted indexes of the kept columns among all the columns, None if all the columns are kept
+        self.vocabulary = None
+        self._all_offsets = self.offsets
+
+    @property
+    def name(self) -> str:
+        """
+        A name identifying the kmer columns, besides k.
+        """
+        name = self.alphabet if self.alphabet is not None else "standard"
+        name += f"-hash{self.hash_width}" if self.hash_width is not None else ""
+        if self.vocabulary is not None:
+            name += "-vocab" + hashlib.sha1(self.vocabulary.tobytes()).hexdigest()[:12]
+        return name
+
+    def restrict(self, vocabulary) -> "KmerFeatures":
+        """
+        Keep only some of the columns, for instance the kmers selected by their document frequency.
+        The kept columns stay in the same order, so the kmers of each length are still contiguous.
+        :param vocabulary: The indexes of the columns to keep among all the columns
+        :return: A copy of the features with the kept columns only
+        """
+        restricted = copy.copy(self)
+        restricted.vocabulary = np.unique(np.asarray(vocabulary, dtype=np.int64))
+        restricted.offsets = [int(offset) for offset in np.searchsorted(restricted.vocabulary, self._all_offsets)]
+        return restricted
+
+    def columns(self) -> Iterator[str]:
+        if self.vocabulary is not None:
+            for index in self.vocabulary.tolist():
+                yield self._column_name(index)
+            return
+        for i, hashed in zip(range(1, self.k + 1), self.hashed):
+            if hashed:
+                for bucket in range(self.hash_width):
+                    yield f"{i}#{bucket}"
+            else:
+                for kmer in itertools.product(self.symbols, repeat=i):
+                    yield "".join(kmer)
+
+    def columns_count(self) -> int:
+        return self.offsets[-1]
+
+    def encode(self, sequence: str) -> np.ndarray:
+        """
+        Map each residue of the sequence to its code, the index of its symbol in the alphabet.
+        """
+        return self.encoding[np.frombuffer(sequence.encode("ascii", errors="replace"), dtype=np.uint8)]
+
+    def codes(self, sequence) -> np.ndarray:
+        """
+        Compute the column index of every kmer of length 1 to k in the sequence.
+        The kmers of each length are built from the ones of the previous length by rolling their codes,
+        then hashed if the length is hashed, and shifted by the number of columns of the shorter kmers.
+        :return: np.ndarray of int64, one column index per kmer occurrence, among all the columns whatever the
+        vocabulary
+        """
+        if type(sequence) != str or sequence == "":
+            return np.empty(0, dtype=np.int64)
+        encoded = self.encode(sequence)
+        base = np.uint64(self.base)
+        parts = []
+        rolling = encoded
+        for length in range(1, min(self.k, len(encoded)) + 1):
+            if length > 1:
+                # For long hashed kmers the codes wrap around modulo 2^64, which only adds collisions
+                rolling = rolling[:-1] * base + encoded[length - 1:]
+            codes = self._bucket(rolling) if self.hashed[length - 1] else rolling
+            parts.append(codes.astype(np.int64) + self._all_offsets[length - 1])
+        return np.concatenate(parts)
+
+    def count_vector(self, sequence) -> np.ndarray:
+        """
+        Count the kmers of length 1 to k in a sequence.
+        :return: np.ndarray with one count per kmer column
+        """
+        if self.vocabulary is None:
+            return np.bincount(self.codes(sequence), minlength=self.columns_count())
+        indices, counts = self.count_sparse(sequence)
+        vector = np.zeros(self.columns_count(), dtype=np.int64)
+        vector[indices] = counts
+        return vector
+
+    def count_sparse(self, sequence) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Count the kmers of length 1 to k in a sequence, keeping only the kmers found in the sequence.
+        :return: The sorted column indexes of the kmers found and their counts
+        """
+        indices, counts = np.unique(self.codes(sequence), return_counts=True)
+        return self._keep_vocabulary(indices, counts)
+
+    def column_index(self, kmer: str) -> int:
+        """
+        Column index of a kmer of residues, or of symbols of the alphabet.
+        :return: The column index, None if the column of the kmer is not in the vocabulary
+        """
+        code = np.zeros(1, dtype=np.uint64)
+        for residue in self.encode(kmer):
+            code = code * np.uint64(self.base) + residue
+        if self.hashed[len(kmer) - 1]:
+            code = self._bucket(code)
+        index = self._all_offsets[len(kmer) - 1] + int(code[0])
+        if self.vocabulary is None:
+            return index
+        position = int(np.searchsorted(self.vocabulary, index))
+        found = position < len(self.vocabulary) and self.vocabulary[position] == index
+        return position if found else None
+
+    def kmer_column(self, kmer: str) -> str:
+        """
+        Name of the column of a kmer of residues, None if the column is not in the vocabulary.
+        """
+        index = self.column_index(kmer)
+        if index is None:
+            return None
+        return self._column_name(int(self.vocabulary[index]) if self.vocabulary is not None else index)
+
+    def dict_to_sparse(self, kmers: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Convert the kmer counts returned by app.kmer.kmer_count to the sorted column indexes and counts
+        returned by count_sparse. Kmers mapped to the same column are summed, kmers outside the vocabulary are dropped.
+        """
+        columns = [(self.column_index(kmer), count) for kmer, count in kmers.items()]
+        columns = [(index, count) for index, count in columns if index is not None]
+        indices = np.array([index for index, _ in columns], dtype=np.int64)
+        counts = np.array([count for _, count in columns], dtype=np.int64)
+        unique_indices, inverse = np.unique(indices, return_inverse=True)
+        return unique_indices, np.bincount(inverse, weights=counts, minlength=len(unique_indices)).astype(np.int64)
+
+    def _keep_vocabulary(self, indices: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.vocabulary is None:
+            return indices, counts
+        positions = np.searchsorted(self.vocabulary, indices)
+        found = positions < len(self.vocabulary)
+        found[found] = self.vocabulary[positions[found]] == indices[found]
+        return positions[found], counts[found]
+
+    def _column_name(self, index: int) -> str:
+        length = bisect.bisect_right(self._all_offsets, index)
+        code = index - self._all_offsets[length - 1]
+        if self.hashed[length - 1]:
+            return f"{length}#{code}"
+        kmer = []
+        for _ in range(length):
+            code, residue = divmod(code, self.base)
+            kmer.append(self.symbols[residue])
+        return "".join(reversed(kmer))
+
+    def _bucket(self, codes: np.ndarray) -> np.ndarray:
+        return ((codes * _HASH_MULTIPLIER) >> np.uint64(32)) % np.uint64(self.hash_width)
+
+
+def kmer_column_length(column: str) -> int:
+    """
+    The length of the kmers of a column, hashed columns are named '<length>#<bucket>'.
+    """
+    return int(column.split("#")[0]) if "#" in column else len(column)
+
+
+@functools.lru_cache(maxsize=None)
+def standard_features(k: int) -> KmerFeatures:
+    return KmerFeatures(k)
+
+
+def kmer_columns(k: int) -> Iterator[str]:
+    """
+    Generate the kmer column names in the order used by the kmer writers:
+    all the 1-mers, then all the 2-mers and so on, each length in lexicographic order of the alphabet.
+    :param k: The max kmer length
+    """
+    return standard_features(k).columns()
+
+
+def kmer_columns_count(k: int) -> int:
+    """
+    Number of kmer columns for kmers of length 1 to k.
+    """
+    return standard_features(k).columns_count()
+
+
+def kmer_length_offsets(k: int) -> List[int]:
+    """
+    Column index of the first kmer of each length: the kmers of length i are in the columns
+    offsets[i - 1] to offsets[i] - 1.
+    :param k: The max kmer length
+    :return: A list of k + 1 offsets
+    """
+    # A copy, the features are shared by every caller
+    return list(standard_features(k).offsets)
+
+
+def kmer_column_index(kmer: str) -> int:
+    """
+    Column index of a kmer in the order of kmer_columns, computed from its base-21 code.
+    """
+    return standard_features(len(kmer)).column_index(kmer)
+
+
+def encode_sequence(sequence: str) -> np.ndarray:
+    """
+    Map each residue of the sequence to its base-21 code, the index of the residue in the alphabet.
+    :param sequence: str
+    :return: np.ndarray of uint64
+    """
+    return standard_features(1).encode(sequence)
+
+
+def kmer_codes(k: int, sequence) -> np.ndarray:
+    """
+    Compute the column index of every kmer of length 1 to k in the sequence.
+    :param k: Int
+    :param sequence: str
+    :return: np.ndarray of int64, one column index per kmer occurrence
+    """
+    return standard_features(k).codes(sequence)
+
+
+def kmer_count_vector(k: int, sequence) -> np.ndarray:
+    """
+    Count the kmers of length 1 to k in a sequence.
+    :param k: Int
+    :param sequence: str
+    :return: np.ndarray with one count per kmer column, in the order of kmer_columns(k)
+    """
+    return standard_features(k).count_vector(sequence)
+
+
+def kmer_count_sparse(k: int, sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Count the kmers of length 1 to k in a sequence, keeping only the kmers found in the sequence.
+    :param k: Int
+    :param sequence: str
+    :return: The sorted column indexes of the kmers found and their counts
+    """
+    return standard_features(k).count_sparse(sequence)
+
+
+def kmer_dict_to_sparse(kmers: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert the kmer counts returned by app.kmer.kmer_count to the sorted column indexes and counts
+    returned by kmer_count_sparse.
+    """
+    return standard_features(max((len(kmer) for kmer in kmers), default=1)).dict_to_sparse(kmers)
@@ -1,8 +1,11 @@
+import itertools
 import sys
 import warnings
 from typing import Callable, List, Tuple, Any, Set
 
+import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
 from sklearn import metrics
 from sklearn.cluster import AgglomerativeClustering, AffinityPropagation
 from sklearn.ensemble import RandomForestClassifier
@@ -13,6 +16,13 @@ from sklearn.neural_network import MLPClassifier
 from sklearn.preprocessing import Normalizer, StandardScaler
 from sklearn.svm import SVC
 
+from app.KmerBlockWriter import read_block_non_kmer_columns, read_kmer_blocks
+from app.KmerMemmapWriter import read_memmap_kmer_rows, read_memmap_non_kmer_columns
+from app.KmerSparseWriter import read_sparse_kmer_matrix, read_sparse_non_kmer_columns
+from app.SQLKmerStore import fetch_kmer_vectors, read_sql_non_kmer_columns
+from app.kmer import read_kmer_vocabulary
+from app.kmer_vector import KmerFeatures, kmer_column_length
+
 """
 Usage: python models.py <path_to_csv> <level> <method> <max_sample_size_per_level> <k> [random_state]
 """
@@ -150,9 +160,38 @@ def get_best_model(scores):
     return best_model
 
 
+def kmer_file_format(df_path):
+    """
+    The format of a kmer file written by the kmer command, from its extension.
+    """
+    path = df_path.rstrip("/\\")
+    if path.endswith(".npz"):
+        return "sparse"
+    if path.endswith(".db"):
+        return "sqlite"
+    if path.endswith(".blocks"):
+        return "blocks"
+    if path.endswith(".kmat"):
+        return "memmap"
+    return "csv"
+
+
+def read_region_labels(df_path):
+    match kmer_file_format(df_path):
+        case "sparse":
+            return read_sparse_non_kmer_columns(df_path)[["region_id", "class_topology_fold_clan"]]
+        case "sqlite":
+            return read_sql_non_kmer_columns(df_path, ["region_id", "class_topology_fold_clan"])
+        case "blocks":
+            return read_block_non_kmer_columns(df_path, ["region_id", "class_topology_fold_clan"])
+        case "memmap":
+            return read_memmap_non_kmer_columns(df_path, ["region_id", "class_topology_fold_clan"])
+    return pd.read_csv(df_path, usecols=["region_id", "class_topology_fold_clan"],
+                       dtype={"region_id": str, "class_topology_fold_clan": str})
+
+
 def get_sampled_regions(df_path, level: str, sample_size: int, random_state):
-    df = pd.read_csv(df_path, usecols=["region_id", "class_topology_fold_clan"],
-                     dtype={"region_id": str, "class_topology_fold_clan": str})
+    df = read_region_labels(df_path)
     df['label'], _ = get_y_and_X(df, level)
     counter = df['label'].value_counts().to_dict()
     for key, count in counter.items():
@@ -164,7 +203,87 @@ def get_sampled_regions(df_path, level: str, sample_size: int, random_state):
             'region_id'].tolist()
 
 
-def read_csv_of_regions(df_path, regions, k, preprocess):
+def read_csv_of_regions(df_path, regions, k, preprocess, features: KmerFeatures = None, vocabulary: List[str] = None):
+    """
+    Read the rows of the given regions with the kmer columns of length 1 to k, then transform the kmer counts.
+    :param df_path: The kmer file, either a csv, a sparse matrix (.npz), a kmer database (.db)
+    or a directory of kmer blocks (.blocks) or a binary kmer matrix (.kmat)
+    :param regions: The region ids to read
+    :param k: The max kmer length
+    :param preprocess: "normalize" or "standardize"
+    :param features: If set, the kmer columns are folded into these features before the transformation
+    :param vocabulary: If set, only these kmer columns are kept
+    """
+    match kmer_file_format(df_path):
+        case "sparse":
+            df = read_sparse_of_regions(df_path, regions, k)
+        case "sqlite":
+            df = read_sql_of_regions(df_path, regions, k)
+        case "blocks":
+            df = read_blocks_of_regions(df_path, regions, k)
+        case "memmap":
+            df = read_memmap_of_regions(df_path, regions, k)
+        case _:
+            df = read_dense_csv_of_regions(df_path, regions, k, vocabulary)
+    if vocabulary is not None:
+        kept = set(vocabulary)
+        df = df[list(df.columns[:3]) + [c for c in df.columns[3:] if c in kept]]
+        if len(df.columns) == 3:
+            raise ValueError("Error: none of the kmer columns is in the vocabulary.")
+    if features is not None:
+        df = fold_kmer_columns(df, features)
+    return transform_df(df, Normalizer() if preprocess == "normalize" else StandardScaler())
+
+
+def read_sparse_of_regions(df_path, regions, k):
+    matrix, columns, non_kmers = read_sparse_kmer_matrix(df_path)
+    kmer_columns = list(itertools.takewhile(lambda c: kmer_column_length(c) <= k, columns))
+    if len(kmer_columns) == 0:
+        raise ValueError("Error: no kmer columns found.")
+    # Keep only the first row of each region, as for the csv
+    selected = non_kmers['region_id'].isin(regions) & ~non_kmers['region_id'].duplicated()
+    rows = np.flatnonzero(selected.to_numpy())
+    print("\tCreating DataFrame...")
+    df = non_kmers.iloc[rows][["region_id", "class_topology_fold_clan", "sequence"]].reset_index(drop=True)
+    counts = pd.DataFrame(matrix[rows][:, :len(kmer_columns)].toarray().astype(np.int64), columns=kmer_columns)
+    return pd.concat([df, counts], axis=1)
+
+
+def read_sql_of_regions(df_path, regions, k):
+    kmer_columns, non_kmers, matrix = fetch_kmer_vectors(df_path, regions, k)
+    if len(kmer_columns) == 0:
+        raise ValueError("Error: no kmer columns found.")
+    print("\tCreating DataFrame...")
+    df = non_kmers[["region_id", "class_topology_fold_clan", "sequence"]].reset_index(drop=True)
+    return pd.concat([df, pd.DataFrame(matrix, columns=kmer_columns)], axis=1)
+
+
+def read_blocks_of_regions(df_path, regions, k):
+    non_kmers = read_block_non_kmer_columns(df_path, ["region_id", "class_topology_fold_clan", "sequence"])
+    # Keep only the first row of each region, as for the csv
+    selected = non_kmers['region_id'].isin(regions) & ~non_kmers['region_id'].duplicated()
+    rows = np.flatnonzero(selected.to_numpy())
+    kmer_columns, matrix = read_kmer_blocks(df_path, rows.tolist(), k)
+    if len(kmer_columns) == 0:
+        raise ValueError("Error: no kmer columns found.")
+    print("\tCreating DataFrame...")
+    df = non_kmers.iloc[rows].reset_index(drop=True)
+    return pd.concat([df, pd.DataFrame(matrix, columns=kmer_columns)], axis=1)
+
+
+def read_memmap_of_regions(df_path, regions, k):
+    non_kmers = read_memmap_non_kmer_columns(df_path, ["row", "region_id", "class_topology_fold_clan", "sequence"])
+    # Keep only the first row of each region, as for the csv
+    non_kmers = non_kmers[non_kmers['region_id'].isin(regions) & ~non_kmers['region_id'].duplicated()]
+    kmer_columns, matrix = read_memmap_kmer_rows(df_path, non_kmers['row'].astype(np.int64).to_numpy(), k)
+    if len(kmer_columns) == 0:
+        raise ValueError("Error: no kmer columns found.")
+    print("\tCreating DataFrame...")
+    df = non_kmers.drop(columns=["row"]).reset_index(drop=True)
+    return pd.concat([df, pd.DataFrame(matrix, columns=kmer_columns)], axis=1)
+
+
+def read_dense_csv_of_regions(df_path, regions, k, vocabulary: List[str] = None):
     index = 0
     rows = []
     reg_copy = regions.copy()
@@ -172,12 +291,15 @@ def read_csv_of_regions(df_path, regions, k, preprocess):
         for line in file:
             if index == 0:
                 columns = line.strip().split(",")
-                # Filter all kmer columns that are not in the range [1, k], excluding the first 3 columns
+                # Filter all kmer columns that are not in the range [1, k] or not in the vocabulary,
+                # excluding the first 3 columns
+                kept = set(vocabulary) if vocabulary is not None else None
                 columns_indexes = [0, 1, 2]
                 for i, c in enumerate(columns[3:]):
-                    if len(c) > k:
+                    if kmer_column_length(c) > k:
                         break
-                    columns_indexes.append(i + 3)
+                    if kept is None or c in kept:
+                        columns_indexes.append(i + 3)
                 columns = [columns[i] for i in columns_indexes]
                 index += 1
                 if len(columns) == 3:
@@ -196,8 +318,30 @@ def read_csv_of_regions(df_path, regions, k, preprocess):
             if len(reg_copy) == 0:
                 break
     print("\tCreating DataFrame...")
-    return transform_df(pd.DataFrame(rows, columns=columns),
-                        Normalizer() if preprocess == "normalize" else StandardScaler())
+    return pd.DataFrame(rows, columns=columns)
+
+
+def fold_kmer_columns(df, features: KmerFeatures):
+    """
+    Map the kmer columns of a DataFrame to the columns of a reduced alphabet or a hashed feature space,
+    summing the counts of the kmers that fall into the same column.
+    Only the columns that receive at least one kmer are kept. The DataFrame already holds every standard kmer
+    column, so this does not bound the memory used to read long kmers, the kmer command counts them in the
+    reduced or hashed features directly.
+    :param df: The DataFrame read by read_csv_of_regions, with the non-kmer columns first
+    :param features: The target kmer columns
+    """
+    kmer_columns = df.columns[3:]
+    if any("#" in c for c in kmer_columns):
+        raise ValueError("Error: the kmer columns are already hashed, count the kmers again to change the features.")
+    print(f"\tFolding kmer columns into {features.name} features...")
+    targets, inverse = np.unique([features.column_index(c) for c in kmer_columns], return_inverse=True)
+    mapping = csr_matrix((np.ones(len(kmer_columns), dtype=np.int64), (np.arange(len(kmer_columns)), inverse)),
+                         shape=(len(kmer_columns), len(targets)))
+    counts = csr_matrix(df[kmer_columns].to_numpy(dtype=np.int64)) @ mapping
+    names = list(features.columns())
+    folded = pd.DataFrame(counts.toarray(), columns=[names[i] for i in targets], index=df.index)
+    return pd.concat([df[df.columns[:3]], folded], axis=1)
 
 
 def transform_df(df, transformer):
@@ -212,16 +356,20 @@ def transform_df(df, transformer):
     return df[order]
 
 
-def run_models(df_path, level, method, max_sample_size_per_level: int, k, random_state=42):
+def run_models(df_path, level, method, max_sample_size_per_level: int, k, random_state=42, alphabet=None,
+               hash_width=None, vocabulary_path=None):
     if method not in ['clustering', 'classifiers']:
         raise ValueError("Error: method must be either 'cluster' or 'classifiers'.")
     if max_sample_size_per_level < 1:
         raise ValueError("Error: max_sample_size_per_level must be an integer greater than 0.")
+    features = KmerFeatures(k, alphabet, hash_width) if alphabet is not None or hash_width is not None else None
+    vocabulary = read_kmer_vocabulary(vocabulary_path) if vocabulary_path is not None else None
     print("Reading CSV...")
     print("\tSampling regions...")
     sampled_regions = get_sampled_regions(df_path, level, max_sample_size_per_level, random_state)
     print("\tReading data...")
-    df = read_csv_of_regions(df_path, sampled_regions, k, "normalize" if method == "classifiers" else "standardize")
+    df = read_csv_of_regions(df_path, sampled_regions, k, "normalize" if method == "classifiers" else "standardize",
+                             features, vocabulary)
     y, X = get_y_and_X(df, level)
     print("Sample length: ", len(y))
     print("Sample's classes: ", dict(y.value_counts()))
@@ -1,9 +1,12 @@
+import bisect
 import collections
 from io import StringIO
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from Bio.PDB import PDBParser, MMCIFParser
 
-from app.api import pdb_get, mmCIF_get
+from app.api import structure_get
+from app.structure_parser import MissingResidue, ResidueRecord, scan_mmcif_residues, scan_pdb_residues
 
 
 def three_residue_to_one(residue):
@@ -129,14 +132,70 @@ def get_sequence(pdb_id, chain_id, start, end):
     :param end: The end index of the residues.
     :return: The sequence of the protein.
     """
-    pdb = pdb_get(pdb_id)
-    if pdb is None:
-        return get_sequence_from_mmcif(StringIO(mmCIF_get(pdb_id)), chain_id, start, end)
-    pdb_io = StringIO(pdb)
-    pdb_parser = PDBParser(QUIET=True)
-    structure = pdb_parser.get_structure(pdb_id, pdb_io)
+    file_type, text = fetch_structure(pdb_id)
+    return get_sequence_from_text(pdb_id, file_type, text, chain_id, start, end)
+
+
+def fetch_structure(pdb_id):
+    """
+    Get the structure of a protein, in PDB format or in mmCIF format when there is no PDB file.
+    The structure is read from the PDB mirror when it is set, otherwise downloaded.
+    :return: The file type, 'pdb' or 'cif', and the content of the file
+    :raise ValueError: If the structure is in neither format
+    """
+    structure = structure_get(pdb_id)
+    if structure is None:
+        raise ValueError(f"Error: {pdb_id} is not in the PDB.")
+    return structure
+
+
+def get_sequence_from_text(pdb_id, file_type, text, chain_id, start, end):
+    """
+    Get the sequence of a protein from the content of its structure file, as returned by fetch_structure.
+    """
+    return index_structure(pdb_id, file_type, text).sequence(chain_id, start, end)
+
+
+def index_structure(pdb_id, file_type, text, cross_check=False):
+    """
+    Index the residues of a structure file, as returned by fetch_structure.
+    The residues are read by the scanners of app.structure_parser, which skip the atoms and coordinates,
+    the files they can't read exactly as BioPython does are parsed with BioPython.
+    :param cross_check: Also index the file parsed with BioPython, and raise a ValueError if the indexes differ
+    :return: The StructureIndex of the file
+    """
+    try:
+        if file_type == 'cif':
+            index = StructureIndex(scan_mmcif_residues(text))
+        else:
+            index = StructureIndex(*scan_pdb_residues(text))
+    except (ValueError, IndexError):
+        return StructureIndex.from_structure(parse_structure(pdb_id, file_type, text), file_type)
+    if cross_check:
+        differences = index.differences(StructureIndex.from_structure(parse_structure(pdb_id, file_type, text),
+                                                                      file_type))
+        if differences:
+            raise ValueError(f"Error: the residues of {pdb_id} differ from BioPython in {', '.join(differences)}.")
+    return index
+
+
+def parse_structure(pdb_id, file_type, text):
+    """
+    Parse the content of a structure file, as returned by fetch_structure.
+    The structure can then be used to get the sequences of any number of chains and ranges.
+    """
+    if file_type == 'cif':
+        return MMCIFParser(QUIET=True).get_structure('structure', StringIO(text))
+    return PDBParser(QUIET=True).get_structure(pdb_id, StringIO(text))
+
+
+def get_sequence_from_structure(structure, file_type, chain_id, start, end):
+    """
+    Get the sequence of the residues of a chain between start and end from a parsed structure.
+    For PDB files, the residues missing from the coordinates are taken from the REMARK 465 records.
+    """
     res_dict = extract_res_dict(structure, chain_id, start, end)
-    if len(res_dict) != (end - start + 1):
+    if file_type != 'cif' and len(res_dict) != (end - start + 1):
         remarks = get_missing_residues(structure, chain_id, start, end)
         res_dict.update(remarks)
     sequence = ""
@@ -144,3 +203,125 @@ def get_sequence(pdb_id, chain_id, start, end):
     for value in sorted_res_dict.values():
         sequence += three_residue_to_one(value)
     return sequence
+
+
+class ChainResidues:
+    def __init__(self, residues: Dict[str, str]):
+        """
+        The residues of a chain sorted as custom_key sorts them, with their one letter codes.
+        The residue number is the first part of every key, so the residues between two numbers are a slice.
+        :param residues: The residue names by key, as in the dicts of extract_res_dict
+        """
+        items = sorted(residues.items(), key=lambda item: custom_key(item[0]))
+        self.numbers = [custom_key(key)[0] for key, _ in items]
+        self.codes = [three_residue_to_one(name) for _, name in items]
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def bounds(self, start: int, end: int) -> Tuple[int, int]:
+        return bisect.bisect_left(self.numbers, start), bisect.bisect_right(self.numbers, end)
+
+    def sequence(self, start: int, end: int) -> str:
+        low, high = self.bounds(start, end)
+        return "".join(self.codes[low:high])
+
+
+class StructureIndex:
+    def __init__(self, models: Iterable[Dict[str, Iterable[ResidueRecord]]],
+                 missing_residues: Optional[Iterable[MissingResidue]] = None):
+        """
+        This class is used to get the sequences of many ranges of a structure without walking the structure
+        for every range. The residues of every chain are keyed as extract_res_dict keys them, then sorted once,
+        so a range is a bisect and a slice. It gives the same sequences as get_sequence_from_structure.
+        :param models: For every model, the residue records of every chain in file order
+        :param missing_residues: The REMARK 465 records, None for mmCIF files whose missing residues are not used
+        """
+        # The chains of every model, in model order, extract_res_dict uses the first model with residues in range
+        self.models: List[Dict[str, ChainResidues]] = []
+        observed_by_model: List[Dict[str, Dict[str, str]]] = []
+        for model in models:
+            observed = {chain_id: self._keyed(records) for chain_id, records in model.items()}
+            observed_by_model.append(observed)
+            self.models.append({chain_id: ChainResidues(residues) for chain_id, residues in observed.items()})
+        self.uses_missing = missing_residues is not None
+        missing: Dict[str, Dict[str, str]] = {}
+        for chain_id, number, insertion, name in missing_residues or []:
+            key = str(number) + insertion if insertion is not None else str(number)
+            missing.setdefault(chain_id, {})[key] = name
+        # The observed residues updated with the missing ones, as get_sequence_from_structure updates them
+        self.missing = {chain_id: ChainResidues(residues) for chain_id, residues in missing.items()}
+        self.merged: List[Dict[str, ChainResidues]] = []
+        for observed in observed_by_model:
+            self.merged.append({chain_id: ChainResidues({**observed.get(chain_id, {}), **residues})
+                                for chain_id, residues in missing.items()})
+
+    @staticmethod
+    def _keyed(records: Iterable[ResidueRecord]) -> Dict[str, str]:
+        # The residues sharing a number are all in or all out of a range, so their keys do not depend on the range
+        residues = {}
+        for number, insertion, name in records:
+            if str(number) not in residues:
+                residues[str(number)] = name
+            else:
+                residues[str(number) + insertion] = name
+        return residues
+
+    @classmethod
+    def from_structure(cls, structure, file_type: str) -> 'StructureIndex':
+        """
+        Index a structure parsed by parse_structure.
+        """
+        models = []
+        for model in structure:
+            models.append({chain.id: [(residue.id[1], residue.id[2], residue.get_resname()) for residue in chain]
+                           for chain in model})
+        missing_residues = None
+        if file_type != 'cif':
+            missing_residues = [(res['chain'], res['ssseq'], res['insertion'], res['res_name'])
+                                for res in structure.header["missing_residues"]]
+        return cls(models, missing_residues)
+
+    def describe(self) -> Dict[str, Tuple[List[int], List[str]]]:
+        """
+        The residue numbers and one letter codes of every chain, the empty models and chains left out.
+        """
+        description = {}
+        models = [(chains, merged) for chains, merged in zip(self.models, self.merged)
+                  if any(len(residues) for residues in chains.values())]
+        for position, (chains, merged) in enumerate(models):
+            for name, table in [("model", chains), ("merged", merged)]:
+                for chain_id, residues in table.items():
+                    if len(residues):
+                        description[f"{name} {position} chain {chain_id}"] = (residues.numbers, residues.codes)
+        for chain_id, residues in self.missing.items():
+            description[f"missing chain {chain_id}"] = (residues.numbers, residues.codes)
+        return description
+
+    def differences(self, other: 'StructureIndex') -> List[str]:
+        """
+        The chains whose residues differ between two indexes of the same structure.
+        """
+        description, other_description = self.describe(), other.describe()
+        return [key for key in sorted(set(description) | set(other_description))
+                if description.get(key) != other_description.get(key)]
+
+    def sequence(self, chain_id: str, start: int, end: int) -> str:
+        """
+        Get the sequence of the residues of a chain between start and end.
+        """
+        empty = ChainResidues({})
+        model_position = None
+        observed = empty
+        for position, chains in enumerate(self.models):
+            residues = chains.get(chain_id, empty)
+            low, high = residues.bounds(start, end)
+            if high > low:
+                model_position, observed = position, residues
+                break
+        low, high = observed.bounds(start, end)
+        if not self.uses_missing or high - low == end - start + 1:
+            return observed.sequence(start, end)
+        if model_position is None:
+            return self.missing.get(chain_id, empty).sequence(start, end)
+        return self.merged[model_position].get(chain_id, observed).sequence(start, end)
@@ -1,87 +1,118 @@
+import csv
+import os
+from typing import Dict, List, Optional, Tuple
+
 import pandas as pd
-from app.api import repeatsdb_get
-import threading
+from app import api
+from app.api import repeatsdb_get, configure_pdb_cache, configure_http_session, configure_repeatsdb_cache, \
+    configure_pdb_mirror, configure_download_limiter
+from app.AdaptiveLimiter import format_limiter_stats
+from app.PdbFileCache import format_stats
+from app.PdbMirror import format_mirror_stats
 import warnings
 
-from app.protein_sequences import get_sequence
+from app.sequence_fetcher import fetch_sequences
 
 columns_to_ignore = (["reviewed", "annotator", "origin"])
 
 
 def differentiate_units_ids(df):
+    """
+    Number the units of every run of consecutive rows with the same repeatsdb_id, from 0,
+    and append the number to the repeatsdb_id.
+    """
     output_df = df.copy()
-    counter = -1
-    previous_id = df.iloc[0]["repeatsdb_id"]
-    for index, row in df.iterrows():
-        if previous_id == row["repeatsdb_id"]:
-            counter += 1
-        else:
-            counter = 0
-            previous_id = row["repeatsdb_id"]
-        output_df.at[index, "repeatsdb_id"] = row["repeatsdb_id"] + "_" + str(counter)
+    ids = df["repeatsdb_id"]
+    runs = (ids != ids.shift()).cumsum()
+    output_df["repeatsdb_id"] = ids + "_" + ids.groupby(runs).cumcount().astype(str)
     return output_df
 
 
 def integrate_regions(df):
-    grouped = df.groupby(["region_id"])
-    output_df = pd.DataFrame()
+    """
+    Merge the units of every region into a row, sorted by region_id, with the start and end taken from the region_id,
+    the list of the types of the units and the first value of the other columns.
+    """
+    if df.empty:
+        return pd.DataFrame()
     difference_columns = df.columns.difference(["region_id", "start", "end", "type"])
-    for region_id, group in grouped:
-        r = region_id[0].split("_")
-        row = {
-            "region_id": region_id[0],
-            "start": r[1],
-            "end": r[2],
-            "type": group["type"].tolist()
-        }
-        for col in difference_columns:
-            row[col] = group[col].iloc[0]
-        output_df = pd.concat([output_df, pd.DataFrame([row])], ignore_index=True)
+    first = df.drop_duplicates("region_id").sort_values("region_id", kind="stable").reset_index(drop=True)
+    bounds = first["region_id"].str.split("_")
+    output_df = pd.DataFrame({
+        "region_id": first["region_id"],
+        "start": bounds.str[1].astype(str),
+        "end": bounds.str[2].astype(str),
+        "type": df.groupby("region_id")["type"].agg(list).loc[first["region_id"]].tolist(),
+    })
+    for col in difference_columns:
+        output_df[col] = first[col]
     return output_df
 
 
-def add_sequence_to_row(row):
-    return get_sequence(row["pdb_id"], row["pdb_chain"], int(row["start"]), int(row["end"]))
-
-
 def remove_rows_with_errors(df):
     """
     Remove rows with start > end, and rows with region_id not matching min of starts and max of ends.
     """
-    output_df = df.copy()
     # Remove rows with start > end
-    output_df = output_df[~output_df['region_id'].isin(df[df['start'] > df['end']]['region_id'].tolist())]
-    to_remove = set()
-    agg = output_df.groupby('region_id').agg({
-        'start': 'min',
-        'end': 'max',
-        'region_id': 'first'
-    })
-    for _, row in agg.iterrows():
-        split = row['region_id'].split('_')
-        if int(split[1]) != row['start'] or int(split[2]) != row['end']:
-            to_remove.add(row['region_id'])
-    return output_df[~output_df['region_id'].isin(to_remove)]
+    output_df = df[~df['region_id'].isin(df.loc[df['start'] > df['end'], 'region_id'])]
+    agg = output_df.groupby('region_id').agg(start=('start', 'min'), end=('end', 'max'))
+    bounds = agg.index.to_series().str.split('_')
+    mismatch = (bounds.str[1].astype(int) != agg['start']) | (bounds.str[2].astype(int) != agg['end'])
+    return output_df[~output_df['region_id'].isin(agg.index[mismatch])]
 
 
-def split_df_into_n(df, n):
+def query_repeatsdb_to_csv(query_classes, merge_regions, n_threads, output_file, cache_dir=None,
+                           cache_size: int = 2 << 30, parse_workers=None, on_progress=None, resume=False,
+                           search_cache_dir=None, search_ttl: float = 3600, pdb_mirror_dir=None, offline=False,
+                           adaptive=True):
     """
-    Split a dataframe into n dataframes.
+    The sequences are written to a checkpoint next to the output as soon as they are got, and the output
+    is written from it at the end, so the sequences are not kept in memory while they are downloaded.
+    :param cache_dir: The directory of the cache of the PDB downloads, no cache if None
+    :param cache_size: The max size in bytes of the cache
+    :param parse_workers: The number of processes parsing the structures, None for the number of CPUs
+    :param on_progress: Called with the Progress of the sequences
+    :param resume: Keep the sequences of the checkpoint of an interrupted query and get only the others
+    :param search_cache_dir: The directory of the cache of the RepeatsDB search responses, no cache if None
+    :param search_ttl: The time in seconds a cached search response is used for
+    :param pdb_mirror_dir: The directory of a local mirror of the PDB archive the structures are read from
+    :param offline: Never download the structures missing from the mirror
+    :param adaptive: Adapt the number of downloads in flight to the server, up to n_threads
     """
-    return [df[i::n] for i in range(n)]
-
-
-def query_repeatsdb_to_csv(query_classes, merge_regions, n_threads, output_file):
     if not all(c in ['2', '3', '4', '5'] for c in query_classes):
         raise ValueError("Query classes must be in  ['2', '3', '4', '5'].")
-    query = "class:" + "%7Cclass:".join(set(query_classes))
+    configure_pdb_cache(cache_dir, cache_size)
+    configure_repeatsdb_cache(search_cache_dir, search_ttl)
+    configure_pdb_mirror(pdb_mirror_dir, http_fallback=not offline)
+    configure_http_session(pool_size=n_threads)
+    configure_download_limiter(n_threads, adaptive)
+    query = "class:" + "%7Cclass:".join(sorted(set(query_classes)))
     query += "%2Breviewed:true&show=entries"
-    df = preprocess_from_json(repeatsdb_get("query=" + query), merge_regions, n_threads)
-    df = df[df["class"].isin(query_classes)]
+    df = regions_from_json(repeatsdb_get("query=" + query), merge_regions)
+    df = df[df["class"].isin(query_classes)].copy()
+    checkpoint_path = output_file + ".partial"
+    try:
+        df["sequence"] = fetch_sequences_to_checkpoint(df, checkpoint_path, n_threads, parse_workers, on_progress,
+                                                       resume)
+    except BaseException:
+        if os.path.exists(checkpoint_path):
+            print(f"The sequences got so far are in {checkpoint_path}, run the query again with resume to keep them")
+        raise
     df.to_csv(output_file, index=False)
+    os.remove(checkpoint_path)
+    if api.pdb_cache is not None:
+        print(format_stats(api.pdb_cache.stats()))
+    if api.pdb_mirror is not None:
+        print(format_mirror_stats(api.pdb_mirror.stats()))
+    if api.download_limiter.stats()["requests"]:
+        print(format_limiter_stats(api.download_limiter.stats()))
 
 
-def preprocess_from_json(json, regions, n_threads=5):
+def regions_from_json(json, regions):
+    """
+    Turn a RepeatsDB search response into a dataframe of regions, or of units if regions is False.
+    :param json: The entries of the response, as a list of dicts or as columns
+    """
     df = pd.DataFrame(json).drop(columns_to_ignore, axis=1)
     df = df.astype({
         "start": int,
@@ -93,19 +124,101 @@ def preprocess_from_json(json, regions, n_threads=5):
         col: str for col in df.columns.difference(["start", "end", "region_units_num", "region_average_unit_length"])
     })
     df = remove_rows_with_errors(df)
-    df = integrate_regions(df) if regions else differentiate_units_ids(df)
-    threads = []
-    dfs = split_df_into_n(df, n_threads)
+    return integrate_regions(df) if regions else differentiate_units_ids(df)
+
 
-    def thread_worker(worker_df):
-        worker_df.loc[:, "sequence"] = worker_df.apply(add_sequence_to_row, axis=1)
+def preprocess_from_json(json, regions, n_threads=5, parse_workers=None, on_progress=None):
+    df = regions_from_json(json, regions)
+    df["sequence"] = fetch_region_sequences(df, n_threads, parse_workers, on_progress)
+    return df
+
+
+def fetch_region_sequences(df, n_threads=5, parse_workers=None, on_progress=None, on_sequence=None):
+    """
+    Get the sequences of the rows of a dataframe of regions or units, see fetch_sequences.
+    """
+    region_ids = df["region_id"].tolist()
+
+    def report_error(position, e):
+        # The downloads have already been retried, the region is reported and left without sequence
+        print(f"Error: could not get the sequence of {region_ids[position]}: {e}")
 
     warnings.filterwarnings("ignore")  # Suppress warnings from BioPython
-    for d in dfs:
-        t = threading.Thread(target=thread_worker, args=(d,))
-        threads.append(t)
-        t.start()
-    for t in threads:
-        t.join()
-    warnings.filterwarnings("default")
-    return pd.concat(dfs)
+    try:
+        return fetch_sequences(
+            list(zip(df["pdb_id"], df["pdb_chain"], df["start"].astype(int), df["end"].astype(int))),
+            n_threads,
+            report_error,
+            parse_workers,
+            on_progress,
+            on_sequence
+        )
+    finally:
+        warnings.filterwarnings("default")
+
+
+def region_keys(df) -> List[Tuple[str, str, str]]:
+    """
+    The (region_id, start, end) of every row, they identify the units as well as the regions.
+    """
+    return list(zip(df["region_id"], df["start"].astype(str), df["end"].astype(str)))
+
+
+def read_checkpoint(checkpoint_path) -> Dict[Tuple[str, str, str], str]:
+    with open(checkpoint_path, "r", newline="") as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        return {(region_id, start, end): sequence for region_id, start, end, sequence in reader}
+
+
+def truncate_partial_row(checkpoint_path):
+    """
+    Remove the last row of a checkpoint if it has been cut by a crash, it is the part after the last line break.
+    """
+    with open(checkpoint_path, "rb+") as file:
+        content_end = file.seek(0, os.SEEK_END)
+        position = content_end
+        while position > 0:
+            step = min(position, 1 << 16)
+            file.seek(position - step)
+            block = file.read(step)
+            line_break = block.rfind(b"\n")
+            if line_break >= 0:
+                position = position - step + line_break + 1
+                break
+            position -= step
+        if position < content_end:
+            file.truncate(position)
+
+
+def fetch_sequences_to_checkpoint(df, checkpoint_path, n_threads=5, parse_workers=None, on_progress=None,
+                                  resume=False) -> List[Optional[str]]:
+    """
+    Get the sequences of the rows of a dataframe of regions or units, appending every sequence to a checkpoint
+    csv as soon as it is got. The rows whose sequence can't be got are not in the checkpoint, so a resumed query
+    tries them again.
+    :param checkpoint_path: The checkpoint csv, with the region_id, start, end and sequence of every row done
+    :param resume: Get only the sequences missing from the checkpoint, if it exists, otherwise it is overwritten
+    :return: The sequences, in the order of the rows, None for the rows whose sequence can't be got
+    """
+    keys = region_keys(df)
+    done = set()
+    if resume and os.path.exists(checkpoint_path):
+        truncate_partial_row(checkpoint_path)
+    if resume and os.path.exists(checkpoint_path) and os.path.getsize(checkpoint_path) > 0:
+        done = set(read_checkpoint(checkpoint_path))
+        print(f"Resuming from {checkpoint_path}: {len(done)} sequences already got")
+    else:
+        with open(checkpoint_path, "w", newline="") as file:
+            csv.writer(file).writerow(["region_id", "start", "end", "sequence"])
+    todo = [position for position, key in enumerate(keys) if key not in done]
+    with open(checkpoint_path, "a", newline="") as file:
+        writer = csv.writer(file)
+
+        def write_sequence(position, sequence):
+            writer.writerow([*keys[todo[position]], sequence])
+            file.flush()
+
+        fetch_region_sequences(df.iloc[todo], n_threads, parse_workers, on_progress, write_sequence)
+    sequences = read_checkpoint(checkpoint_path)
+    return [sequences.get(key) for key in keys]
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from app.protein_sequences import fetch_structure, index_structure
+
+# (pdb_id, chain_id, start, end)
+SequenceRequest = Tuple[str, str, int, int]
+
+
+class Progress(NamedTuple):
+    # The requests whose sequence has been got or has failed
+    done: int
+    total: int
+    # Requests per second since the start
+    rate: float
+    # Seconds left at the current rate, None until a request is done
+    eta: Optional[float]
+
+
+def format_progress(progress: Progress) -> str:
+    eta = "--:--" if progress.eta is None else time.strftime("%H:%M:%S", time.gmtime(progress.eta))
+    return f"{progress.done}/{progress.total} sequences, {progress.rate:.1f}/s, ETA {eta}"
+
+
+def sequences_of_structure(pdb_id, file_type, text,
+                           ranges: List[Tuple[str, int, int]]) -> List[Union[str, Exception]]:
+    """
+    Parse and index a structure once and get the sequence of every (chain_id, start, end) range.
+    :return: The sequence of every range, or the error raised while getting it
+    """
+    index = index_structure(pdb_id, file_type, text)
+    sequences = []
+    for chain_id, start, end in ranges:
+        try:
+            sequences.append(index.sequence(chain_id, start, end))
+        except Exception as e:
+            sequences.append(e)
+    return sequences
+
+
+async def fetch_sequences_async(requests_list: List[SequenceRequest], max_in_flight: int = 100,
+                                on_error: Callable[[int, Exception], None] = None,
+                                parse_workers: Optional[int] = None,
+                                on_progress: Callable[[Progress], None] = None,
+                                on_sequence: Callable[[int, str], None] = None) -> List[Optional[str]]:
+    """
+    Get the sequences of a list of requests, downloading up to max_in_flight structures at the same time.
+    The requests are grouped by pdb_id, so every structure is downloaded and parsed once whatever the number
+    of chains and ranges requested from it.
+    The work is a two-stage pipeline. The structures to download are in a shared work queue, max_in_flight
+    download workers take the next one as soon as they are free, so a few large files don't hold back
+    the others, and put the downloaded structures in a bounded queue. The downloads are blocking, so they run
+    in a pool of threads. The structures are parsed from the queue by a pool of parse_workers processes,
+    so parsing uses several cores and doesn't hold the GIL of the download threads. When the parsing lags,
+    the queue is full and the downloads wait.
+    :param requests_list: The (pdb_id, chain_id, start, end) of every sequence
+    :param max_in_flight: The max number of downloads at the same time
+    :param on_error: Called with the position of the request and the error when a structure can't be downloaded
+    or parsed, the sequence is then None. If None, the error is raised.
+    :param parse_workers: The number of parsing processes, None for the number of CPUs, 0 to parse in a thread
+    of this process
+    :param on_progress: Called with the progress every time the requests of a structure are done
+    :param on_sequence: Called with the position of the request and the sequence as soon as it is got.
+    The sequences are then not kept, so they can be streamed to disk, and the returned list is all None.
+    :return: The sequences, in the order of the requests
+    """
+    if max_in_flight < 1:
+        raise ValueError("Error: the number of downloads must be an integer greater than 0.")
+    if parse_workers is None:
+        parse_workers = os.cpu_count() or 1
+    if parse_workers < 0:
+        raise ValueError("Error: the number of parse workers must be a positive integer or 0.")
+    loop = asyncio.get_running_loop()
+    parsers_count = max(parse_workers, 1)
+    sequences: List[Optional[str]] = [None] * len(requests_list)
+    positions_by_pdb: Dict[str, List[int]] = {}
+    for position, (pdb_id, _, _, _) in enumerate(requests_list):
+        positions_by_pdb.setdefault(pdb_id, []).append(position)
+    # The structures to download, taken by the download workers
+    work: asyncio.Queue = asyncio.Queue()
+    for item in positions_by_pdb.items():
+        work.put_nowait(item)
+    # The downloaded structures waiting for a parser, None tells a parser that the downloads are over
+    downloaded: asyncio.Queue = asyncio.Queue(maxsize=2 * parsers_count)
+    start_time = time.perf_counter()
+    done = 0
+
+    def fail(positions: List[int], e: Exception):
+        if on_error is None:
+            raise e
+        for position in positions:
+            on_error(position, e)
+
+    def report(positions: List[int]):
+        nonlocal done
+        done += len(positions)
+        if on_progress is not None:
+            elapsed = time.perf_counter() - start_time
+            rate = done / elapsed if elapsed > 0 else 0.0
+            eta = (len(requests_list) - done) / rate if rate > 0 else None
+            on_progress(Progress(done, len(requests_list), rate, eta))
+
+    if parse_workers > 0:
+        # Spawned processes, forking a process running the download threads is not safe
+        parse_pool = ProcessPoolExecutor(max_workers=parse_workers, mp_context=get_context("spawn"))
+    else:
+        parse_pool = ThreadPoolExecutor(max_workers=1)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as download_pool, parse_pool:
+
+        async def download():
+            while not work.empty():
+                pdb_id, positions = work.get_nowait()
+                try:
+                    file_type, text = await loop.run_in_executor(download_pool, fetch_structure, pdb_id)
+                except Exception as e:
+                    fail(positions, e)
+                    report(positions)
+                    continue
+                await downloaded.put((pdb_id, positions, file_type, text))
+
+        async def download_all():
+            await asyncio.gather(*(download() for _ in range(min(max_in_flight, len(positions_by_pdb)))))
+            for _ in range(parsers_count):
+                await downloaded.put(None)
+
+        async def parse():
+            while (item := await downloaded.get()) is not None:
+                pdb_id, positions, file_type, text = item
+                ranges = [requests_list[position][1:] for position in positions]
+                try:
+                    results = await loop.run_in_executor(parse_pool, sequences_of_structure, pdb_id, file_type,
+                                                         text, ranges)
+                except Exception as e:
+                    fail(positions, e)
+                    report(positions)
+                    continue
+                for position, result in zip(positions, results):
+                    if isinstance(result, Exception):
+                        fail([position], result)
+                    elif on_sequence is not None:
+                        on_sequence(position, result)
+                    else:
+                        sequences[position] = result
+                report(positions)
+
+        tasks = [asyncio.create_task(download_all())] + [asyncio.create_task(parse()) for _ in range(parsers_count)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # An error raised by a stage stops the other one, which may be waiting on the queue
+            for task in tasks:
+                task.cancel()
+    return sequences
+
+
+def fetch_sequences(requests_list: List[SequenceRequest], max_in_flight: int = 100,
+                    on_error: Callable[[int, Exception], None] = None,
+                    parse_workers: Optional[int] = None,
+                    on_progress: Callable[[Progress], None] = None,
+                    on_sequence: Callable[[int, str], None] = None) -> List[Optional[str]]:
+    """
+    Synchronous wrapper of fetch_sequences_async, it runs its own event loop so it can be called from any thread.
+    """
+    return asyncio.run(fetch_sequences_async(requests_list, max_in_flight, on_error, parse_workers, on_progress,
+                                             on_sequence))
@@ -0,0 +1,108 @@
+"""
+Usage: python -m app.structure_check <files or directories> ...
+
+Check that the scanners of app.structure_parser read the same residues as BioPython on a corpus of
+PDB and mmCIF files, such as the PDB cache directory of the query command.
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from app.protein_sequences import StructureIndex, parse_structure
+from app.structure_parser import scan_mmcif_residues, scan_pdb_residues
+
+
+def structure_file_type(path: str) -> Optional[str]:
+    """
+    The file type of a structure file, 'pdb' or 'cif', from its name, possibly gzip-compressed.
+    :return: The file type, None if the file is not a structure file
+    """
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if name.endswith(".pdb") or name.endswith(".ent"):
+        return 'pdb'
+    if name.endswith(".cif"):
+        return 'cif'
+    return None
+
+
+def read_structure_file(path: str) -> str:
+    if path.lower().endswith(".gz"):
+        with gzip.open(path, "rt") as file:
+            return file.read()
+    with open(path, "r") as file:
+        return file.read()
+
+
+def list_structure_files(paths: List[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names))
+        else:
+            files.append(path)
+    return [file for file in files if structure_file_type(file) is not None]
+
+
+def check_structure_file(path: str) -> Tuple[str, List[str], float, float]:
+    """
+    Index a structure file with the scanners and with BioPython.
+    :return: The result, 'same', 'different', 'unsupported' when the scanners leave the file to BioPython or
+    'invalid' when BioPython can't parse it either, the chains that differ, the scan time and the BioPython time
+    """
+    file_type = structure_file_type(path)
+    text = read_structure_file(path)
+    pdb_id = os.path.basename(path).split(".")[0]
+    start = time.perf_counter()
+    try:
+        if file_type == 'cif':
+            index = StructureIndex(scan_mmcif_residues(text))
+        else:
+            index = StructureIndex(*scan_pdb_residues(text))
+    except (ValueError, IndexError):
+        index = None
+    scan_time = time.perf_counter() - start
+    start = time.perf_counter()
+    try:
+        reference = StructureIndex.from_structure(parse_structure(pdb_id, file_type, text), file_type)
+    except Exception:
+        return 'invalid', [], scan_time, time.perf_counter() - start
+    biopython_time = time.perf_counter() - start
+    if index is None:
+        return 'unsupported', [], scan_time, biopython_time
+    differences = index.differences(reference)
+    return 'different' if differences else 'same', differences, scan_time, biopython_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the fast PDB and mmCIF scanners against BioPython.")
+    parser.add_argument('paths', help='Structure files or directories', type=str, nargs='+')
+    args = parser.parse_args()
+    files = list_structure_files(args.paths)
+    if not files:
+        raise ValueError("Error: no PDB or mmCIF file found.")
+    counts = {'same': 0, 'different': 0, 'unsupported': 0, 'invalid': 0}
+    scan_total = biopython_total = 0
+    for path in files:
+        result, differences, scan_time, biopython_time = check_structure_file(path)
+        counts[result] += 1
+        if result != 'same':
+            print(f"{path}: {result}" + (f" ({', '.join(differences)})" if differences else ""))
+        if result in ['same', 'different']:
+            scan_total += scan_time
+            biopython_total += biopython_time
+    print(f"{len(files)} files: {counts['same']} same, {counts['different']} different, "
+          f"{counts['unsupported']} left to BioPython, {counts['invalid']} not parsed by BioPython")
+    if scan_total > 0:
+        print(f"Scanners {scan_total:.2f}s, BioPython {biopython_total:.2f}s ({biopython_total / scan_total:.1f}x)")
+    if counts['different']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
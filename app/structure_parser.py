@@ -0,0 +1,280 @@
+"""
+Fast extraction of the residues of PDB and mmCIF files.
+Only the fields giving the residue names and numbers are read, no atom, coordinate or disorder is built,
+and the residues are the ones PDBParser and MMCIFParser would give. The files these functions can't
+read exactly as BioPython does raise a ValueError, they are then parsed with BioPython.
+"""
+import itertools
+import re
+from typing import Dict, List, Optional, Tuple
+
+# (residue number, insertion code, residue name), the insertion code is ' ' when there is none
+ResidueRecord = Tuple[int, str, str]
+# (chain id, residue number, insertion code or None, residue name) of a REMARK 465 record
+MissingResidue = Tuple[str, int, Optional[str], str]
+# For every model, the residue records of every chain in file order
+Models = List[Dict[str, List[ResidueRecord]]]
+
+# The REMARK 465 record pattern of Bio.PDB.parse_pdb_header
+REMARK_465_PATTERN = re.compile(
+    r"""
+    (\d+\s[\sA-Z][\sA-Z][A-Z] |   # Either model number + residue name
+        [A-Z]{1,3})               # Or only residue name with 1 (RNA) to 3 letters
+    \s ([A-Za-z0-9])              # A single character chain
+    \s+(-?\d+[A-Za-z]?)$          # Residue number: A digit followed by an optional insertion code
+    """,
+    re.VERBOSE,
+)
+
+# The _atom_site columns MMCIFParser requires, the file is left to it when one of them is missing
+ATOM_SITE_COLUMNS = ["id", "label_atom_id", "label_comp_id", "auth_asym_id", "Cartn_x", "Cartn_y", "Cartn_z",
+                     "label_alt_id", "pdbx_PDB_ins_code", "B_iso_or_equiv", "occupancy", "group_PDB",
+                     "pdbx_PDB_model_num"]
+
+
+class _ModelBuilder:
+    """
+    The residues of the chains of a model, added as Bio.PDB.StructureBuilder adds them.
+    """
+
+    def __init__(self, permissive: bool = False):
+        """
+        :param permissive: Ignore the hetero residues defined twice, as PDBParser does, instead of raising
+        """
+        self.permissive = permissive
+        self.chains: Dict[str, List[ResidueRecord]] = {}
+        self.residue_names: Dict[str, Dict[Tuple[str, int, str], str]] = {}
+
+    def add_residue(self, chain_id: str, hetero_flag: str, number: int, insertion: str, name: str):
+        if hetero_flag == "H":
+            hetero_flag = "H_" + name
+        residue_id = (hetero_flag, number, insertion)
+        names = self.residue_names.setdefault(chain_id, {})
+        residues = self.chains.setdefault(chain_id, [])
+        if residue_id in names:
+            if hetero_flag == " " and names[residue_id] == name:
+                # The residue goes on after other residues, BioPython adds the atoms to the first one
+                return
+            if hetero_flag != " " and self.permissive:
+                return
+            raise ValueError(f"Error: residue {residue_id} of chain {chain_id} is defined twice.")
+        names[residue_id] = name
+        residues.append((number, insertion, name))
+
+
+def scan_pdb_residues(text: str) -> Tuple[Models, List[MissingResidue]]:
+    """
+    Read the residues of the ATOM and HETATM records and the REMARK 465 records of a PDB file.
+    :return: The residues of every chain of every model, and the missing residues
+    :raise ValueError: If the file can't be read exactly as PDBParser reads it
+    """
+    if not text:
+        raise ValueError("Error: empty file.")
+    # The lines as PDBParser reads them
+    lines = text.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    # The header ends at the first coordinate record, the last line is never part of it
+    header_end = len(lines) - 1
+    for i, line in enumerate(lines):
+        if line[0:6] in ("ATOM  ", "HETATM", "MODEL "):
+            header_end = i
+            break
+    missing_residues = []
+    for line in lines[:header_end]:
+        if not line.startswith("REMARK 465"):
+            continue
+        match = REMARK_465_PATTERN.match(line.rstrip()[10:].strip())
+        if match is None:
+            continue
+        name = match.group(1).split()[-1]
+        number = match.group(3)
+        insertion = None
+        if number[-1].isalpha():
+            number, insertion = number[:-1], number[-1]
+        missing_residues.append((match.group(2), int(number), insertion, name))
+
+    models: Models = []
+    model = None
+    current_chain_id = None
+    current_residue = None
+    current_fields = None
+    for line in lines[header_end:]:
+        record_type = line[0:6]
+        if record_type == "ATOM  " or record_type == "HETATM":
+            if model is None:
+                model = _ModelBuilder(permissive=True)
+                models.append(model.chains)
+            # Residue name, chain, number and insertion code, the atoms of a residue share them
+            fields = line[17:27]
+            if fields == current_fields and record_type == current_residue[0]:
+                continue
+            current_fields = fields
+            name = line[17:20].strip()
+            chain_id = line[21]
+            number = int(line[22:26].split()[0])
+            insertion = line[26]
+            if record_type == "HETATM":
+                hetero_flag = "W" if name == "HOH" or name == "WAT" else "H"
+            else:
+                hetero_flag = " "
+            residue = (record_type, hetero_flag, number, insertion, name)
+            if chain_id != current_chain_id or residue[1:] != current_residue[1:]:
+                current_chain_id = chain_id
+                model.add_residue(chain_id, hetero_flag, number, insertion, name)
+            current_residue = residue
+        elif record_type == "MODEL ":
+            model = _ModelBuilder(permissive=True)
+            models.append(model.chains)
+            current_chain_id = current_residue = current_fields = None
+        elif record_type == "ENDMDL":
+            model = None
+            current_chain_id = current_residue = current_fields = None
+        elif record_type == "END   " or record_type == "CONECT":
+            break
+    return models, missing_residues
+
+
+def split_cif_line(line: str) -> List[str]:
+    """
+    Split a line of a mmCIF file into its values, as Bio.PDB.MMCIF2Dict splits it.
+    """
+    if "'" not in line and '"' not in line and "#" not in line:
+        return line.split()
+    values = []
+    in_value = False
+    quote = None
+    start = 0
+    for i, char in enumerate(line):
+        if char == " " or char == "\t":
+            if in_value and not quote:
+                in_value = False
+                values.append(line[start:i])
+        elif char == "'" or char == '"':
+            if not quote and not in_value:
+                quote = char
+                in_value = True
+                start = i + 1
+            elif char == quote and (i + 1 == len(line) or line[i + 1] in " \t"):
+                quote = None
+                in_value = False
+                values.append(line[start:i])
+        elif char == "#" and not in_value:
+            return values
+        elif not in_value:
+            in_value = True
+            start = i
+    if quote:
+        raise ValueError("Error: line ended with quote open.")
+    if in_value:
+        values.append(line[start:])
+    return values
+
+
+def scan_mmcif_residues(text: str) -> Models:
+    """
+    Read the residues of the _atom_site loop of a mmCIF file.
+    :return: The residues of every chain of every model
+    :raise ValueError: If the file can't be read exactly as MMCIFParser reads it
+    """
+    lines = iter(text.split("\n"))
+    columns: List[str] = []
+    in_loop = False
+    first_row = None
+    for line in lines:
+        if line.startswith(";"):
+            # A text field, it may contain anything up to the line starting with a semicolon
+            for text_line in lines:
+                if text_line.startswith(";"):
+                    break
+            continue
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.lower() == "loop_":
+            in_loop = True
+            columns = []
+        elif in_loop and line.startswith("_atom_site.") and len(line.split()) == 1:
+            columns.append(line[len("_atom_site."):])
+        elif columns:
+            first_row = line
+            break
+        elif not line.startswith("_"):
+            in_loop = False
+    if first_row is None:
+        raise ValueError("Error: no _atom_site loop.")
+    if any(column not in columns for column in ATOM_SITE_COLUMNS):
+        raise ValueError("Error: missing _atom_site columns.")
+    seq_column = "auth_seq_id" if "auth_seq_id" in columns else "label_seq_id"
+    if seq_column not in columns:
+        raise ValueError("Error: missing _atom_site columns.")
+    group = columns.index("group_PDB")
+    name_column = columns.index("label_comp_id")
+    chain = columns.index("auth_asym_id")
+    seq = columns.index(seq_column)
+    insertion_column = columns.index("pdbx_PDB_ins_code")
+    model_column = columns.index("pdbx_PDB_model_num")
+    count = len(columns)
+
+    models: Models = []
+    model = None
+    current_serial = None
+    current_chain_id = None
+    current_residue = None
+
+    def add_row(row: List[str]):
+        nonlocal model, current_serial, current_chain_id, current_residue
+        if row[seq] == ".":
+            # MMCIFParser skips the atoms without residue number
+            return
+        number = int(row[seq])
+        insertion = row[insertion_column]
+        if insertion == "?" or insertion == ".":
+            insertion = " "
+        name = row[name_column]
+        if row[group] == "HETATM":
+            hetero_flag = "W" if name == "HOH" or name == "WAT" else "H"
+        else:
+            hetero_flag = " "
+        serial = int(row[model_column])
+        if serial != current_serial:
+            current_serial = serial
+            model = _ModelBuilder()
+            models.append(model.chains)
+            current_chain_id = current_residue = None
+        chain_id = row[chain]
+        if chain_id != current_chain_id:
+            current_chain_id = chain_id
+            current_residue = None
+        residue = (hetero_flag, number, insertion, name)
+        if residue != current_residue:
+            current_residue = residue
+            model.add_residue(chain_id, hetero_flag, number, insertion, name)
+
+    # The values of a row are usually on a line of their own, the loop ends with the next key or loop
+    values: List[str] = []
+    for line in itertools.chain([first_row], lines):
+        if line.startswith(";"):
+            raise ValueError("Error: text field in the _atom_site loop.")
+        if line.startswith("#"):
+            continue
+        tokens = split_cif_line(line.strip())
+        if not tokens:
+            continue
+        if not values and (tokens[0].startswith("_") or tokens[0].lower() == "loop_"):
+            break
+        if "loop_" in line.lower() and any(token.lower() == "loop_" for token in tokens):
+            raise ValueError("Error: unexpected loop in the _atom_site loop.")
+        if not values and len(tokens) == count:
+            add_row(tokens)
+            continue
+        for token in tokens:
+            if not values and token.startswith("_"):
+                raise ValueError("Error: unexpected key in the _atom_site loop.")
+            values.append(token)
+            if len(values) == count:
+                add_row(values)
+                values = []
+    if values:
+        raise ValueError("Error: incomplete _atom_site row.")
+    return models
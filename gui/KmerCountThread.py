@@ -1,24 +1,59 @@
 from PyQt6.QtCore import QThread, pyqtSignal
 
-from app.controller import run_kmer_count
+from app.controller import run_kmer_count, run_kmer_sweep
 
 
 class KmerCountThread(QThread):
     finished = pyqtSignal()
     error = pyqtSignal(str)
 
-    def __init__(self, csv_file, kmer_size, output_file):
+    def __init__(self, csv_file, kmer_size, output_file, output_format, workers, incremental, alphabet=None,
+                 hash_width=None, min_df=None, top_n=None, scratch_dir=None, jobs=1):
         QThread.__init__(self)
         self.csv_file = csv_file
         self.kmer_size = kmer_size
         self.output_file = output_file
+        self.output_format = output_format
+        self.workers = workers
+        self.incremental = incremental
+        self.alphabet = alphabet
+        self.hash_width = hash_width
+        self.min_df = min_df
+        self.top_n = top_n
+        self.scratch_dir = scratch_dir
+        self.jobs = jobs
 
     def run(self):
         try:
+            if len(self.kmer_size) > 1:
+                run_kmer_sweep(
+                    self.csv_file,
+                    self.kmer_size,
+                    self.output_file,
+                    self.output_format,
+                    self.workers,
+                    self.incremental,
+                    self.alphabet,
+                    self.hash_width,
+                    self.min_df,
+                    self.top_n,
+                    self.scratch_dir,
+                    self.jobs,
+                )
+                self.finished.emit()
+                return
             run_kmer_count(
                 self.csv_file,
-                self.kmer_size,
+                self.kmer_size[0],
                 self.output_file,
+                self.output_format,
+                self.workers,
+                self.incremental,
+                self.alphabet,
+                self.hash_width,
+                self.min_df,
+                self.top_n,
+                self.scratch_dir,
             )
             self.finished.emit()
         except Exception as e:
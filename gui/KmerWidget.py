@@ -2,8 +2,9 @@ import os
 
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import QWidget, QLabel, QVBoxLayout, QFormLayout, QLineEdit, QProgressBar, QPushButton, \
-    QMessageBox, QFileDialog, QStyle, QHBoxLayout
+    QMessageBox, QFileDialog, QStyle, QHBoxLayout, QComboBox, QCheckBox
 
+from app.kmer_vector import REDUCED_ALPHABETS
 from gui.KmerCountThread import KmerCountThread
 
 
@@ -38,6 +39,7 @@ class KmerCountWidget(QWidget):
 
         # Kmer size
         self.kmer_size_edit = QLineEdit()
+        self.kmer_size_edit.setPlaceholderText("3 or 1,2,3")
         layout.addRow("K*", self.kmer_size_edit)
 
         # Output file
@@ -53,6 +55,44 @@ class KmerCountWidget(QWidget):
         output_layout.setStretch(1, 1)
         layout.addRow("Output file", output_layout)
 
+        # Output format
+        self.format_menu = QComboBox()
+        self.format_menu.addItems(["Csv", "Sparse", "Sqlite", "Blocks", "Memmap"])
+        layout.addRow("Format", self.format_menu)
+
+        # Workers
+        self.workers_edit = QLineEdit()
+        self.workers_edit.setPlaceholderText("1")
+        layout.addRow("Workers", self.workers_edit)
+
+        # Incremental
+        self.incremental_checkbox = QCheckBox()
+        layout.addRow("Incremental", self.incremental_checkbox)
+
+        # Alphabet
+        self.alphabet_menu = QComboBox()
+        self.alphabet_menu.addItems(["Standard"] + [alphabet.capitalize() for alphabet in REDUCED_ALPHABETS])
+        layout.addRow("Alphabet", self.alphabet_menu)
+
+        # Hash width
+        self.hash_width_edit = QLineEdit()
+        layout.addRow("Hash width", self.hash_width_edit)
+
+        # Document frequency selection
+        self.min_df_edit = QLineEdit()
+        layout.addRow("Min df", self.min_df_edit)
+        self.top_n_edit = QLineEdit()
+        layout.addRow("Top n", self.top_n_edit)
+
+        # Jobs, the number of kmer lengths counted at the same time
+        self.jobs_edit = QLineEdit()
+        self.jobs_edit.setPlaceholderText("1")
+        layout.addRow("Jobs", self.jobs_edit)
+
+        # Scratch directory
+        self.scratch_dir_edit = QLineEdit()
+        layout.addRow("Scratch directory", self.scratch_dir_edit)
+
         # Run button
         self.progress_bar = QProgressBar()
         self.progress_bar.hide()
@@ -77,8 +117,17 @@ class KmerCountWidget(QWidget):
             self.set_widget_enabled(False)
             self.thread = KmerCountThread(
                 csv_file,
-                int(kmer_size),
-                self.output_file_edit.text()
+                [int(k) for k in kmer_size.split(",")],
+                self.output_file_edit.text(),
+                self.format_menu.currentText().lower(),
+                int(self.workers_edit.text()) if self.workers_edit.text() else 1,
+                self.incremental_checkbox.isChecked(),
+                None if self.alphabet_menu.currentText() == "Standard" else self.alphabet_menu.currentText().lower(),
+                int(self.hash_width_edit.text()) if self.hash_width_edit.text() else None,
+                int(self.min_df_edit.text()) if self.min_df_edit.text() else None,
+                int(self.top_n_edit.text()) if self.top_n_edit.text() else None,
+                self.scratch_dir_edit.text() if self.scratch_dir_edit.text() else None,
+                int(self.jobs_edit.text()) if self.jobs_edit.text() else 1
             )
             self.thread.finished.connect(self.on_kmer_count_finished)
             self.thread.error.connect(self.on_kmer_count_error)
@@ -97,6 +146,11 @@ class KmerCountWidget(QWidget):
         self.kmer_size_edit.clear()
         self.csv_file_edit.clear()
         self.output_file_edit.clear()
+        self.workers_edit.clear()
+        self.hash_width_edit.clear()
+        self.min_df_edit.clear()
+        self.top_n_edit.clear()
+        self.jobs_edit.clear()
 
     def on_kmer_count_error(self, exc):
         self.on_kmer_count_end("Error", str(exc), False)
@@ -109,6 +163,15 @@ class KmerCountWidget(QWidget):
         self.output_file_edit.setEnabled(enabled)
         self.csv_file_button.setEnabled(enabled)
         self.kmer_size_edit.setEnabled(enabled)
+        self.format_menu.setEnabled(enabled)
+        self.workers_edit.setEnabled(enabled)
+        self.incremental_checkbox.setEnabled(enabled)
+        self.alphabet_menu.setEnabled(enabled)
+        self.hash_width_edit.setEnabled(enabled)
+        self.min_df_edit.setEnabled(enabled)
+        self.top_n_edit.setEnabled(enabled)
+        self.jobs_edit.setEnabled(enabled)
+        self.scratch_dir_edit.setEnabled(enabled)
         self.run_button.setEnabled(enabled)
         if self.parent_widget:
             for child_widget in self.parent_widget.findChildren(QPushButton):
@@ -126,7 +189,17 @@ class KmerCountWidget(QWidget):
         self.csv_file_edit.setText(str(response[0]))
 
     def get_save_file_name(self):
-        file_filter = 'Kmer file (*.csv)'
+        match self.format_menu.currentText():
+            case "Sparse":
+                file_filter = 'Kmer file (*.npz)'
+            case "Sqlite":
+                file_filter = 'Kmer database (*.db)'
+            case "Blocks":
+                file_filter = 'Kmer blocks (*.blocks)'
+            case "Memmap":
+                file_filter = 'Kmer matrix (*.kmat)'
+            case _:
+                file_filter = 'Kmer file (*.csv)'
         response = QFileDialog.getSaveFileName(
             parent=self,
             caption='Select an output file',
@@ -6,7 +6,8 @@ class ModelsThread(QtCore.QThread):
     finished = QtCore.pyqtSignal()
     error = QtCore.pyqtSignal(str)
 
-    def __init__(self, path, level, method, k, max_sample_size_per_level, random_state):
+    def __init__(self, path, level, method, k, max_sample_size_per_level, random_state, alphabet=None,
+                 hash_width=None, vocabulary=None):
         QtCore.QThread.__init__(self)
         self.path = path
         self.level = level
@@ -14,6 +15,9 @@ class ModelsThread(QtCore.QThread):
         self.max_sample_size_per_level = max_sample_size_per_level
         self.k = k
         self.random_state = random_state
+        self.alphabet = alphabet
+        self.hash_width = hash_width
+        self.vocabulary = vocabulary
 
     def run(self):
         try:
@@ -23,7 +27,10 @@ class ModelsThread(QtCore.QThread):
                 self.method,
                 self.max_sample_size_per_level,
                 self.k,
-                self.random_state
+                self.random_state,
+                self.alphabet,
+                self.hash_width,
+                self.vocabulary
             )
             self.finished.emit()
         except Exception as e:
@@ -4,6 +4,7 @@ import sys
 from PyQt6 import QtWidgets, QtGui, QtCore
 from PyQt6.QtWidgets import QFileDialog, QMessageBox
 
+from app.kmer_vector import REDUCED_ALPHABETS
 from gui.ModelsThread import ModelsThread
 
 
@@ -35,10 +36,17 @@ class ModelsWidget(QtWidgets.QWidget):
         self.csv_file_edit.setReadOnly(True)
         self.csv_file_button = QtWidgets.QPushButton()
         self.csv_file_button.setIcon(self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_DirIcon))
+        self.csv_file_button.setToolTip("Select a .csv, .npz or .db file")
         self.csv_file_button.clicked.connect(self.get_file_name)
+        # The .blocks and .kmat outputs are directories
+        self.kmer_dir_button = QtWidgets.QPushButton()
+        self.kmer_dir_button.setIcon(self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_DirOpenIcon))
+        self.kmer_dir_button.setToolTip("Select a .blocks or .kmat directory")
+        self.kmer_dir_button.clicked.connect(self.get_kmer_directory)
         csv_layout = QtWidgets.QHBoxLayout()
         csv_layout.addWidget(self.csv_file_edit)
         csv_layout.addWidget(self.csv_file_button)
+        csv_layout.addWidget(self.kmer_dir_button)
         csv_layout.setStretch(0, 5)
         csv_layout.setStretch(1, 1)
         form_layout.addRow("Csv file*", csv_layout)
@@ -67,6 +75,32 @@ class ModelsWidget(QtWidgets.QWidget):
         self.random_state_edit.setPlaceholderText("42")
         form_layout.addRow("Random state", self.random_state_edit)
 
+        # Alphabet
+        self.alphabet_menu = QtWidgets.QComboBox()
+        self.alphabet_menu.addItems(["Standard"] + [alphabet.capitalize() for alphabet in REDUCED_ALPHABETS])
+        self.alphabet_menu.setToolTip("Fold the standard kmer columns of the file, for long kmers count them with "
+                                      "a reduced alphabet in the Kmer tab instead")
+        form_layout.addRow("Alphabet", self.alphabet_menu)
+
+        # Hash width
+        self.hash_width_edit = QtWidgets.QLineEdit()
+        self.hash_width_edit.setToolTip("Fold the standard kmer columns of the file, for long kmers count them with "
+                                        "a hash width in the Kmer tab instead")
+        form_layout.addRow("Hash width", self.hash_width_edit)
+
+        # Vocabulary
+        self.vocabulary_edit = QtWidgets.QLineEdit()
+        self.vocabulary_edit.setReadOnly(True)
+        self.vocabulary_button = QtWidgets.QPushButton()
+        self.vocabulary_button.setIcon(self.style().standardIcon(QtWidgets.QStyle.StandardPixmap.SP_DirIcon))
+        self.vocabulary_button.clicked.connect(self.get_vocabulary_file_name)
+        vocabulary_layout = QtWidgets.QHBoxLayout()
+        vocabulary_layout.addWidget(self.vocabulary_edit)
+        vocabulary_layout.addWidget(self.vocabulary_button)
+        vocabulary_layout.setStretch(0, 5)
+        vocabulary_layout.setStretch(1, 1)
+        form_layout.addRow("Vocabulary", vocabulary_layout)
+
         layout = QtWidgets.QVBoxLayout()
         self.setLayout(layout)
         self.button = QtWidgets.QPushButton("Start")
@@ -93,7 +127,10 @@ class ModelsWidget(QtWidgets.QWidget):
                 self.method_menu.currentText().lower(),
                 int(self.k_edit.text()),
                 int(self.max_samples_edit.text()) if self.max_samples_edit.text() else 5,
-                int(self.random_state_edit.text()) if self.random_state_edit.text() else 42
+                int(self.random_state_edit.text()) if self.random_state_edit.text() else 42,
+                None if self.alphabet_menu.currentText() == "Standard" else self.alphabet_menu.currentText().lower(),
+                int(self.hash_width_edit.text()) if self.hash_width_edit.text() else None,
+                self.vocabulary_edit.text() if self.vocabulary_edit.text() else None
             )
             self.set_widget_enabled(False)
             self.thread.finished.connect(self.on_models_finished)
@@ -115,23 +152,46 @@ class ModelsWidget(QtWidgets.QWidget):
         QMessageBox.critical(self, "Error", exc)
 
     def set_widget_enabled(self, enabled):
-        for child in [self.csv_file_button, self.csv_file_edit, self.level_menu, self.method_menu, self.k_edit,
-                      self.max_samples_edit, self.random_state_edit, self.button]:
+        for child in [self.csv_file_button, self.kmer_dir_button, self.csv_file_edit, self.level_menu,
+                      self.method_menu, self.k_edit, self.max_samples_edit, self.random_state_edit,
+                      self.alphabet_menu, self.hash_width_edit, self.vocabulary_edit, self.vocabulary_button,
+                      self.button]:
             child.setEnabled(enabled)
         if self.parent:
             self.parent.set_enabled_toolbar(enabled)
 
     def get_file_name(self):
-        file_filter = 'Data File (*.csv)'
+        file_filter = 'Data File (*.csv *.npz *.db)'
         response = QFileDialog.getOpenFileName(
             parent=self,
             caption='Select a file',
             directory=os.getcwd(),
-            filter=file_filter,
-            initialFilter='Excel File (*.xlsx *.xls)'
+            filter=file_filter
         )
         self.csv_file_edit.setText(str(response[0]))
 
+    def get_kmer_directory(self):
+        directory = QFileDialog.getExistingDirectory(
+            parent=self,
+            caption='Select a .blocks or .kmat directory',
+            directory=os.getcwd()
+        )
+        if not directory:
+            return
+        if not directory.rstrip("/\\").endswith((".blocks", ".kmat")):
+            QMessageBox.critical(self, "Error", "The directory must be a .blocks or .kmat output of the kmer command")
+            return
+        self.csv_file_edit.setText(directory)
+
+    def get_vocabulary_file_name(self):
+        response = QFileDialog.getOpenFileName(
+            parent=self,
+            caption='Select a vocabulary',
+            directory=os.getcwd(),
+            filter='Kmer vocabulary (*.vocab)'
+        )
+        self.vocabulary_edit.setText(str(response[0]))
+
     def normal_output_written(self, text):
         cursor = self.textEdit.textCursor()
         cursor.movePosition(QtGui.QTextCursor.MoveOperation.End)
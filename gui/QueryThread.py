@@ -1,18 +1,25 @@
 from PyQt6.QtCore import QThread, pyqtSignal
 
 from app.controller import run_repeatsdb_query
+from app.sequence_fetcher import format_progress
 
 
 class QueryThread(QThread):
     finished = pyqtSignal()
     error = pyqtSignal(str)
+    # Sequences done, total and the progress text
+    progress = pyqtSignal(int, int, str)
 
-    def __init__(self, query_classes, output_text, merge_regions, value):
+    def __init__(self, query_classes, output_text, merge_regions, value, cache=True, parse_workers=None,
+                 resume=False):
         QThread.__init__(self)
         self.query_classes = query_classes
         self.output_text = output_text
         self.merge_regions = merge_regions
         self.value = value
+        self.cache = cache
+        self.parse_workers = parse_workers
+        self.resume = resume
 
     def run(self):
         try:
@@ -20,7 +27,11 @@ class QueryThread(QThread):
                 self.query_classes,
                 self.output_text if self.output_text else "output",
                 self.merge_regions,
-                self.value
+                self.value,
+                self.cache,
+                parse_workers=self.parse_workers,
+                on_progress=lambda p: self.progress.emit(p.done, p.total, format_progress(p)),
+                resume=self.resume
             )
             self.finished.emit()
         except Exception as e:
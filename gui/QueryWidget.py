@@ -50,14 +50,29 @@ class QueryWidget(QWidget):
 
         # Number of threads
         self.n_threads_line_edit = QLineEdit()
-        self.n_threads_line_edit.setPlaceholderText("5")
+        self.n_threads_line_edit.setPlaceholderText("32")
         layout.addRow("Number of threads", self.n_threads_line_edit)
 
+        # Number of parse workers
+        self.parse_workers_line_edit = QLineEdit()
+        self.parse_workers_line_edit.setPlaceholderText(str(os.cpu_count() or 1))
+        layout.addRow("Parse workers", self.parse_workers_line_edit)
+
         # Merge regions
         self.merge_regions = QCheckBox()
         self.merge_regions.setChecked(True)
         layout.addRow("Merge regions", self.merge_regions)
 
+        # PDB cache
+        self.cache_checkbox = QCheckBox()
+        self.cache_checkbox.setChecked(True)
+        layout.addRow("PDB cache", self.cache_checkbox)
+
+        # Resume an interrupted query
+        self.resume_checkbox = QCheckBox()
+        self.resume_checkbox.setChecked(False)
+        layout.addRow("Resume", self.resume_checkbox)
+
         # Run button
         self.progress_bar = QProgressBar()
         self.progress_bar.hide()
@@ -86,10 +101,14 @@ class QueryWidget(QWidget):
                 classes,
                 self.output_line_edit.text() if self.output_line_edit.text() else "output",
                 self.merge_regions.isChecked(),
-                int(self.n_threads_line_edit.text()) if self.n_threads_line_edit.text() else 5
+                int(self.n_threads_line_edit.text()) if self.n_threads_line_edit.text() else 32,
+                self.cache_checkbox.isChecked(),
+                int(self.parse_workers_line_edit.text()) if self.parse_workers_line_edit.text() else None,
+                self.resume_checkbox.isChecked()
             )
             self.thread.finished.connect(self.on_query_finished)
             self.thread.error.connect(self.on_query_error)
+            self.thread.progress.connect(self.on_query_progress)
             self.thread.start()
         except ValueError as e:
             QMessageBox.critical(self, "Error", str(e))
@@ -100,6 +119,7 @@ class QueryWidget(QWidget):
         else:
             QMessageBox.critical(self, title, message)
         self.progress_bar.hide()
+        self.progress_bar.setFormat("%p%")
         self.set_widget_enabled(True)
         self.thread = None
         self.class_2.setChecked(False)
@@ -108,6 +128,12 @@ class QueryWidget(QWidget):
         self.class_5.setChecked(False)
         self.output_line_edit.clear()
         self.n_threads_line_edit.clear()
+        self.parse_workers_line_edit.clear()
+
+    def on_query_progress(self, done, total, text):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+        self.progress_bar.setFormat(text)
 
     def on_query_error(self, message):
         self.on_query_end("Error", message, False)
@@ -122,8 +148,11 @@ class QueryWidget(QWidget):
         self.class_5.setEnabled(enabled)
         self.output_line_edit.setEnabled(enabled)
         self.merge_regions.setEnabled(enabled)
+        self.cache_checkbox.setEnabled(enabled)
+        self.resume_checkbox.setEnabled(enabled)
         self.run_button.setEnabled(enabled)
         self.n_threads_line_edit.setEnabled(enabled)
+        self.parse_workers_line_edit.setEnabled(enabled)
 
         if self.parent_widget:
             for child_widget in self.parent_widget.findChildren(QPushButton):
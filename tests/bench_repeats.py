@@ -0,0 +1,49 @@
+"""
+Usage: python -m tests.bench_repeats [--regions N] [--seed S]
+
+Time the RepeatsDB region preprocessing of app.repeats against the iterrows and concat implementation it replaced,
+on a generated search response, and check that both give the same output.
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from app import repeats
+from tests import legacy_repeats
+from tests.test_repeats import random_response
+
+
+def prepared_frame(response):
+    df = pd.DataFrame(response).drop(repeats.columns_to_ignore, axis=1)
+    df = df.astype({"start": int, "end": int, "region_units_num": int, "region_average_unit_length": float})
+    return df.astype({col: str for col in df.columns.difference(["start", "end", "region_units_num",
+                                                                 "region_average_unit_length"])})
+
+
+def timed(function, df):
+    start = time.perf_counter()
+    result = function(df)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the RepeatsDB region preprocessing.")
+    parser.add_argument('--regions', help='Number of regions of the response (default: 20000)', type=int,
+                        default=20000)
+    parser.add_argument('--seed', help='Seed of the generated response (default: 0)', type=int, default=0)
+    args = parser.parse_args()
+    df = prepared_frame(random_response(args.regions, args.seed))
+    print(f"{args.regions} regions, {len(df)} units")
+    cleaned, _ = timed(repeats.remove_rows_with_errors, df)
+    for name, frame in [("remove_rows_with_errors", df), ("integrate_regions", cleaned),
+                        ("differentiate_units_ids", cleaned)]:
+        expected, legacy_time = timed(getattr(legacy_repeats, name), frame)
+        result, new_time = timed(getattr(repeats, name), frame)
+        if result.to_csv() != expected.to_csv():
+            raise ValueError(f"Error: {name} differs from the legacy implementation.")
+        print(f"{name}: {legacy_time:.2f}s -> {new_time:.2f}s ({legacy_time / max(new_time, 1e-9):.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
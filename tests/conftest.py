@@ -0,0 +1,16 @@
+import pytest
+
+from app import api
+
+
+@pytest.fixture
+def clean_api(monkeypatch):
+    """
+    Run a test with no cache, mirror, limiter or HTTP session set in app.api, and restore them after it.
+    """
+    for name in ["pdb_cache", "repeatsdb_cache", "pdb_mirror", "download_limiter", "_session"]:
+        monkeypatch.setattr(api, name, None)
+    monkeypatch.setattr(api, "_timeout", api.DEFAULT_TIMEOUT)
+    yield api
+    if api._session is not None:
+        api._session.close()
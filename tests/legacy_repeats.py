@@ -0,0 +1,75 @@
+"""
+The RepeatsDB region preprocessing of app.repeats before it was vectorized, kept as the reference of the parity
+tests and of bench_repeats.py.
+"""
+import pandas as pd
+
+
+def differentiate_units_ids(df):
+    output_df = df.copy()
+    counter = -1
+    previous_id = df.iloc[0]["repeatsdb_id"]
+    for index, row in df.iterrows():
+        if previous_id == row["repeatsdb_id"]:
+            counter += 1
+        else:
+            counter = 0
+            previous_id = row["repeatsdb_id"]
+        output_df.at[index, "repeatsdb_id"] = row["repeatsdb_id"] + "_" + str(counter)
+    return output_df
+
+
+def integrate_regions(df):
+    grouped = df.groupby(["region_id"])
+    output_df = pd.DataFrame()
+    difference_columns = df.columns.difference(["region_id", "start", "end", "type"])
+    for region_id, group in grouped:
+        r = region_id[0].split("_")
+        row = {
+            "region_id": region_id[0],
+            "start": r[1],
+            "end": r[2],
+            "type": group["type"].tolist()
+        }
+        for col in difference_columns:
+            row[col] = group[col].iloc[0]
+        output_df = pd.concat([output_df, pd.DataFrame([row])], ignore_index=True)
+    return output_df
+
+
+def remove_rows_with_errors(df):
+    """
+    Remove rows with start > end, and rows with region_id not matching min of starts and max of ends.
+    """
+    output_df = df.copy()
+    # Remove rows with start > end
+    output_df = output_df[~output_df['region_id'].isin(df[df['start'] > df['end']]['region_id'].tolist())]
+    to_remove = set()
+    agg = output_df.groupby('region_id').agg({
+        'start': 'min',
+        'end': 'max',
+        'region_id': 'first'
+    })
+    for _, row in agg.iterrows():
+        split = row['region_id'].split('_')
+        if int(split[1]) != row['start'] or int(split[2]) != row['end']:
+            to_remove.add(row['region_id'])
+    return output_df[~output_df['region_id'].isin(to_remove)]
+
+
+def regions_from_json(json, regions):
+    """
+    The preprocessing of preprocess_from_json before the sequences are fetched.
+    """
+    df = pd.DataFrame(json).drop(["reviewed", "annotator", "origin"], axis=1)
+    df = df.astype({
+        "start": int,
+        "end": int,
+        "region_units_num": int,
+        "region_average_unit_length": float
+    })
+    df = df.astype({
+        col: str for col in df.columns.difference(["start", "end", "region_units_num", "region_average_unit_length"])
+    })
+    df = remove_rows_with_errors(df)
+    return integrate_regions(df) if regions else differentiate_units_ids(df)
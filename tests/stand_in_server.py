@@ -0,0 +1,95 @@
+"""
+A local stand-in for the PDB download server, used by the tests of app.api and app.AdaptiveLimiter.
+"""
+import contextlib
+import http.server
+import threading
+import time
+from typing import Callable
+
+
+class StandInServer:
+    def __init__(self, capacity: int = None, delay: float = 0.0, failures: int = 0, status: int = 429,
+                 body: Callable[[str], bytes] = None, refuse: Callable[[str], bool] = None):
+        """
+        Serve every GET after a delay, like a server that can only take so many requests at once.
+        :param capacity: The max number of requests served at once, the requests above it get the status
+        :param delay: The time in seconds a request is served in
+        :param failures: The number of requests answered with the status before any other is served
+        :param status: The status of the refused requests
+        :param body: The body of the response to a path, "<path>\n" if None
+        :param refuse: Whether the requests to a path always get the status
+        """
+        self.capacity = capacity
+        self.delay = delay
+        self.failures = failures
+        self.status = status
+        self.body = body if body is not None else lambda path: (path + "\n").encode("utf-8")
+        self.refuse = refuse if refuse is not None else lambda path: False
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak_active = 0
+        self.requests = 0
+        self.refused = 0
+        self.served = 0
+
+    def handle(self, handler: http.server.BaseHTTPRequestHandler):
+        with self.lock:
+            self.requests += 1
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            refused = self.failures > 0 or (self.capacity is not None and self.active > self.capacity) or \
+                self.refuse(handler.path)
+            if self.failures > 0:
+                self.failures -= 1
+        try:
+            if refused:
+                body = b""
+                handler.send_response(self.status)
+            else:
+                time.sleep(self.delay)
+                body = self.body(handler.path)
+                handler.send_response(200)
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+        finally:
+            with self.lock:
+                self.active -= 1
+                if refused:
+                    self.refused += 1
+                else:
+                    self.served += 1
+
+
+class _ThreadingServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # The clients connect all at once
+    request_queue_size = 128
+
+
+@contextlib.contextmanager
+def serve(server: StandInServer):
+    """
+    Run the server on a free port of 127.0.0.1 in a thread, a request per thread.
+    :return: The url of the server, ending with '/'
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            server.handle(self)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = _ThreadingServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{httpd.server_address[1]}/"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        thread.join()
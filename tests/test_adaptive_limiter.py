@@ -0,0 +1,210 @@
+import concurrent.futures
+
+import pytest
+import requests
+
+from app import AdaptiveLimiter as limiter_module
+from app.AdaptiveLimiter import AdaptiveLimiter, format_limiter_stats
+from tests.stand_in_server import StandInServer, serve
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(limiter_module, "time", clock)
+    return clock
+
+
+def succeed(limiter, count, latency=0.01, size=100):
+    for _ in range(count):
+        slot = limiter.acquire()
+        slot.size = size
+        slot.latency = latency
+        limiter.release(slot, 1.0)
+
+
+def test_limit_doubles_every_round_in_slow_start():
+    limiter = AdaptiveLimiter(100)
+    assert limiter.limit == 4
+    succeed(limiter, 4)
+    assert limiter.limit == 8
+    succeed(limiter, 8)
+    assert limiter.limit == 16
+
+
+def test_limit_stays_below_max():
+    limiter = AdaptiveLimiter(10, initial_limit=8)
+    succeed(limiter, 8)
+    assert limiter.limit == 10
+    assert limiter.stats()["peak_limit"] == 10
+
+
+def test_limit_halves_once_per_generation():
+    limiter = AdaptiveLimiter(100, initial_limit=16)
+    slots = [limiter.acquire() for _ in range(16)]
+    # The requests in flight when the limit is halved are the same overload
+    for slot in slots:
+        slot.congested = True
+        limiter.release(slot, 1.0)
+    assert limiter.limit == 8
+    assert limiter.threshold == 8
+    assert limiter.decreases == 1
+    assert limiter.congested == 16
+    # A request acquired after the decrease is a new overload
+    slot = limiter.acquire()
+    slot.congested = True
+    limiter.release(slot, 1.0)
+    assert limiter.limit == 4
+    assert limiter.decreases == 2
+
+
+def test_limit_does_not_go_below_one():
+    limiter = AdaptiveLimiter(100, initial_limit=1)
+    for _ in range(3):
+        slot = limiter.acquire()
+        slot.congested = True
+        limiter.release(slot, 1.0)
+    assert limiter.limit == 1
+    assert limiter.decreases == 3
+
+
+def test_limit_grows_by_one_per_round_above_threshold():
+    limiter = AdaptiveLimiter(100, initial_limit=16)
+    slot = limiter.acquire()
+    slot.congested = True
+    limiter.release(slot, 1.0)
+    assert limiter.limit == 8
+    succeed(limiter, 8)
+    assert 8.9 < limiter.limit < 9.0
+    succeed(limiter, 9)
+    assert 9.9 < limiter.limit < 10.0
+
+
+def test_limit_does_not_grow_while_latency_is_high():
+    limiter = AdaptiveLimiter(100, latency_smoothing=0.5)
+    succeed(limiter, 1, latency=0.01)
+    limit = limiter.limit
+    # The moving average goes above twice the lowest latency with the first slow request
+    succeed(limiter, 4, latency=0.1)
+    assert limiter.limit == limit
+    succeed(limiter, 4, latency=0.01)
+    assert limiter.limit > limit
+
+
+def test_hold_time_is_the_latency_of_slots_without_one():
+    limiter = AdaptiveLimiter(100, latency_smoothing=1.0)
+    slot = limiter.acquire()
+    slot.size = 100
+    limiter.release(slot, 0.5)
+    assert limiter.latency == 0.5
+
+
+def test_failed_requests_do_not_change_the_limit():
+    limiter = AdaptiveLimiter(100)
+    slot = limiter.acquire()
+    limiter.release(slot, 1.0)
+    assert limiter.limit == 4
+    assert limiter.requests == 1
+    assert limiter.latency is None
+
+
+def test_fixed_limit_is_only_measured():
+    limiter = AdaptiveLimiter(20, adaptive=False)
+    assert limiter.limit == 20
+    slot = limiter.acquire()
+    slot.congested = True
+    limiter.release(slot, 1.0)
+    succeed(limiter, 20)
+    assert limiter.limit == 20
+    assert limiter.congested == 1
+    assert limiter.decreases == 0
+
+
+def test_slot_marks_request_errors_as_overload():
+    limiter = AdaptiveLimiter(100, initial_limit=8)
+    with pytest.raises(requests.ConnectionError):
+        with limiter.slot():
+            raise requests.ConnectionError()
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+    with pytest.raises(ValueError):
+        with limiter.slot():
+            raise ValueError()
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+
+def test_invalid_max_limit():
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(0)
+
+
+def test_stats(clock):
+    limiter = AdaptiveLimiter(100)
+    slot = limiter.acquire()
+    clock.now = 10.0
+    slot.size = 1000
+    slot.latency = 0.01
+    limiter.release(slot, 10.0)
+    clock.now = 20.0
+    succeed(limiter, 1, size=3000)
+    stats = limiter.stats()
+    # 4 in flight for 10s, then 5 for 10s
+    assert stats == {"requests": 2, "congested": 0, "decreases": 0, "bytes": 4000, "seconds": 20.0, "limit": 6,
+                     "peak_limit": 6, "mean_limit": 4.5}
+    assert format_limiter_stats(stats).startswith("Downloads: 2 requests")
+
+
+def test_stats_before_any_request():
+    stats = AdaptiveLimiter(100).stats()
+    assert stats["requests"] == 0
+    assert stats["mean_limit"] == 4
+    assert format_limiter_stats(stats).startswith("Downloads: 0 requests")
+
+
+def download(api, pdb_ids):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=32) as executor:
+        return list(executor.map(api.pdb_get_request, pdb_ids))
+
+
+@pytest.mark.parametrize("max_in_flight", [32, 64])
+def test_limit_converges_on_an_overloaded_server(clean_api, monkeypatch, max_in_flight):
+    api = clean_api
+    server = StandInServer(capacity=4, delay=0.01)
+    with serve(server) as url:
+        monkeypatch.setattr(api, "PDB_URL", url)
+        api.configure_http_session(pool_size=32, retries=10, backoff_factor=0.01, backoff_jitter=0.01)
+        api.configure_download_limiter(max_in_flight)
+        limiter = api.download_limiter
+        changes = []
+        set_limit = limiter._set_limit
+
+        def record_limit(limit):
+            changes.append((limiter.limit, limit))
+            set_limit(limit)
+
+        monkeypatch.setattr(limiter, "_set_limit", record_limit)
+        pdb_ids = [f"{i:04d}" for i in range(400)]
+        texts = download(api, pdb_ids)
+    # No download is lost, the refused ones are retried
+    assert texts == [f"/{pdb_id}.pdb\n" for pdb_id in pdb_ids]
+    assert server.served == 400
+    stats = limiter.stats()
+    assert stats["requests"] == 400
+    assert server.refused > 0
+    # Every decrease halves the limit, once for all the refused requests in flight at the time
+    decreases = [(old, new) for old, new in changes if new < old]
+    assert len(decreases) == stats["decreases"] > 0
+    assert all(new == max(1.0, old / 2) for old, new in decreases)
+    assert stats["decreases"] < stats["congested"] <= server.refused
+    # The limit ends up around the capacity of the server, far below the max
+    assert stats["limit"] <= 4 * server.capacity
+    assert stats["mean_limit"] <= 3 * server.capacity
@@ -0,0 +1,123 @@
+import contextlib
+import json
+import os
+
+import pandas as pd
+import pytest
+import requests
+
+from app.repeats import fetch_region_sequences
+from tests.stand_in_server import StandInServer, serve
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+QUERY = "reviewed=true&class=3"
+
+
+def read_search_response():
+    with open(os.path.join(FIXTURES, "repeatsdb_search.json"), "rb") as file:
+        return file.read()
+
+
+def test_repeatsdb_get_streams_the_response(clean_api, monkeypatch):
+    api = clean_api
+    response = read_search_response()
+    with serve(StandInServer(body=lambda path: response)) as url:
+        monkeypatch.setattr(api, "REPEATSDB_URL", url)
+        columns = api.repeatsdb_get(QUERY)
+    pd.testing.assert_frame_equal(pd.DataFrame(columns), pd.DataFrame(json.loads(response)))
+
+
+def test_repeatsdb_get_reads_the_cache(clean_api, monkeypatch, tmp_path):
+    api = clean_api
+    response = read_search_response()
+    server = StandInServer(body=lambda path: response)
+    api.configure_repeatsdb_cache(str(tmp_path), ttl=3600)
+    with serve(server) as url:
+        monkeypatch.setattr(api, "REPEATSDB_URL", url)
+        downloaded = api.repeatsdb_get(QUERY)
+        # The same query with its parameters in another order
+        cached = api.repeatsdb_get("class=3&reviewed=true")
+    assert server.requests == 1
+    assert api.repeatsdb_cache.stats() == {"hits": 1, "misses": 1}
+    pd.testing.assert_frame_equal(pd.DataFrame(cached), pd.DataFrame(downloaded))
+
+
+def test_repeatsdb_get_does_not_cache_invalid_responses(clean_api, monkeypatch, tmp_path):
+    api = clean_api
+    response = read_search_response()
+    server = StandInServer(body=lambda path: response[:len(response) // 2])
+    api.configure_repeatsdb_cache(str(tmp_path), ttl=3600)
+    with serve(server) as url:
+        monkeypatch.setattr(api, "REPEATSDB_URL", url)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                api.repeatsdb_get(QUERY)
+    assert server.requests == 2
+    assert os.listdir(tmp_path) == []
+
+
+def read_structure(name):
+    with open(os.path.join(FIXTURES, "structures", name), "rb") as file:
+        return file.read()
+
+
+def structure_server(**kwargs):
+    """
+    A stand-in for the PDB serving the structures of the fixtures, as /<pdb_id>.<file_type>.
+    """
+    return StandInServer(body=lambda path: read_structure(path[1:]), **kwargs)
+
+
+@pytest.fixture
+def pdb_api(clean_api, monkeypatch):
+    """
+    Set app.api to download the PDB files from the stand-in server given to it, with fast retries.
+    """
+
+    @contextlib.contextmanager
+    def serve_pdb(server):
+        with serve(server) as url:
+            monkeypatch.setattr(clean_api, "PDB_URL", url)
+            clean_api.configure_http_session(retries=3, backoff_factor=0.01, backoff_jitter=0.01)
+            yield clean_api
+
+    return serve_pdb
+
+
+def test_transient_errors_are_retried(pdb_api):
+    server = structure_server(failures=2, status=503)
+    with pdb_api(server) as api:
+        assert api.pdb_get_request("1rem") == read_structure("1rem.pdb").decode()
+    assert server.requests == 3
+    assert server.refused == 2
+
+
+def test_persistent_errors_raise(pdb_api):
+    server = structure_server(failures=100, status=503)
+    with pdb_api(server) as api:
+        with pytest.raises(requests.HTTPError) as error:
+            api.pdb_get_request("1rem")
+    assert error.value.response.status_code == 503
+    # The first request and the 3 retries
+    assert server.requests == 4
+
+
+def test_missing_pdb_file_falls_back_to_mmcif(pdb_api):
+    server = structure_server(status=404, refuse=lambda path: path.endswith(".pdb") or path == "/1rem.cif")
+    with pdb_api(server) as api:
+        assert api.structure_get("3cif") == ('cif', read_structure("3cif.cif").decode())
+        assert api.structure_get("1rem") is None
+    assert server.requests == 4
+
+
+def test_regions_with_persistent_errors_are_reported(pdb_api, capsys):
+    server = structure_server(status=503, refuse=lambda path: path.startswith("/2nmr"))
+    df = pd.DataFrame({"region_id": ["1remA_3_9", "2nmrA_1_5", "1remB_0_2"], "pdb_id": ["1rem", "2nmr", "1rem"],
+                       "pdb_chain": ["A", "A", "B"], "start": [3, 1, 0], "end": [9, 5, 2]})
+    with pdb_api(server):
+        sequences = fetch_region_sequences(df, n_threads=2, parse_workers=0)
+    assert sequences == ["ALGSTVXKE", None, "SMA"]
+    assert "Error: could not get the sequence of 2nmrA_1_5: 503" in capsys.readouterr().out
+    # 1rem is downloaded once for both of its regions, 2nmr is retried 3 times
+    assert server.requests == 5
@@ -0,0 +1,87 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from app.json_stream import iter_json_array, json_columns, read_chunks, tee_chunks
+
+TEXTS = [
+    "[]",
+    " [ ] ",
+    "[1]",
+    "[-1.5e-07, 12345678901234567890, 0, -0.0, 3.25E+2]\n",
+    '\n\t[ "a" , "b]\\"c,", "\\u00e9\\ud83d\\ude00", "é" ,true,false , null ]\r\n',
+    "[[1, [2, []]], {}, {\"a\": {\"b\": [1, 2]}}]",
+]
+
+RECORDS = [
+    '[{"region_id": "1a4yA_2_100", "start": -3, "end": 1.5e+2, "reviewed": true, "clan": null}, '
+    '{"region_id": "2bnhA_1_20", "start": 1, "end": 20, "annotator": "curator, \\"me\\"", "units": [1, 2]},\n'
+    ' {"start": 7, "region_id": "3c9cB_7_9", "end": 9e0}]',
+]
+
+
+def split_at_every_offset(text):
+    for offset in range(len(text) + 1):
+        yield [text[:offset], text[offset:]]
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("text", TEXTS + RECORDS)
+def test_iter_json_array_split_at_every_offset(text):
+    expected = json.loads(text)
+    for chunks in split_at_every_offset(text):
+        assert list(iter_json_array(chunks)) == expected, chunks
+
+
+@pytest.mark.parametrize("text", TEXTS + RECORDS)
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_iter_json_array_small_chunks(text, size):
+    assert list(iter_json_array(chunked(text, size))) == json.loads(text)
+
+
+@pytest.mark.parametrize("text", RECORDS)
+def test_json_columns_match_dataframe(text):
+    expected = pd.DataFrame(json.loads(text))
+    for chunks in split_at_every_offset(text):
+        pd.testing.assert_frame_equal(pd.DataFrame(json_columns(iter_json_array(chunks))), expected)
+
+
+@pytest.mark.parametrize("text", ["", "   ", "{}", '"a"', "[1 2]", "[1,]", "[1, 2", "[{\"a\": 1}", "[1] 2", "[1]]",
+                                  "[1, -]", "[tru]"])
+def test_iter_json_array_rejects_invalid_text(text):
+    for chunks in split_at_every_offset(text):
+        with pytest.raises(ValueError):
+            list(iter_json_array(chunks))
+
+
+def test_iter_json_array_decodes_lazily():
+    def chunks():
+        yield '[{"a": 1}, '
+        yield '{"a": 2}, '
+        raise AssertionError("read too far")
+
+    elements = iter_json_array(chunks())
+    assert next(elements) == {"a": 1}
+
+
+def test_json_columns_rejects_non_objects():
+    with pytest.raises(ValueError):
+        json_columns(iter_json_array(["[1, 2]"]))
+
+
+def test_json_columns_of_empty_array():
+    assert json_columns(iter_json_array(["[]"])) == {}
+
+
+def test_read_and_tee_chunks():
+    text = RECORDS[0]
+    copy = io.StringIO()
+    chunks = list(tee_chunks(read_chunks(io.StringIO(text), size=10), copy))
+    assert all(len(chunk) <= 10 for chunk in chunks)
+    assert "".join(chunks) == text
+    assert copy.getvalue() == text
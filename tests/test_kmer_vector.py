@@ -0,0 +1,120 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from app.kmer import kmer_count
+from app.kmer_vector import (ALPHABET, REDUCED_ALPHABETS, KmerFeatures, kmer_column_index, kmer_columns,
+                             kmer_count_sparse, kmer_count_vector, kmer_dict_to_sparse, kmer_length_offsets)
+
+SEQUENCES = [
+    "",
+    "A",
+    "MKV",
+    "XXXXX",
+    "MKVLAAGIXXWYACDEFGHIKLMNPQRSTVWY",
+    "ACACACACAC",
+    # Non-standard residues: selenocysteine, pyrrolysine, ambiguous codes, gaps, stops, lowercase and non-ASCII
+    "MUOKBZJ-*avlé",
+]
+
+
+def random_sequences(count, seed):
+    generator = random.Random(seed)
+    letters = ALPHABET + ["B", "Z", "U", "O", "*"]
+    return ["".join(generator.choice(letters) for _ in range(generator.randint(1, 60))) for _ in range(count)]
+
+
+def as_standard(sequence):
+    """
+    The sequence with the residues outside the alphabet replaced by 'X', as the vectorized counting reads it.
+    """
+    return "".join(residue if residue in ALPHABET else "X" for residue in sequence)
+
+
+def reference_vector(k, sequence):
+    """
+    The counts of the baseline kmer_count, placed in the columns of kmer_columns.
+    """
+    columns = {column: index for index, column in enumerate(kmer_columns(k))}
+    vector = np.zeros(len(columns), dtype=np.int64)
+    for kmer, count in kmer_count(k, sequence).items():
+        vector[columns[kmer]] += count
+    return vector
+
+
+@pytest.mark.parametrize("k", [1, 2, 3])
+@pytest.mark.parametrize("sequence", SEQUENCES + random_sequences(20, 0))
+def test_count_vector_matches_kmer_count(k, sequence):
+    expected = reference_vector(k, as_standard(sequence))
+    vector = KmerFeatures(k).count_vector(sequence)
+    np.testing.assert_array_equal(vector, expected)
+    np.testing.assert_array_equal(kmer_count_vector(k, sequence), expected)
+    indices, counts = kmer_count_sparse(k, sequence)
+    np.testing.assert_array_equal(indices, np.flatnonzero(expected))
+    np.testing.assert_array_equal(counts, expected[indices])
+
+
+@pytest.mark.parametrize("k", [1, 2, 3])
+@pytest.mark.parametrize("sequence", SEQUENCES[1:] + random_sequences(20, 1))
+def test_dict_to_sparse_matches_count_sparse(k, sequence):
+    indices, counts = kmer_dict_to_sparse(kmer_count(k, as_standard(sequence)))
+    expected_indices, expected_counts = kmer_count_sparse(k, sequence)
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_array_equal(counts, expected_counts)
+
+
+@pytest.mark.parametrize("sequence", [None, math.nan, 5, ""])
+def test_missing_sequences_have_no_kmers(sequence):
+    assert kmer_count(3, sequence) == {}
+    assert not kmer_count_vector(3, sequence).any()
+    assert len(kmer_count_sparse(3, sequence)[0]) == 0
+
+
+@pytest.mark.parametrize("alphabet", list(REDUCED_ALPHABETS))
+@pytest.mark.parametrize("k", [1, 2, 3])
+def test_reduced_alphabet_matches_kmer_count_of_mapped_sequence(alphabet, k):
+    features = KmerFeatures(k, alphabet)
+    groups = {residue: group[0] for group in REDUCED_ALPHABETS[alphabet] for residue in group}
+    columns = {column: index for index, column in enumerate(features.columns())}
+    assert len(columns) == features.columns_count()
+    for sequence in SEQUENCES + random_sequences(10, 2):
+        mapped = "".join(groups.get(residue, "X") for residue in sequence)
+        expected = np.zeros(features.columns_count(), dtype=np.int64)
+        for kmer, count in kmer_count(k, mapped).items():
+            expected[columns[kmer]] += count
+        np.testing.assert_array_equal(features.count_vector(sequence), expected)
+
+
+@pytest.mark.parametrize("k", [2, 3])
+def test_hashed_counts_sum_the_kmers_of_a_bucket(k):
+    features = KmerFeatures(k, hash_width=50)
+    assert features.hashed == [False] + [True] * (k - 1)
+    for sequence in SEQUENCES + random_sequences(10, 3):
+        vector = features.count_vector(sequence)
+        expected = np.zeros(features.columns_count(), dtype=np.int64)
+        for kmer, count in kmer_count(k, as_standard(sequence)).items():
+            expected[features.column_index(kmer)] += count
+        np.testing.assert_array_equal(vector, expected)
+        # Every kmer is counted once, whatever its bucket
+        assert vector.sum() == sum(kmer_count(k, sequence).values())
+
+
+def test_restricted_features_keep_the_vocabulary_columns():
+    features = KmerFeatures(2)
+    vocabulary = [0, 5, 20, 21, 100, 461]
+    restricted = features.restrict(vocabulary)
+    assert list(restricted.columns()) == [list(features.columns())[index] for index in vocabulary]
+    for sequence in SEQUENCES + random_sequences(10, 4):
+        np.testing.assert_array_equal(restricted.count_vector(sequence), features.count_vector(sequence)[vocabulary])
+
+
+def test_column_index_and_offsets():
+    columns = list(kmer_columns(3))
+    assert [kmer_column_index(column) for column in columns[:50] + columns[-50:]] == \
+           list(range(50)) + list(range(len(columns) - 50, len(columns)))
+    assert kmer_length_offsets(3) == [0, 21, 21 + 21 ** 2, 21 + 21 ** 2 + 21 ** 3]
+    # The offsets are a copy, the features are shared
+    kmer_length_offsets(3).append(0)
+    assert kmer_length_offsets(3) == [0, 21, 21 + 21 ** 2, 21 + 21 ** 2 + 21 ** 3]
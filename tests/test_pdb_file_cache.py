@@ -0,0 +1,112 @@
+import gzip
+import os
+import random
+import time
+
+import pytest
+
+from app.PdbFileCache import PdbFileCache
+
+
+def random_text(seed, length=4000):
+    generator = random.Random(seed)
+    # Random letters compress to about the same size for every seed
+    return "".join(generator.choice("ACDEFGHIKLMNPQRSTVWY") for _ in range(length))
+
+
+def set_age(path, seconds):
+    modified = time.time() - seconds
+    os.utime(path, (modified, modified))
+
+
+def cache_files(cache):
+    return sorted(name for _, _, names in os.walk(cache.cache_dir) for name in names)
+
+
+def test_put_and_get(tmp_path):
+    cache = PdbFileCache(str(tmp_path / "pdb"))
+    assert cache.get("1abc", "pdb") == (False, None)
+    cache.put("1ABC", "pdb", "HEADER 1ABC\n")
+    assert cache.get("1abc", "pdb") == (True, "HEADER 1ABC\n")
+    assert cache.get("1abc", "cif") == (False, None)
+    assert os.path.exists(tmp_path / "pdb" / "ab" / "1abc.pdb.gz")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"]) == (1, 2, 1)
+    assert stats["bytes"] == os.path.getsize(tmp_path / "pdb" / "ab" / "1abc.pdb.gz")
+    # A cache opened on the same directory finds the files and their size
+    assert PdbFileCache(str(tmp_path / "pdb")).stats()["bytes"] == stats["bytes"]
+
+
+def test_put_replaces_a_file(tmp_path):
+    cache = PdbFileCache(str(tmp_path))
+    cache.put("1abc", "pdb", random_text(0))
+    cache.put("1abc", "pdb", "HEADER\n")
+    assert cache.get("1abc", "pdb") == (True, "HEADER\n")
+    assert cache.stats()["bytes"] == os.path.getsize(tmp_path / "ab" / "1abc.pdb.gz")
+    assert cache_files(cache) == ["1abc.pdb.gz"]
+
+
+def test_failed_put_leaves_no_partial_file(tmp_path, monkeypatch):
+    cache = PdbFileCache(str(tmp_path))
+    cache.put("1abc", "pdb", "HEADER\n")
+
+    def interrupted_replace(source, destination):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(os, "replace", interrupted_replace)
+    with pytest.raises(KeyboardInterrupt):
+        cache.put("1abc", "pdb", random_text(0))
+    monkeypatch.undo()
+    assert cache.get("1abc", "pdb") == (True, "HEADER\n")
+    assert cache_files(cache) == ["1abc.pdb.gz"]
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    size = len(gzip.compress(random_text(0).encode(), compresslevel=6))
+    cache = PdbFileCache(str(tmp_path), max_bytes=int(3.5 * size))
+    for seed, pdb_id in enumerate(["1aaa", "1bbb", "1ccc"]):
+        cache.put(pdb_id, "pdb", random_text(seed))
+    for age, pdb_id in [(300, "1aaa"), (200, "1bbb"), (100, "1ccc")]:
+        set_age(cache._path(pdb_id, "pdb"), age)
+    # Reading a file makes it the most recently used
+    assert cache.get("1aaa", "pdb") == (True, random_text(0))
+    cache.put("1ddd", "pdb", random_text(3))
+    assert cache_files(cache) == ["1aaa.pdb.gz", "1ccc.pdb.gz", "1ddd.pdb.gz"]
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= 0.9 * cache.max_bytes
+    assert cache.get("1bbb", "pdb") == (False, None)
+
+
+def test_invalid_max_bytes(tmp_path):
+    with pytest.raises(ValueError):
+        PdbFileCache(str(tmp_path), max_bytes=0)
+
+
+def test_missing_markers_expire(tmp_path):
+    cache = PdbFileCache(str(tmp_path), missing_ttl=3600)
+    cache.put("1abc", "pdb", None)
+    assert cache.get("1abc", "pdb") == (True, None)
+    marker = cache._path("1abc", "pdb") + ".missing"
+    set_age(marker, 3500)
+    assert cache.get("1abc", "pdb") == (True, None)
+    # Reading the marker does not make it younger
+    assert time.time() - os.path.getmtime(marker) > 3400
+    set_age(marker, 3700)
+    assert cache.get("1abc", "pdb") == (False, None)
+    # The structure has been released since
+    cache.put("1abc", "pdb", "HEADER\n")
+    assert cache.get("1abc", "pdb") == (True, "HEADER\n")
+    assert cache_files(cache) == ["1abc.pdb.gz"]
+
+
+@pytest.mark.parametrize("content", [b"not gzip", gzip.compress(b"HEADER 1ABC\n" * 100)[:40], b""])
+def test_corrupt_files_are_misses(tmp_path, content):
+    cache = PdbFileCache(str(tmp_path))
+    cache.put("1abc", "pdb", "HEADER\n")
+    with open(cache._path("1abc", "pdb"), "wb") as file:
+        file.write(content)
+    assert cache.get("1abc", "pdb") == (False, None)
+    # The file downloaded again replaces the corrupt one
+    cache.put("1abc", "pdb", "HEADER\n")
+    assert cache.get("1abc", "pdb") == (True, "HEADER\n")
@@ -0,0 +1,78 @@
+import json
+import os
+import random
+
+import pandas as pd
+import pytest
+
+from app.json_stream import iter_json_array, json_columns
+from app.repeats import regions_from_json
+from tests import legacy_repeats
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("regions, frozen", [(True, "repeatsdb_regions.csv"), (False, "repeatsdb_units.csv")])
+def test_regions_from_json_matches_frozen_output(regions, frozen):
+    """
+    The output of the iterrows and concat implementation on the fixture, with its index, is frozen in the csv.
+    """
+    df = regions_from_json(json.loads(read_fixture("repeatsdb_search.json")), regions)
+    assert df.to_csv() == read_fixture(frozen)
+
+
+@pytest.mark.parametrize("regions, frozen", [(True, "repeatsdb_regions.csv"), (False, "repeatsdb_units.csv")])
+def test_regions_from_streamed_columns_matches_frozen_output(regions, frozen):
+    text = read_fixture("repeatsdb_search.json")
+    chunks = [text[i:i + 100] for i in range(0, len(text), 100)]
+    df = regions_from_json(json_columns(iter_json_array(chunks)), regions)
+    assert df.to_csv() == read_fixture(frozen)
+
+
+def test_regions_with_errors_are_dropped():
+    df = regions_from_json(json.loads(read_fixture("repeatsdb_search.json")), False)
+    # 2bnhA has a unit with start > end, the units of 1n0rA do not span the bounds of its region_id
+    assert not df["region_id"].str.startswith(("2bnhA", "1n0rA")).any()
+
+
+def random_response(regions_count, seed):
+    generator = random.Random(seed)
+    entries = []
+    for _ in range(regions_count):
+        repeatsdb_id = f"{generator.randint(1, 9)}{generator.choice('abcd')}{generator.randint(10, 99)}" \
+                       f"{generator.choice('AB')}"
+        start = generator.randint(-5, 300)
+        units = []
+        position = start
+        for _ in range(generator.randint(1, 5)):
+            length = generator.randint(5, 40)
+            units.append([position, position + length])
+            position += length + 1
+        end = units[-1][1]
+        if generator.random() < 0.1:
+            units[generator.randrange(len(units))].reverse()
+        if generator.random() < 0.1:
+            end += generator.choice([-1, 1])
+        for unit_start, unit_end in units:
+            entries.append({"repeatsdb_id": repeatsdb_id, "region_id": f"{repeatsdb_id}_{start}_{end}",
+                            "pdb_id": repeatsdb_id[:4], "pdb_chain": repeatsdb_id[4], "start": unit_start,
+                            "end": unit_end, "type": generator.choice(["unit", "unit", "insertion"]),
+                            "class": "3", "topology": "3.3", "fold": "3.3.1", "clan": "3.3.1.1",
+                            "region_units_num": str(len(units)), "region_average_unit_length": "20.5",
+                            "reviewed": True, "annotator": "curator", "origin": "Manual"})
+    return entries
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("regions", [True, False])
+def test_regions_from_json_matches_legacy_implementation(seed, regions):
+    response = random_response(50, seed)
+    expected = legacy_repeats.regions_from_json(response, regions)
+    df = regions_from_json(response, regions)
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    assert df.to_csv() == expected.to_csv()
@@ -0,0 +1,80 @@
+import os
+import time
+
+import pytest
+
+from app.ResponseCache import ResponseCache
+
+KEY = "class=3&reviewed=true"
+
+
+def store(cache, key, text):
+    with cache.store(key) as file:
+        file.write(text)
+
+
+def read(cache, key):
+    file = cache.open(key)
+    if file is None:
+        return None
+    with file:
+        return file.read()
+
+
+def test_store_and_open(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    assert read(cache, KEY) is None
+    store(cache, KEY, '[{"region_id": "1a4yA_2_100", "clan": "é"}]')
+    assert read(cache, KEY) == '[{"region_id": "1a4yA_2_100", "clan": "é"}]'
+    assert read(cache, "class=4") is None
+    assert cache.stats() == {"hits": 1, "misses": 2}
+    assert os.listdir(cache.cache_dir) == [os.path.basename(cache._path(KEY))]
+
+
+def test_responses_expire(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    store(cache, KEY, "[]")
+    path = cache._path(KEY)
+    modified = time.time() - 59
+    os.utime(path, (modified, modified))
+    assert read(cache, KEY) == "[]"
+    modified = time.time() - 61
+    os.utime(path, (modified, modified))
+    assert read(cache, KEY) is None
+    # A response downloaded again replaces the expired one
+    store(cache, KEY, "[1]")
+    assert read(cache, KEY) == "[1]"
+
+
+def test_invalid_ttl(tmp_path):
+    with pytest.raises(ValueError):
+        ResponseCache(str(tmp_path), ttl=0)
+
+
+def test_response_is_not_read_while_stored(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    store(cache, KEY, "[1]")
+    with cache.store(KEY) as file:
+        file.write("[1, 2")
+        # The previous response stays in place until the new one is complete
+        assert read(cache, KEY) == "[1]"
+        file.write("]")
+    assert read(cache, KEY) == "[1, 2]"
+
+
+def test_response_is_discarded_on_error(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with cache.store(KEY) as file:
+            file.write("[1, 2")
+            raise RuntimeError("download interrupted")
+    assert read(cache, KEY) is None
+    # No temporary file is left behind
+    assert os.listdir(tmp_path) == []
+    store(cache, KEY, "[1]")
+    with pytest.raises(RuntimeError):
+        with cache.store(KEY) as file:
+            file.write("[2")
+            raise RuntimeError("download interrupted")
+    assert read(cache, KEY) == "[1]"
+    assert len(os.listdir(tmp_path)) == 1
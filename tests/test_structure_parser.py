@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from app import protein_sequences
+from app.protein_sequences import StructureIndex, get_sequence_from_structure, index_structure, parse_structure
+from app.structure_check import list_structure_files, read_structure_file, structure_file_type
+from app.structure_parser import scan_mmcif_residues, scan_pdb_residues
+
+STRUCTURES = os.path.join(os.path.dirname(__file__), "fixtures", "structures")
+MALFORMED = os.path.join(STRUCTURES, "malformed")
+
+# The structures the scanners read as BioPython does: REMARK 465 records, insertion codes, alternate locations,
+# hetero residues such as MSE, ligands and waters, several models, and mmCIF files with _pdbx_poly_seq_scheme
+CORPUS = [path for path in list_structure_files([STRUCTURES]) if os.path.dirname(path) == STRUCTURES]
+# The structures the scanners leave to BioPython: a point mutation and a text field in the _atom_site loop
+FALLBACK = list_structure_files([MALFORMED])
+
+
+def read(path):
+    return os.path.basename(path).split(".")[0], structure_file_type(path), read_structure_file(path)
+
+
+def scan(file_type, text):
+    if file_type == 'cif':
+        return StructureIndex(scan_mmcif_residues(text))
+    return StructureIndex(*scan_pdb_residues(text))
+
+
+@pytest.fixture
+def biopython_calls(monkeypatch):
+    """
+    The calls of index_structure to BioPython.
+    """
+    calls = []
+
+    def counted_parse_structure(pdb_id, file_type, text):
+        calls.append(pdb_id)
+        return parse_structure(pdb_id, file_type, text)
+
+    monkeypatch.setattr(protein_sequences, "parse_structure", counted_parse_structure)
+    return calls
+
+
+def test_corpus():
+    assert len(CORPUS) == 4
+    assert len(FALLBACK) == 2
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=os.path.basename)
+def test_index_structure_matches_biopython(path, biopython_calls):
+    pdb_id, file_type, text = read(path)
+    index = index_structure(pdb_id, file_type, text)
+    # The scanners read the file, BioPython is not used
+    assert biopython_calls == []
+    reference = StructureIndex.from_structure(parse_structure(pdb_id, file_type, text), file_type)
+    assert index.describe() == reference.describe()
+    assert index.describe()
+    assert index.differences(reference) == []
+    index_structure(pdb_id, file_type, text, cross_check=True)
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=os.path.basename)
+def test_index_sequences_match_biopython(path):
+    pdb_id, file_type, text = read(path)
+    index = index_structure(pdb_id, file_type, text)
+    structure = parse_structure(pdb_id, file_type, text)
+    for chain in structure[0]:
+        for start in range(-2, 15):
+            for end in range(start, 15):
+                assert index.sequence(chain.id, start, end) == \
+                       get_sequence_from_structure(structure, file_type, chain.id, start, end), (chain.id, start, end)
+
+
+def test_missing_residues_are_read():
+    pdb_id, file_type, text = read(os.path.join(STRUCTURES, "1rem.pdb"))
+    description = index_structure(pdb_id, file_type, text).describe()
+    assert description["missing chain A"] == ([1, 2, 10, 10, 13], ['M', 'G', 'S', 'N', 'K'])
+    # The insertion codes and the MSE of the chain, the missing residues in the gaps
+    assert index_structure(pdb_id, file_type, text).sequence("A", 1, 13) == "MGALGSTVXKESNDIK"
+
+
+@pytest.mark.parametrize("path", FALLBACK, ids=os.path.basename)
+def test_index_structure_falls_back_to_biopython(path, biopython_calls):
+    pdb_id, file_type, text = read(path)
+    with pytest.raises(ValueError):
+        scan(file_type, text)
+    index = index_structure(pdb_id, file_type, text)
+    assert biopython_calls == [pdb_id]
+    reference = StructureIndex.from_structure(parse_structure(pdb_id, file_type, text), file_type)
+    assert index.describe() == reference.describe()
+
+
+def test_cross_check_reports_differences(monkeypatch):
+    pdb_id, file_type, text = read(os.path.join(STRUCTURES, "1rem.pdb"))
+    models, missing_residues = scan_pdb_residues(text)
+    monkeypatch.setattr(protein_sequences, "scan_pdb_residues", lambda text: (models, missing_residues[1:]))
+    with pytest.raises(ValueError, match="missing chain A"):
+        index_structure(pdb_id, file_type, text, cross_check=True)